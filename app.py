@@ -1,23 +1,80 @@
 # app_simple_fixed.py - Fixed Flask Admin Setup with Working Manual Sales
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, send_from_directory, has_request_context
+from markupsafe import Markup
 from flask_sqlalchemy import SQLAlchemy
 from flask_admin import Admin
 from flask_admin.contrib.sqla import ModelView
 from flask_admin.base import BaseView, expose
+from flask_admin.form.upload import FileUploadField
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
 from werkzeug.utils import secure_filename
-from datetime import datetime, timedelta
-from wtforms.validators import DataRequired, Email
+from array import array
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from wtforms import StringField
+from wtforms.validators import DataRequired, Email, ValidationError
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError, OperationalError
+import base64
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import mimetypes
 import os
+import re
 import secrets
+import threading
+import time
+import zlib
+
+from build_assets import ASSET_BUILD_DIR, ASSET_MANIFEST, build_assets
+
+try:
+    import brotli
+except ImportError:  # Optional: without it responses fall back to gzip
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: the order journal assumes a single process there
+    fcntl = None
+
+try:
+    from PIL import Image, ImageFilter, ImageOps
+except ImportError:  # Optional: without Pillow product images are served as uploaded
+    Image = None
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'kaboy_agrovet.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'kaboy_agrovet.db'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['FLASK_ADMIN_CUSTOM_CSS'] = 'static/css/flask_admin_custom.css'
+# Bodies smaller than this are sent uncompressed; the headers would eat most of the saving
+app.config['COMPRESS_MIN_SIZE'] = 500
+app.config['COMPRESS_GZIP_LEVEL'] = 6
+app.config['COMPRESS_BROTLI_QUALITY'] = 4
+# How long a stored Idempotency-Key response is replayed to retries
+app.config['IDEMPOTENCY_KEY_TTL'] = timedelta(hours=24)
+# 'journal' acknowledges checkouts from an append-only file and writes them to the
+# database in batches (for flash-sale bursts); 'direct' writes each order in its request
+app.config['ORDER_INTAKE_MODE'] = os.environ.get('ORDER_INTAKE_MODE', 'direct')
+app.config['ORDER_INTAKE_JOURNAL'] = os.path.join(app.instance_path, 'order-intake.jsonl')
+app.config['ORDER_INTAKE_BATCH_SIZE'] = 100
+# How long adding to cart holds stock for that cart; every cart update renews it
+app.config['STOCK_HOLD_TTL'] = timedelta(minutes=15)
+# Most units of one variant, and most units overall, that a single cart can hold
+app.config['STOCK_HOLD_MAX_LINE_QUANTITY'] = 50
+app.config['STOCK_HOLD_MAX_CART_QUANTITY'] = 200
+# How far catalog 'available' figures may lag behind cart holds; the hold response is always current
+app.config['STOCK_HOLD_CATALOG_DELAY'] = timedelta(seconds=30)
 
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -27,6 +84,12 @@ CORS(app)
 
 # --- MODELS ---
 class Product(db.Model):
+    __table_args__ = (
+        # Keyset pagination walks the catalog in (name, id) order
+        db.Index('ix_product_name_id', 'name', 'id'),
+        db.Index('ix_product_category_name_id', 'category', 'name', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(200), nullable=False)
     category = db.Column(db.String(50), nullable=False)
@@ -38,21 +101,33 @@ class Product(db.Model):
     def __repr__(self):
         return f'<Product {self.id} {self.name}>'
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'category': self.category,
-            'description': self.description,
-            'image_url': self.image_url,
-            'variants': [variant.to_dict() for variant in self.variants]
-        }
+    # Columns to_dict() copies as-is; 'variants' and the image keys are derived
+    serialized_columns = ('id', 'name', 'category', 'description', 'image_url')
+    # Resized renditions of image_url (see IMAGE RENDITIONS below); None until rendered
+    image_fields = ('srcset', 'srcset_webp', 'placeholder')
+
+    def to_dict(self, fields=None, variant_fields=None):
+        # With `fields`, only those keys are read, so unloaded columns stay unloaded
+        data = {name: getattr(self, name) for name in self.serialized_columns if fields is None or name in fields}
+        if fields is None or 'srcset' in fields:
+            data['srcset'] = image_renditions.srcset(self.image_url, 'jpg')
+        if fields is None or 'srcset_webp' in fields:
+            data['srcset_webp'] = image_renditions.srcset(self.image_url, 'webp')
+        if fields is None or 'placeholder' in fields:
+            data['placeholder'] = image_renditions.placeholder(self.image_url)
+        if fields is None or 'variants' in fields:
+            data['variants'] = [variant.to_dict(product=self, fields=variant_fields) for variant in self.variants]
+        return data
     
     @property
     def variants_count(self):
         return len(self.variants)
 
 class ProductVariant(db.Model):
+    __table_args__ = (
+        db.Index('ix_product_variant_product_id_id', 'product_id', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     product = db.relationship('Product', back_populates='variants')
@@ -69,17 +144,28 @@ class ProductVariant(db.Model):
         product_name = self.product.name if self.product else "N/A"
         return f'<Variant {self.quantity_value}{self.quantity_unit} of {product_name} (Stock: {self.stock_level})>'
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'product_name': self.product.name if self.product else "N/A",
-            'quantity_value': self.quantity_value,
-            'quantity_unit': self.quantity_unit,
-            'selling_price': self.selling_price,
-            'stock_level': self.stock_level,
-            'expiry_date': self.expiry_date.isoformat() if self.expiry_date else None,
-            'supplier': self.supplier
-        }
+    # Columns to_dict() copies as-is; 'product_name' and 'expiry_date' are derived
+    serialized_columns = ('id', 'quantity_value', 'quantity_unit', 'selling_price', 'stock_level', 'supplier')
+
+    def to_dict(self, product=None, fields=None):
+        # Callers serializing a whole product pass it in so the variant never lazy-loads its parent.
+        # With `fields`, only those keys are read, so unloaded columns stay unloaded
+        data = {name: getattr(self, name) for name in self.serialized_columns if fields is None or name in fields}
+        if fields is None or 'product_name' in fields:
+            product = product or self.product
+            data['product_name'] = product.name if product else "N/A"
+        if fields is None or 'expiry_date' in fields:
+            data['expiry_date'] = self.expiry_date.isoformat() if self.expiry_date else None
+        return data
+
+class VariantCode(db.Model):
+    # A SKU or barcode on a variant; a variant may carry several (see BARCODE LOOKUP below)
+    code = db.Column(db.String(64), primary_key=True)
+    product_variant_id = db.Column(db.Integer, db.ForeignKey('product_variant.id'), nullable=False, index=True)
+    variant = db.relationship('ProductVariant', backref=db.backref('codes', lazy=True, cascade='all, delete-orphan'))
+
+    def __repr__(self):
+        return f'<VariantCode {self.code} -> {self.product_variant_id}>'
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -144,6 +230,15 @@ class OfflineSale(db.Model):
     def items_count(self):
         return len(self.items_sold)
 
+class OfflineSaleSync(db.Model):
+    """Client-made id of a POS sale, so a sale an offline till sends more than once is recorded once"""
+    client_sale_id = db.Column(db.String(64), primary_key=True)
+    offline_sale_id = db.Column(db.Integer, db.ForeignKey('offline_sale.id'), nullable=False)
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<OfflineSaleSync {self.client_sale_id} -> {self.offline_sale_id}>'
+
 class OfflineSaleItem(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     offline_sale_id = db.Column(db.Integer, db.ForeignKey('offline_sale.id'), nullable=False)
@@ -215,6 +310,142 @@ class ContactMessage(db.Model):
     def __repr__(self):
         return f'<ContactMessage {self.id} from {self.name}>'
 
+class CatalogFacet(db.Model):
+    # Running count of products per category and variants per supplier,
+    # maintained on every write (see CATALOG FACETS below)
+    facet = db.Column(db.String(20), primary_key=True)
+    value = db.Column(db.String(100), primary_key=True)
+    item_count = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<CatalogFacet {self.facet}={self.value}: {self.item_count}>'
+
+class CatalogChange(db.Model):
+    # Latest change to each product and variant row, numbered in write order
+    # for the POS delta feed (see CATALOG CHANGE FEED below)
+    __table_args__ = (
+        db.Index('ix_catalog_change_entity', 'entity', 'entity_id'),
+        # Never hand out a sequence number twice, even after the newest entry is replaced
+        {'sqlite_autoincrement': True},
+    )
+
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    entity = db.Column(db.String(10), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(db.Boolean, default=False, nullable=False)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<CatalogChange {self.seq} {self.entity} {self.entity_id}>'
+
+class DataVersion(db.Model):
+    # Counters every app process can read to tell whether data it keeps in
+    # memory changed in another process (see SHARED DATA VERSIONS below)
+    name = db.Column(db.String(30), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<DataVersion {self.name}: {self.version}>'
+
+class IdempotencyKey(db.Model):
+    """Outcome of a POST sent with an Idempotency-Key header, replayed to retries of it"""
+    __table_args__ = (
+        db.Index('ix_idempotency_key_expires_at', 'expires_at'),
+    )
+    scope = db.Column(db.String(40), primary_key=True)
+    key = db.Column(db.String(100), primary_key=True)
+    # sha256 of the request body, so a key reused for a different request is caught
+    request_hash = db.Column(db.LargeBinary(32), nullable=False)
+    # NULL while the first request is still being processed
+    status_code = db.Column(db.Integer)
+    content_type = db.Column(db.String(100))
+    response_body = db.Column(db.LargeBinary)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.scope}:{self.key} -> {self.status_code}>'
+
+class StockHold(db.Model):
+    """Stock set aside for a shopping cart until `expires_at`"""
+    __table_args__ = (
+        db.UniqueConstraint('cart_id', 'product_variant_id', name='uq_stock_hold_cart_variant'),
+        # Covers the held-quantity sum per variant without touching the table
+        db.Index('ix_stock_hold_variant_expires', 'product_variant_id', 'expires_at', 'quantity'),
+        # The expiry sweep deletes from the front of this index
+        db.Index('ix_stock_hold_expires_at', 'expires_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # Random token the storefront keeps in localStorage
+    cart_id = db.Column(db.String(64), nullable=False)
+    product_variant_id = db.Column(db.Integer, db.ForeignKey('product_variant.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<StockHold {self.quantity} of variant {self.product_variant_id} for cart {self.cart_id}>'
+
+class OrderIntake(db.Model):
+    """Outcome of a journaled checkout, keyed by the provisional reference the customer was given"""
+    reference = db.Column(db.String(20), primary_key=True)
+    status = db.Column(db.String(20), nullable=False)  # 'confirmed', 'rejected' or 'failed'
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'))
+    # JSON list of stock shortages when rejected, or of the error when failed
+    errors = db.Column(db.Text)
+    received_at = db.Column(db.DateTime, nullable=False)
+    processed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<OrderIntake {self.reference} {self.status} -> {self.order_id}>'
+
+class TillSession(db.Model):
+    """One till from opening to its end-of-day close; the Z-report is frozen into it on close"""
+    __table_args__ = (
+        db.Index('ix_till_session_till_closed_at', 'till', 'closed_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    till = db.Column(db.String(50), nullable=False)
+    opening_float = db.Column(db.Float, default=0.0, nullable=False)
+    opened_by = db.Column(db.String(50))
+    opened_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    closed_by = db.Column(db.String(50))
+    closed_at = db.Column(db.DateTime)
+    # JSON Z-report, written once when the session closes
+    z_report = db.Column(db.Text)
+
+    def __repr__(self):
+        return f'<TillSession {self.id} {self.till} {"closed" if self.closed_at else "open"}>'
+
+class TillTotal(db.Model):
+    # Running totals of an open till session per cashier and payment mode,
+    # kept in the same transaction as each sale (see TILL SESSIONS below)
+    till_session_id = db.Column(db.Integer, db.ForeignKey('till_session.id'), primary_key=True)
+    cashier = db.Column(db.String(50), primary_key=True)
+    payment_mode = db.Column(db.String(50), primary_key=True)
+    sale_count = db.Column(db.Integer, default=0, nullable=False)
+    total_cost = db.Column(db.Float, default=0.0, nullable=False)
+    amount_paid = db.Column(db.Float, default=0.0, nullable=False)
+    change_given = db.Column(db.Float, default=0.0, nullable=False)
+
+    def __repr__(self):
+        return f'<TillTotal {self.till_session_id} {self.cashier}/{self.payment_mode}: {self.sale_count}>'
+
+class DailySalesSummary(db.Model):
+    # Sales per day, channel ('online' orders or 'offline' POS sales) and variant,
+    # kept up to date with every sale (see DAILY SALES ROLLUP below)
+    day = db.Column(db.Date, primary_key=True)
+    channel = db.Column(db.String(10), primary_key=True)
+    product_variant_id = db.Column(db.Integer, primary_key=True)
+    revenue = db.Column(db.Float, default=0.0, nullable=False)
+    units = db.Column(db.Integer, default=0, nullable=False)
+    # At the variant's buying price when the sale was recorded
+    cost = db.Column(db.Float, default=0.0, nullable=False)
+    # Orders (or POS sales) with this variant in them
+    order_count = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<DailySalesSummary {self.day} {self.channel} {self.product_variant_id}: {self.revenue}>'
+
 # --- ADMIN VIEWS ---
 class MyAdminModelView(ModelView):
     def is_accessible(self):
@@ -223,6 +454,35 @@ class MyAdminModelView(ModelView):
     def inaccessible_callback(self, name, **kwargs):
         return redirect(url_for('admin_login'))
 
+    # FTS5 table backing the list view search box (see FULL-TEXT SEARCH below)
+    fts_table = None
+    # Snapshot cache (see snapshot_caches below) whose public API reads this model
+    invalidates_cache = None
+
+    # Both run before the admin commits, so the bump lands with the change
+    def on_model_change(self, form, model, is_created):
+        super().on_model_change(form, model, is_created)
+        if self.invalidates_cache:
+            snapshot_caches[self.invalidates_cache].bump()
+
+    def on_model_delete(self, model):
+        super().on_model_delete(model)
+        if self.invalidates_cache:
+            snapshot_caches[self.invalidates_cache].bump()
+
+    def _apply_search(self, query, count_query, joins, count_joins, search):
+        match = fts_match_expression(search)
+        if not self.fts_table or not match or not search_index_available():
+            return super()._apply_search(query, count_query, joins, count_joins, search)
+
+        matching_ids = db.text(
+            f"SELECT rowid FROM {self.fts_table} WHERE {self.fts_table} MATCH :match"
+        ).bindparams(match=match).columns(id=db.Integer)
+        query = query.filter(self.model.id.in_(matching_ids))
+        if count_query is not None:
+            count_query = count_query.filter(self.model.id.in_(matching_ids))
+        return query, count_query, joins, count_joins
+
 class ProductAdminView(MyAdminModelView):
     column_list = ['name', 'category', 'description', 'image_url']
     column_labels = {
@@ -231,9 +491,31 @@ class ProductAdminView(MyAdminModelView):
         'description': 'Description',
         'image_url': 'Image'
     }
-    form_columns = ['name', 'category', 'description', 'image_url']
+    form_columns = ['name', 'category', 'description', 'image_url', 'image_file']
     column_searchable_list = ['name', 'category', 'description']
     column_filters = ['category', 'created_at']
+    fts_table = 'product_fts'
+    invalidates_cache = 'catalog'
+    
+    form_extra_fields = {
+        'image_file': FileUploadField(
+            'Upload Image',
+            base_path=os.path.join(app.static_folder, 'uploads'),
+            allowed_extensions=('jpg', 'jpeg', 'png', 'webp', 'gif'),
+            namegen=lambda obj, file_data: content_hash_filename(obj, file_data)
+        )
+    }
+    
+    def on_model_change(self, form, model, is_created):
+        super().on_model_change(form, model, is_created)
+        # FileUploadField stores the saved file name on the model
+        uploaded = model.__dict__.get('image_file')
+        if isinstance(uploaded, str):
+            model.image_url = f"{app.static_url_path}/uploads/{uploaded}"
+    
+    def after_model_change(self, form, model, is_created):
+        super().after_model_change(form, model, is_created)
+        image_renditions.queue(model.image_url)
     
     form_choices = {
         'category': [
@@ -282,6 +564,8 @@ class ProductVariantAdminView(MyAdminModelView):
     form_columns = ['product_id', 'quantity_value', 'quantity_unit', 'selling_price', 'buying_price', 'stock_level', 'expiry_date', 'supplier']
     column_searchable_list = ['supplier']
     column_filters = ['stock_level', 'expiry_date', 'supplier']
+    fts_table = 'variant_fts'
+    invalidates_cache = 'catalog'
     
     # Disable Select2Widget to avoid choice format issues
     form_widget_args = {
@@ -289,10 +573,23 @@ class ProductVariantAdminView(MyAdminModelView):
         'quantity_unit': {'class': 'form-control'}
     }
     
+    form_extra_fields = {
+        'barcodes': StringField('Barcodes / SKUs', description='Separate several codes with commas')
+    }
+
     def on_model_change(self, form, model, is_created):
         """Handle model changes"""
         super().on_model_change(form, model, is_created)
-    
+        codes = parse_variant_codes(form.barcodes.data)
+        taken = db.session.query(VariantCode.code).filter(
+            VariantCode.code.in_(codes), VariantCode.product_variant_id != model.id
+        ).all() if codes else []
+        if taken:
+            raise ValidationError(f"Already used by another variant: {', '.join(code for code, in taken)}")
+        # Keep the rows of codes that stay, so the flush does not delete and re-insert the same key
+        existing = {variant_code.code: variant_code for variant_code in model.codes}
+        model.codes = [existing.get(code) or VariantCode(code=code) for code in codes]
+
 
     
     form_choices = {
@@ -331,6 +628,9 @@ class ProductVariantAdminView(MyAdminModelView):
     def on_form_prefill(self, form, id):
         """Ensure choices are populated when editing"""
         super().on_form_prefill(form, id)
+        form.barcodes.data = ', '.join(
+            code for code, in db.session.query(VariantCode.code).filter_by(product_variant_id=id).order_by(VariantCode.code)
+        )
         try:
             if hasattr(form, 'product_id'):
                 form.product_id.choices = self._get_product_choices()
@@ -531,7 +831,7 @@ class OrderAdminView(MyAdminModelView):
         try:
             # Check if database is accessible
             db.session.execute(db.text('SELECT 1'))
-            variants = ProductVariant.query.join(Product).order_by(Product.name, ProductVariant.quantity_value).all()
+            variants = ProductVariant.query.join(Product).options(db.contains_eager(ProductVariant.product)).order_by(Product.name, ProductVariant.quantity_value).all()
             return [(v.id, f"{v.product.name} - {v.quantity_value}{v.quantity_unit}") for v in variants]
         except Exception as e:
             print(f"Error getting variant choices: {e}")
@@ -622,7 +922,7 @@ class OrderItemAdminView(MyAdminModelView):
                 try:
                     # Check if database is accessible
                     db.session.execute(db.text('SELECT 1'))
-                    variants = ProductVariant.query.join(Product).order_by(Product.name, ProductVariant.quantity_value).all()
+                    variants = ProductVariant.query.join(Product).options(db.contains_eager(ProductVariant.product)).order_by(Product.name, ProductVariant.quantity_value).all()
                     choices = [(v.id, f"{v.product.name} - {v.quantity_value}{v.quantity_unit}") for v in variants]
                     print(f"Variant choices populated: {len(choices)} variants")
                 except Exception as e:
@@ -656,7 +956,7 @@ class OrderItemAdminView(MyAdminModelView):
                 form.order_id.choices = []
         if hasattr(form, 'product_variant_id') and hasattr(form.product_variant_id, 'choices'):
             try:
-                variants = ProductVariant.query.all()
+                variants = ProductVariant.query.options(db.joinedload(ProductVariant.product)).all()
                 form.product_variant_id.choices = [(v.id, f"{v.product.name} ({v.quantity_value}{v.quantity_unit})") for v in variants if v.product]
             except Exception as e:
                 print(f"Error populating variant choices: {e}")
@@ -674,7 +974,7 @@ class OrderItemAdminView(MyAdminModelView):
                 form.order_id.choices = []
         if hasattr(form, 'product_variant_id') and hasattr(form.product_variant_id, 'choices'):
             try:
-                variants = ProductVariant.query.all()
+                variants = ProductVariant.query.options(db.joinedload(ProductVariant.product)).all()
                 form.product_variant_id.choices = [(v.id, f"{v.product.name} ({v.quantity_value}{v.quantity_unit})") for v in variants if v.product]
             except Exception as e:
                 print(f"Error populating variant choices: {e}")
@@ -694,26 +994,14 @@ class OfflineSaleAdminView(MyAdminModelView):
         'payment_mode': 'Payment Mode',
         'sale_date': 'Sale Date'
     }
-    form_columns = ['customer_name', 'total_cost', 'amount_paid', 'change_given', 'payment_mode']
+    # Sales are recorded through the manual sale screen, which counts them into their
+    # till session; the sale does not record its session, so amounts cannot change here
+    can_create = False
+    can_delete = False
+    form_columns = ['customer_name']
     column_searchable_list = ['customer_name', 'payment_mode']
     column_filters = ['payment_mode', 'sale_date']
     
-    form_choices = {
-        'payment_mode': [
-            ('Cash', 'Cash'),
-            ('M-Pesa', 'M-Pesa'),
-            ('Card', 'Card'),
-            ('Bank Transfer', 'Bank Transfer')
-        ]
-    }
-    
-    form_args = {
-        'total_cost': {'validators': [DataRequired()]},
-        'amount_paid': {'validators': [DataRequired()]},
-        'change_given': {'validators': [DataRequired()]},
-        'payment_mode': {'validators': [DataRequired()]}
-    }
-    
     create_modal = False
     edit_modal = False
 
@@ -760,7 +1048,7 @@ class OfflineSaleItemAdminView(MyAdminModelView):
                 form.offline_sale_id.choices = []
         if hasattr(form, 'product_variant_id') and hasattr(form.product_variant_id, 'choices'):
             try:
-                variants = ProductVariant.query.all()
+                variants = ProductVariant.query.options(db.joinedload(ProductVariant.product)).all()
                 form.product_variant_id.choices = [(v.id, f"{v.product.name} ({v.quantity_value}{v.quantity_unit})") for v in variants if v.product]
             except Exception as e:
                 print(f"Error populating variant choices: {e}")
@@ -778,7 +1066,7 @@ class OfflineSaleItemAdminView(MyAdminModelView):
                 form.offline_sale_id.choices = []
         if hasattr(form, 'product_variant_id') and hasattr(form.product_variant_id, 'choices'):
             try:
-                variants = ProductVariant.query.all()
+                variants = ProductVariant.query.options(db.joinedload(ProductVariant.product)).all()
                 form.product_variant_id.choices = [(v.id, f"{v.product.name} ({v.quantity_value}{v.quantity_unit})") for v in variants if v.product]
             except Exception as e:
                 print(f"Error populating variant choices: {e}")
@@ -800,6 +1088,7 @@ class TestimonialAdminView(MyAdminModelView):
     form_columns = ['author_name', 'author_position', 'text', 'image_url', 'is_approved']
     column_searchable_list = ['author_name', 'text']
     column_filters = ['is_approved', 'created_at']
+    invalidates_cache = 'testimonials'
     
     form_choices = {
         'is_approved': [
@@ -827,6 +1116,7 @@ class FAQAdminView(MyAdminModelView):
     form_columns = ['question', 'answer', 'display_order']
     column_searchable_list = ['question', 'answer']
     column_filters = ['display_order']
+    invalidates_cache = 'faqs'
     
     form_args = {
         'question': {'validators': [DataRequired()]},
@@ -901,125 +1191,2569 @@ def setup_admin():
 # Initialize admin later in the app context
 admin = None
 
-# --- API ROUTES FOR MANUAL SALES ---
-@app.route('/api/products')
-def get_products():
-    search = request.args.get('search', '')
-    products_query = Product.query
-    
-    if search:
-        products_query = products_query.filter(
-            db.or_(
-                Product.name.ilike(f'%{search}%'),
-                Product.description.ilike(f'%{search}%')
-            )
-        )
-    
-    products = products_query.order_by(Product.name).all()
-    
-    result = []
-    for product in products:
-        product_data = product.to_dict()
-        # Add variants with more details
-        variants_data = []
-        for variant in product.variants:
-            variant_data = variant.to_dict()
-            variant_data['display_name'] = f"{product.name} ({variant.quantity_value}{variant.quantity_unit})"
-            variants_data.append(variant_data)
-        product_data['variants'] = variants_data
-        result.append(product_data)
-    
-    return jsonify(result)
+# --- CATALOG PAGINATION ---
+CATALOG_PAGE_SIZE = 24
+CATALOG_MAX_PAGE_SIZE = 100
 
-@app.route('/api/product-variants')
-def get_product_variants():
-    search = request.args.get('search', '')
-    variants_query = ProductVariant.query.join(Product)
-    
-    if search:
-        variants_query = variants_query.filter(
-            db.or_(
-                Product.name.ilike(f'%{search}%'),
-                ProductVariant.quantity_unit.ilike(f'%{search}%'),
-                ProductVariant.supplier.ilike(f'%{search}%')
-            )
-        )
-    
-    variants = variants_query.all()
-    
-    result = []
-    for variant in variants:
-        variant_data = variant.to_dict()
-        variant_data['display_name'] = f"{variant.product.name} ({variant.quantity_value}{variant.quantity_unit}) - KSh {variant.selling_price}"
-        result.append(variant_data)
-    
-    return jsonify(result)
+def get_page_limit():
+    """Read ?limit= from the request, clamped to the server-side page cap"""
+    try:
+        limit = int(request.args.get('limit', CATALOG_PAGE_SIZE))
+    except (TypeError, ValueError):
+        limit = CATALOG_PAGE_SIZE
+    return max(1, min(limit, CATALOG_MAX_PAGE_SIZE))
 
-@app.route('/api/testimonials')
-def get_testimonials():
+def encode_cursor(name, row_id):
+    """Pack the (name, id) sort key of the last row into an opaque cursor"""
+    raw = json.dumps([name, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Unpack a cursor produced by encode_cursor(), raising ValueError if it is malformed"""
     try:
-        testimonials = Testimonial.query.filter_by(is_approved=True).order_by(Testimonial.created_at.desc()).all()
-        return jsonify([{
-            'id': testimonial.id,
-            'author_name': testimonial.author_name,
-            'author_position': testimonial.author_position,
-            'text': testimonial.text,
-            'image_url': testimonial.image_url,
-            'created_at': testimonial.created_at.isoformat() if testimonial.created_at else None
-        } for testimonial in testimonials])
-    except Exception as e:
-        print(f"Error in get_testimonials: {e}")
-        return jsonify({
-            'error': 'Failed to load testimonials',
-            'message': str(e)
-        }), 500
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw.decode('utf-8'))
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+    if isinstance(sort_value, bool) or not isinstance(sort_value, (str, int, float)) or not isinstance(row_id, int):
+        raise ValueError('Invalid cursor')
+    return sort_value, row_id
 
-@app.route('/api/faqs')
-def get_faqs():
+def keyset_page(query, sort_columns, cursor, limit):
+    """Fetch one page of `query` ordered by `sort_columns` (a (value, id) pair), starting after `cursor`.
+
+    Returns the entities of the page and the cursor for the next page (None on the last page).
+    """
+    sort_column, id_column = sort_columns
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        query = query.filter(db.or_(
+            sort_column > sort_value,
+            db.and_(sort_column == sort_value, id_column > row_id)
+        ))
+
+    # Fetch one extra row to find out whether another page follows
+    rows = query.add_columns(sort_column, id_column).order_by(sort_column, id_column).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][2])
+    return [row[0] for row in rows], next_cursor
+
+# --- FULL-TEXT SEARCH ---
+# FTS5 tables mirroring the searchable catalog columns. The rowid of each
+# index row is the id of the product / variant it was built from, and the
+# triggers below keep the index in step with every insert, update and delete.
+SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+        name, description, category,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS variant_fts USING fts5(
+        product_name, quantity_unit, supplier,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_insert AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts (rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_delete AFTER DELETE ON product BEGIN
+        DELETE FROM product_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_update AFTER UPDATE OF name, description, category ON product BEGIN
+        DELETE FROM product_fts WHERE rowid = old.id;
+        INSERT INTO product_fts (rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+        UPDATE variant_fts SET product_name = new.name
+        WHERE rowid IN (SELECT id FROM product_variant WHERE product_id = new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS variant_fts_insert AFTER INSERT ON product_variant BEGIN
+        INSERT INTO variant_fts (rowid, product_name, quantity_unit, supplier)
+        VALUES (new.id, (SELECT name FROM product WHERE id = new.product_id), new.quantity_unit, new.supplier);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS variant_fts_delete AFTER DELETE ON product_variant BEGIN
+        DELETE FROM variant_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS variant_fts_update AFTER UPDATE OF product_id, quantity_unit, supplier ON product_variant BEGIN
+        DELETE FROM variant_fts WHERE rowid = old.id;
+        INSERT INTO variant_fts (rowid, product_name, quantity_unit, supplier)
+        VALUES (new.id, (SELECT name FROM product WHERE id = new.product_id), new.quantity_unit, new.supplier);
+    END""",
+]
+
+SEARCH_INDEX_REBUILD_SQL = [
+    "DELETE FROM product_fts",
+    """INSERT INTO product_fts (rowid, name, description, category)
+       SELECT id, name, description, category FROM product""",
+    "DELETE FROM variant_fts",
+    """INSERT INTO variant_fts (rowid, product_name, quantity_unit, supplier)
+       SELECT v.id, p.name, v.quantity_unit, v.supplier
+       FROM product_variant v JOIN product p ON p.id = v.product_id""",
+]
+
+# bm25() column weights: a hit in the product name outranks one in the description
+PRODUCT_SEARCH_WEIGHTS = (10.0, 1.0, 2.0)
+VARIANT_SEARCH_WEIGHTS = (10.0, 2.0, 1.0)
+
+_search_index_ready = False
+
+def create_search_index(connection):
+    """Create the FTS5 tables and sync triggers, populating them if they are new"""
+    global _search_index_ready
+    if connection.dialect.name != 'sqlite':
+        return
+    existed = connection.execute(db.text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_fts'"
+    )).first() is not None
     try:
-        faqs = FAQ.query.order_by(FAQ.display_order, FAQ.id).all()
-        return jsonify([{
-            'id': faq.id,
-            'question': faq.question,
-            'answer': faq.answer,
-            'display_order': faq.display_order
-        } for faq in faqs])
+        for statement in SEARCH_INDEX_DDL:
+            connection.execute(db.text(statement))
     except Exception as e:
-        print(f"Error in get_faqs: {e}")
-        return jsonify({
-            'error': 'Failed to load FAQs',
-            'message': str(e)
-        }), 500
+        print(f"Full-text search unavailable, falling back to LIKE search: {e}")
+        return
+    if not existed:
+        rebuild_search_index(connection)
+    _search_index_ready = True
 
-@app.route('/api/contact', methods=['POST'])
-def submit_contact():
+def rebuild_search_index(connection):
+    """Repopulate the FTS5 tables from the product and product_variant tables"""
+    for statement in SEARCH_INDEX_REBUILD_SQL:
+        connection.execute(db.text(statement))
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_search_index(target, connection, **kw):
+    create_search_index(connection)
+
+@event.listens_for(db.metadata, 'before_drop')
+def _drop_search_index(target, connection, **kw):
+    global _search_index_ready
+    if connection.dialect.name == 'sqlite':
+        connection.execute(db.text("DROP TABLE IF EXISTS product_fts"))
+        connection.execute(db.text("DROP TABLE IF EXISTS variant_fts"))
+    _search_index_ready = False
+
+def search_index_available():
+    """Whether the FTS5 index exists in the connected database"""
+    global _search_index_ready
+    if not _search_index_ready and db.engine.dialect.name == 'sqlite':
+        _search_index_ready = db.session.execute(db.text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_fts'"
+        )).first() is not None
+    return _search_index_ready
+
+def fts_match_expression(search):
+    """Turn free text into an FTS5 query requiring every word as a prefix, e.g. 'dap fert' -> '"dap"* "fert"*'"""
+    terms = re.findall(r'\w+', search.lower())
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def search_ranking(fts_table, match, weights):
+    """Subquery of (id, rank) for rows of `fts_table` matching `match`; lower rank is a better match"""
+    weight_args = ', '.join(str(weight) for weight in weights)
+    return db.text(
+        f"SELECT rowid AS id, bm25({fts_table}, {weight_args}) AS rank "
+        f"FROM {fts_table} WHERE {fts_table} MATCH :match"
+    ).bindparams(match=match).columns(id=db.Integer, rank=db.Float).subquery()
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the product full-text search index from scratch"""
+    with db.engine.begin() as connection:
+        create_search_index(connection)
+        rebuild_search_index(connection)
+    print("✅ Search index rebuilt")
+
+# --- CATALOG FACETS ---
+def adjust_facet(connection, facet, value, delta):
+    """Add `delta` to the running count for one facet value, in the caller's transaction"""
+    if not value:
+        return
+    table = CatalogFacet.__table__
+    result = connection.execute(
+        table.update()
+        .where(table.c.facet == facet, table.c.value == value)
+        .values(item_count=table.c.item_count + delta)
+    )
+    if result.rowcount == 0 and delta > 0:
+        connection.execute(table.insert().values(facet=facet, value=value, item_count=delta))
+
+def adjust_facet_on_update(connection, target, attribute, facet):
+    history = db.inspect(target).attrs[attribute].history
+    if history.has_changes():
+        for old_value in history.deleted:
+            adjust_facet(connection, facet, old_value, -1)
+        for new_value in history.added:
+            adjust_facet(connection, facet, new_value, 1)
+
+@event.listens_for(Product, 'after_insert')
+def _count_inserted_product(mapper, connection, target):
+    adjust_facet(connection, 'category', target.category, 1)
+
+@event.listens_for(Product, 'after_update')
+def _count_updated_product(mapper, connection, target):
+    adjust_facet_on_update(connection, target, 'category', 'category')
+
+@event.listens_for(Product, 'after_delete')
+def _count_deleted_product(mapper, connection, target):
+    adjust_facet(connection, 'category', target.category, -1)
+
+@event.listens_for(ProductVariant, 'after_insert')
+def _count_inserted_variant(mapper, connection, target):
+    adjust_facet(connection, 'supplier', target.supplier, 1)
+
+@event.listens_for(ProductVariant, 'after_update')
+def _count_updated_variant(mapper, connection, target):
+    adjust_facet_on_update(connection, target, 'supplier', 'supplier')
+
+@event.listens_for(ProductVariant, 'after_delete')
+def _count_deleted_variant(mapper, connection, target):
+    adjust_facet(connection, 'supplier', target.supplier, -1)
+
+def rebuild_facet_counts(connection):
+    """Recount every facet from the product and product_variant tables"""
+    table = CatalogFacet.__table__
+    connection.execute(table.delete())
+    connection.execute(table.insert().from_select(
+        ['facet', 'value', 'item_count'],
+        db.select(db.literal('category'), Product.category, db.func.count(Product.id))
+        .group_by(Product.category)
+    ))
+    connection.execute(table.insert().from_select(
+        ['facet', 'value', 'item_count'],
+        db.select(db.literal('supplier'), ProductVariant.supplier, db.func.count(ProductVariant.id))
+        .where(ProductVariant.supplier.isnot(None), ProductVariant.supplier != '')
+        .group_by(ProductVariant.supplier)
+    ))
+
+@event.listens_for(db.metadata, 'after_create')
+def _backfill_facet_counts(target, connection, tables=(), **kw):
+    # The counts table is new to this database: count what is already there
+    if CatalogFacet.__table__ in tables:
+        rebuild_facet_counts(connection)
+
+@app.cli.command('rebuild-facet-counts')
+def rebuild_facet_counts_command():
+    """Recount the catalog facet table from scratch"""
+    with db.engine.begin() as connection:
+        rebuild_facet_counts(connection)
+    print("✅ Facet counts rebuilt")
+
+def facet_counts():
+    facets = {'category': {}, 'supplier': {}}
+    rows = db.session.query(CatalogFacet.facet, CatalogFacet.value, CatalogFacet.item_count).filter(
+        CatalogFacet.item_count > 0
+    ).order_by(CatalogFacet.facet, CatalogFacet.value)
+    for facet, value, item_count in rows:
+        facets.setdefault(facet, {})[value] = item_count
+    return facets
+
+def apply_catalog_filters(products_query):
+    """Narrow a Product query by the category, supplier, in_stock, min_price and max_price args.
+
+    Raises ValueError for a price that is not a number.
+    """
+    category = request.args.get('category', '').strip()
+    if category:
+        products_query = products_query.filter(Product.category == category)
+
+    # All variant conditions must hold for the same variant
+    variant_conditions = []
+    supplier = request.args.get('supplier', '').strip()
+    if supplier:
+        variant_conditions.append(ProductVariant.supplier == supplier)
+    if request.args.get('in_stock', '').lower() in ('1', 'true', 'yes'):
+        variant_conditions.append(ProductVariant.stock_level > 0)
+    for arg, compare in (('min_price', ProductVariant.selling_price.__ge__), ('max_price', ProductVariant.selling_price.__le__)):
+        value = request.args.get(arg, '').strip()
+        if value:
+            try:
+                variant_conditions.append(compare(float(value)))
+            except ValueError:
+                raise ValueError(f'{arg} must be a number')
+    if variant_conditions:
+        products_query = products_query.filter(Product.variants.any(db.and_(*variant_conditions)))
+    return products_query
+
+# --- SPARSE FIELDSETS ---
+PRODUCT_FIELDS = Product.serialized_columns + Product.image_fields + ('variants',)
+VARIANT_FIELDS = ProductVariant.serialized_columns + ('product_name', 'expiry_date', 'display_name', 'available')
+
+def get_requested_fields(allowed, nested=None, nested_allowed=()):
+    """Parse ?fields=a,b,variants.c into (top-level fields, nested fields).
+
+    Either part is None when the client did not restrict it; naming just the
+    nested key (e.g. "variants") selects all of its fields. Raises ValueError
+    for an unknown field.
+    """
+    raw = request.args.get('fields', '').strip()
+    if not raw:
+        return None, None
+    fields, nested_fields = set(), set()
+    for name in filter(None, (part.strip() for part in raw.split(','))):
+        prefix, dot, child = name.partition('.')
+        if dot and nested and prefix == nested and child in nested_allowed:
+            fields.add(nested)
+            nested_fields.add(child)
+        elif not dot and name in allowed:
+            fields.add(name)
+        else:
+            raise ValueError(f'Unknown field: {name}')
+    return fields, (nested_fields or None)
+
+def variant_columns(fields):
+    """The ProductVariant columns needed to serialize `fields`"""
+    names = {name for name in fields if name in ProductVariant.serialized_columns or name == 'expiry_date'}
+    if 'display_name' in fields:
+        names.update(('quantity_value', 'quantity_unit', 'selling_price'))
+    if 'available' in fields:
+        names.add('stock_level')
+    return [ProductVariant.product_id] + [getattr(ProductVariant, name) for name in sorted(names)]
+
+def product_load_options(fields, variant_fields):
+    """Loader options that SELECT only the columns behind the requested product fields"""
+    options = []
+    if fields is not None:
+        names = {name for name in fields if name in Product.serialized_columns}
+        # The name is always needed for sorting and variant display names
+        names.add('name')
+        if not fields.isdisjoint(Product.image_fields):
+            names.add('image_url')
+        options.append(db.load_only(*[getattr(Product, name) for name in sorted(names)]))
+    if fields is None or 'variants' in fields:
+        variants_loader = db.selectinload(Product.variants)
+        if variant_fields is not None:
+            variants_loader = variants_loader.load_only(*variant_columns(variant_fields))
+        options.append(variants_loader)
+    return options
+
+# --- SNAPSHOT CACHES ---
+class SnapshotCache:
+    """Already-encoded JSON bodies of public API responses, valid for one data version.
+
+    The version is a shared counter (see SHARED DATA VERSIONS below) that every
+    write to the tables behind the API bumps in its own transaction, so all app
+    processes drop their snapshots once it commits. A cache may also follow a
+    lagging counter (cart holds), which moves at most once per delay.
+    """
+    max_entries = 256
+
+    def __init__(self, name, lagging=None):
+        self.name = name
+        self.lagging = lagging
+        self.version = None
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def bump(self, connection=None):
+        """Move the shared version in the caller's transaction, the session's by default"""
+        bump_data_version(connection or db.session.connection(), self.name)
+
+    def sync(self):
+        """Adopt the shared version, dropping every snapshot if it moved, and return it"""
+        versions = snapshot_versions()
+        version = (versions.get(self.name, 0), due_data_version(versions, self.lagging) if self.lagging else 0)
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                self._entries.clear()
+        return version
+
+    def clear(self):
+        """Forget every snapshot and the version they were taken at"""
+        with self._lock:
+            self.version = None
+            self._entries.clear()
+
+    def get(self, key):
+        self.sync()
+        return self._entries.get(key)
+
+    def put(self, key, version, body):
+        """Store `body`, unless the data changed since `version` was read"""
+        with self._lock:
+            if version == self.version and len(self._entries) < self.max_entries:
+                self._entries[key] = body
+
+# Cart holds reach the catalog snapshots at most once per STOCK_HOLD_CATALOG_DELAY
+STOCK_HOLDS = 'stock_holds'
+snapshot_caches = {
+    'catalog': SnapshotCache('snapshot_catalog', lagging=STOCK_HOLDS),
+    'faqs': SnapshotCache('snapshot_faqs'),
+    'testimonials': SnapshotCache('snapshot_testimonials'),
+}
+catalog_cache = snapshot_caches['catalog']
+SNAPSHOT_VERSIONS_ENVIRON_KEY = 'kaboy.snapshot_versions'
+
+def snapshot_counter_names():
+    """Names of every shared counter the snapshot caches follow"""
+    names = set()
+    for cache in snapshot_caches.values():
+        names.add(cache.name)
+        if cache.lagging:
+            names.update([cache.lagging, due_data_version_name(cache.lagging)])
+    return sorted(names)
+
+def snapshot_versions():
+    """{name: version} of every shared counter the snapshot caches follow, read once per request"""
+    versions = request.environ.get(SNAPSHOT_VERSIONS_ENVIRON_KEY) if has_request_context() else None
+    if versions is None:
+        versions = dict(db.session.execute(
+            db.select(DataVersion.name, DataVersion.version).where(DataVersion.name.in_(snapshot_counter_names()))
+        ).all())
+        if has_request_context():
+            request.environ[SNAPSHOT_VERSIONS_ENVIRON_KEY] = versions
+    return versions
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_snapshot_versions(target, connection, tables=(), **kw):
+    # Start every counter at 0, so the first write only has to update it
+    if DataVersion.__table__ in tables:
+        connection.execute(DataVersion.__table__.insert(), [
+            {'name': name, 'version': 0} for name in snapshot_counter_names()
+        ])
+
+def json_body(payload):
+    return app.json.dumps(payload).encode('utf-8')
+
+def json_response(body):
+    return app.response_class(body, mimetype='application/json')
+
+def versioned_etag(cache_name):
+    """Tag GET responses with a strong ETag derived from the named cache's version.
+
+    A request whose If-None-Match already holds the current tag gets a 304
+    without the view running at all.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Built from the shared version alone, so every app process hands out the same tag
+            version = snapshot_caches[cache_name].sync()
+            tag_source = f"{cache_name}:{version}:{request.full_path}"
+            etag = hashlib.sha1(tag_source.encode('utf-8')).hexdigest()[:32]
+
+            # Weak comparison, since compression hands out the same tag as W/"..."
+            if request.if_none_match.contains_weak(etag):
+                response = app.response_class(status=304)
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            # Clients may keep the body but must revalidate before reusing it
+            response.headers['Cache-Control'] = 'public, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+# --- CATALOG CHANGE FEED ---
+CATALOG_CHANGES_PAGE_SIZE = 500
+CATALOG_CHANGES_MAX_PAGE_SIZE = 2000
+
+def log_catalog_changes(connection, entity, entity_ids, deleted=False):
+    """Give the `entity` rows in `entity_ids` a new change number, in the caller's transaction.
+
+    Each row keeps only its latest entry, so the log grows with the catalog
+    rather than with the number of writes.
+    """
+    if not entity_ids:
+        return
+    table = CatalogChange.__table__
+    connection.execute(table.delete().where(table.c.entity == entity, table.c.entity_id.in_(entity_ids)))
+    now = datetime.utcnow()
+    connection.execute(table.insert(), [
+        {'entity': entity, 'entity_id': entity_id, 'deleted': deleted, 'changed_at': now}
+        for entity_id in sorted(entity_ids)
+    ])
+
+@event.listens_for(Product, 'after_insert')
+@event.listens_for(Product, 'after_update')
+def _log_written_product(mapper, connection, target):
+    log_catalog_changes(connection, 'product', [target.id])
+
+@event.listens_for(Product, 'after_delete')
+def _log_deleted_product(mapper, connection, target):
+    log_catalog_changes(connection, 'product', [target.id], deleted=True)
+
+@event.listens_for(ProductVariant, 'after_insert')
+@event.listens_for(ProductVariant, 'after_update')
+def _log_written_variant(mapper, connection, target):
+    log_catalog_changes(connection, 'variant', [target.id])
+
+@event.listens_for(ProductVariant, 'after_delete')
+def _log_deleted_variant(mapper, connection, target):
+    log_catalog_changes(connection, 'variant', [target.id], deleted=True)
+
+@event.listens_for(db.metadata, 'after_create')
+def _backfill_catalog_changes(target, connection, tables=(), **kw):
+    # The log is new to this database: number every existing row so a full sync finds it
+    if CatalogChange.__table__ not in tables:
+        return
+    table = CatalogChange.__table__
+    now = datetime.utcnow()
+    for entity, model in (('product', Product), ('variant', ProductVariant)):
+        connection.execute(table.insert().from_select(
+            ['entity', 'entity_id', 'deleted', 'changed_at'],
+            db.select(db.literal(entity), model.id, db.false(), db.func.coalesce(model.created_at, now))
+            .order_by(model.id)
+        ))
+
+def changed_at_iso(change):
+    return change.changed_at.isoformat() + 'Z'
+
+@app.route('/api/catalog/changes')
+@versioned_etag('catalog')
+def catalog_changes():
+    """Products and variants written or deleted since change number ?since=, oldest change first.
+
+    since=0 returns the whole catalog. Clients pass back `next_since` until
+    `has_more` is false; a row changed twice only appears once, with its
+    current values. Renaming a product also resends its variants, whose
+    product_name and display_name follow it.
+    """
     try:
-        data = request.get_json()
-        if not data:
-            return jsonify({'success': False, 'message': 'No data received'}), 400
-        
-        # Create contact message
-        contact_msg = ContactMessage(
-            name=data.get('name', ''),
-            email=data.get('email', ''),
-            phone=data.get('phone', ''),
-            subject=data.get('subject', 'General Inquiry'),
-            message=data.get('message', '')
+        since = int(request.args.get('since', 0))
+        limit = int(request.args.get('limit', CATALOG_CHANGES_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'since and limit must be integers'}), 400
+    if since < 0:
+        return jsonify({'error': 'since must not be negative'}), 400
+    limit = max(1, min(limit, CATALOG_CHANGES_MAX_PAGE_SIZE))
+
+    cache_key = ('catalog-changes', since, limit)
+    body = catalog_cache.get(cache_key)
+    if body is not None:
+        return json_response(body)
+    catalog_version = catalog_cache.sync()
+
+    changes = db.session.execute(
+        db.select(CatalogChange).where(CatalogChange.seq > since).order_by(CatalogChange.seq).limit(limit + 1)
+    ).scalars().all()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    written = {'product': {}, 'variant': {}}
+    deleted = {'product': [], 'variant': []}
+    for change in changes:
+        if change.deleted:
+            deleted[change.entity].append(change.entity_id)
+        else:
+            written[change.entity][change.entity_id] = change
+
+    products = []
+    if written['product']:
+        product_fields = set(Product.serialized_columns + Product.image_fields)
+        for product in Product.query.options(db.load_only(*[getattr(Product, name) for name in Product.serialized_columns])).filter(
+            Product.id.in_(list(written['product']))
+        ).order_by(Product.id):
+            product_data = product.to_dict(fields=product_fields)
+            product_data['updated_at'] = changed_at_iso(written['product'][product.id])
+            products.append(product_data)
+
+    variants = []
+    if written['variant'] or written['product']:
+        for variant in ProductVariant.query.join(Product).options(
+            db.contains_eager(ProductVariant.product).load_only(Product.name)
+        ).filter(db.or_(
+            ProductVariant.id.in_(list(written['variant'])),
+            ProductVariant.product_id.in_(list(written['product']))
+        )).order_by(ProductVariant.id):
+            variant_data = variant.to_dict(product=variant.product)
+            variant_data['product_id'] = variant.product_id
+            variant_data['display_name'] = f"{variant.product.name} ({variant.quantity_value}{variant.quantity_unit}) - KSh {variant.selling_price}"
+            change = written['variant'].get(variant.id) or written['product'][variant.product_id]
+            variant_data['updated_at'] = changed_at_iso(change)
+            variants.append(variant_data)
+
+    body = json_body({
+        'since': since,
+        'next_since': changes[-1].seq if changes else since,
+        'has_more': has_more,
+        'products': products,
+        'variants': variants,
+        'deleted': {'products': deleted['product'], 'variants': deleted['variant']}
+    })
+    catalog_cache.put(cache_key, catalog_version, body)
+    return json_response(body)
+
+# --- RESPONSE COMPRESSION ---
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+    'text/css', 'text/html', 'text/javascript', 'text/plain', 'text/xml',
+}
+PRECOMPRESSED_EXTENSIONS = ('.css', '.html', '.js', '.json', '.map', '.svg', '.txt')
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+def negotiate_encoding(encodings=None):
+    """The client's preferred encoding among `encodings` (default: those we can produce), or None"""
+    if encodings is None:
+        encodings = ('br', 'gzip') if brotli else ('gzip',)
+    return request.accept_encodings.best_match(encodings)
+
+def compress_bytes(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=app.config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=app.config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+def compress_stream(chunks, encoding):
+    """Compress an iterable of byte chunks, flushing after each one so the
+    client receives data as soon as it is produced"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=app.config['COMPRESS_BROTLI_QUALITY'])
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        # wbits=31 writes a gzip header and trailer around the deflate stream
+        compressor = zlib.compressobj(app.config['COMPRESS_GZIP_LEVEL'], zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+@app.after_request
+def compress_response(response):
+    """gzip/brotli-encode text responses for clients that accept it"""
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+
+    if response.direct_passthrough or response.status_code not in (200, 304):
+        # Files from send_file are either precompressed or not worth compressing per request
+        return response
+    if response.status_code == 200:
+        if response.is_streamed:
+            original = response.response
+            response.response = compress_stream(response.iter_encoded(), encoding)
+            if hasattr(original, 'close'):
+                response.call_on_close(original.close)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < app.config['COMPRESS_MIN_SIZE']:
+                return response
+            response.set_data(compress_bytes(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+
+    # The encoded body is a different byte sequence, so a strong tag no longer holds
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def send_static_precompressed(filename):
+    """Static file view that serves a fresh .br/.gz sibling when the client accepts it"""
+    encoding = None
+    if filename.endswith(PRECOMPRESSED_EXTENSIONS):
+        source = safe_join(app.static_folder, filename)
+        encodings = []
+        if source and os.path.isfile(source):
+            for candidate, suffix in ENCODING_SUFFIXES.items():
+                sibling = source + suffix
+                if os.path.isfile(sibling) and os.path.getmtime(sibling) >= os.path.getmtime(source):
+                    encodings.append(candidate)
+        encoding = negotiate_encoding(encodings) if encodings else None
+
+    if encoding is None:
+        response = app.send_static_file(filename)
+    else:
+        response = send_from_directory(
+            app.static_folder, filename + ENCODING_SUFFIXES[encoding],
+            mimetype=mimetypes.guess_type(filename)[0],
+            max_age=app.get_send_file_max_age(filename)
         )
-        db.session.add(contact_msg)
-        db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'message': 'Contact message received successfully!'
-        })
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'message': f'Error processing contact form: {str(e)}'
-        }), 500
+        response.headers['Content-Encoding'] = encoding
+    if filename.endswith(PRECOMPRESSED_EXTENSIONS):
+        response.vary.add('Accept-Encoding')
+    if filename.startswith(ASSET_BUILD_DIR + '/') and response.status_code in (200, 304):
+        # Fingerprinted names change with their content, so browsers never need to revalidate
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
 
-@app.route('/api/submit-full-order', methods=['POST'])
+app.view_functions['static'] = send_static_precompressed
+
+def write_precompressed(path):
+    """Write .gz (and .br, when brotli is installed) siblings of `path` that are missing or stale.
+
+    Returns the number of files written.
+    """
+    if not path.endswith(PRECOMPRESSED_EXTENSIONS) or os.path.getsize(path) < app.config['COMPRESS_MIN_SIZE']:
+        return 0
+    encoders = {'gzip': lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli:
+        encoders['br'] = lambda data: brotli.compress(data, quality=11)
+    with open(path, 'rb') as f:
+        data = f.read()
+    written = 0
+    for encoding, encode in encoders.items():
+        sibling = path + ENCODING_SUFFIXES[encoding]
+        if os.path.isfile(sibling) and os.path.getmtime(sibling) >= os.path.getmtime(path):
+            continue
+        with open(sibling, 'wb') as f:
+            f.write(encode(data))
+        written += 1
+    return written
+
+@app.cli.command('compress-static')
+def compress_static_command():
+    """Write .gz (and .br, when brotli is installed) siblings for static text assets"""
+    written = 0
+    for directory, _, filenames in os.walk(app.static_folder):
+        for filename in filenames:
+            written += write_precompressed(os.path.join(directory, filename))
+    print(f"Wrote {written} precompressed static files.")
+
+# --- ASSET PIPELINE ---
+# The build itself lives in build_assets.py, which runs without the app or a database
+
+_asset_manifest = {'stamp': None, 'entries': {}}
+
+def asset_manifest():
+    """The current build manifest, reloaded whenever build-assets rewrites it"""
+    path = os.path.join(app.static_folder, ASSET_BUILD_DIR, ASSET_MANIFEST)
+    try:
+        stamp = (path, os.path.getmtime(path))
+    except OSError:
+        return {}
+    if stamp != _asset_manifest['stamp']:
+        with open(path) as f:
+            _asset_manifest['entries'] = json.load(f)
+        _asset_manifest['stamp'] = stamp
+    return _asset_manifest['entries']
+
+@app.template_global()
+def asset_url(filename):
+    """URL of the fingerprinted build of a static asset, or of the source file before any build"""
+    return url_for('static', filename=asset_manifest().get(filename, filename))
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Minify and fingerprint static CSS/JS into static/dist and write the manifest"""
+    manifest = build_assets(app.static_folder)
+    for name, built in sorted(manifest.items()):
+        print(f"{name} -> {built}")
+    print(f"Built {len(manifest)} assets.")
+
+# --- IMAGE RENDITIONS ---
+IMAGE_RENDITION_WIDTHS = (160, 320, 640, 960)
+IMAGE_PLACEHOLDER_WIDTH = 16
+# Under static/, next to the uploads themselves
+IMAGE_RENDITION_DIR = 'uploads/renditions'
+IMAGE_RENDITION_MANIFEST = 'manifest.json'
+
+def render_image_renditions(source_path, output_dir):
+    """Write resized JPEG and WebP copies of one image, named by its content hash.
+
+    Runs in the image process pool, so it only touches the filesystem and
+    returns plain data for the parent to record.
+    """
+    with open(source_path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:16]
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+
+    # Never upscale: stop at the first width the source cannot fill
+    widths = []
+    for width in IMAGE_RENDITION_WIDTHS:
+        widths.append(min(width, image.width))
+        if width >= image.width:
+            break
+
+    os.makedirs(output_dir, exist_ok=True)
+    for width in widths:
+        resized = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        resized.save(os.path.join(output_dir, f'{digest}-{width}w.jpg'), 'JPEG', quality=80, optimize=True, progressive=True)
+        resized.save(os.path.join(output_dir, f'{digest}-{width}w.webp'), 'WEBP', quality=75, method=4)
+
+    placeholder_height = max(1, round(image.height * IMAGE_PLACEHOLDER_WIDTH / image.width))
+    placeholder = image.resize((IMAGE_PLACEHOLDER_WIDTH, placeholder_height)).filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    placeholder.save(buffer, 'JPEG', quality=40)
+    return {
+        'digest': digest,
+        'widths': widths,
+        'source_mtime': os.path.getmtime(source_path),
+        'placeholder': 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii'),
+    }
+
+class ImageRenditionIndex:
+    """Which product images have renditions, keyed by image_url.
+
+    Backed by a JSON manifest beside the renditions so every app process sees
+    the same state; reloaded whenever the file changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool = None
+        self._stamp = None
+        self._entries = {}
+
+    def _manifest_path(self):
+        return os.path.join(app.static_folder, *IMAGE_RENDITION_DIR.split('/'), IMAGE_RENDITION_MANIFEST)
+
+    def _load(self):
+        path = self._manifest_path()
+        try:
+            stamp = (path, os.path.getmtime(path))
+        except OSError:
+            self._stamp, self._entries = None, {}
+            return self._entries
+        if stamp != self._stamp:
+            with open(path) as f:
+                self._entries = json.load(f)
+            self._stamp = stamp
+        return self._entries
+
+    def lookup(self, image_url):
+        return self._load().get(image_url) if image_url else None
+
+    def record(self, image_url, rendition):
+        with self._lock:
+            entries = dict(self._load())
+            entries[image_url] = rendition
+            path = self._manifest_path()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(entries, f, indent=2, sort_keys=True)
+            os.replace(path + '.tmp', path)
+        # Product JSON embeds the srcset, so cached catalog pages are now stale
+        with app.app_context(), db.engine.begin() as connection:
+            catalog_cache.bump(connection)
+
+    def source_path(self, image_url):
+        """Filesystem path of a locally served image, or None for remote/missing files"""
+        prefix = app.static_url_path + '/'
+        if not image_url or not image_url.startswith(prefix):
+            return None
+        path = safe_join(app.static_folder, image_url[len(prefix):])
+        return path if path and os.path.isfile(path) else None
+
+    def queue(self, image_url):
+        """Render `image_url` in the background unless its renditions are current.
+
+        Returns a Future that resolves once the renditions are recorded, or
+        None when there is nothing to do.
+        """
+        source = self.source_path(image_url)
+        if Image is None or source is None:
+            return None
+        existing = self.lookup(image_url)
+        if existing and existing['source_mtime'] >= os.path.getmtime(source):
+            return None
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=2)
+        output_dir = os.path.join(app.static_folder, *IMAGE_RENDITION_DIR.split('/'))
+        recorded = Future()
+        future = self._pool.submit(render_image_renditions, source, output_dir)
+        future.add_done_callback(lambda done: self._finish(image_url, done, recorded))
+        return recorded
+
+    def _finish(self, image_url, future, recorded):
+        try:
+            rendition = future.result()
+            self.record(image_url, rendition)
+        except Exception as e:
+            print(f"Error rendering image {image_url}: {e}")
+            recorded.set_exception(e)
+        else:
+            recorded.set_result(rendition)
+
+    def srcset(self, image_url, extension):
+        rendition = self.lookup(image_url)
+        if not rendition:
+            return None
+        base = f"{app.static_url_path}/{IMAGE_RENDITION_DIR}/{rendition['digest']}"
+        return ', '.join(f"{base}-{width}w.{extension} {width}w" for width in rendition['widths'])
+
+    def placeholder(self, image_url):
+        rendition = self.lookup(image_url)
+        return rendition['placeholder'] if rendition else None
+
+image_renditions = ImageRenditionIndex()
+
+def content_hash_filename(obj, file_data):
+    """Name uploads by content so identical images share one file and URLs never go stale"""
+    digest = hashlib.sha256(file_data.stream.read()).hexdigest()[:16]
+    file_data.stream.seek(0)
+    extension = os.path.splitext(secure_filename(file_data.filename))[1].lower()
+    return f'{digest}{extension}'
+
+@app.cli.command('build-image-renditions')
+def build_image_renditions_command():
+    """Render thumbnails for every product image that lacks current ones"""
+    if Image is None:
+        print("Pillow is not installed; nothing to do.")
+        return
+    futures = [image_renditions.queue(url) for (url,) in db.session.query(Product.image_url).distinct()]
+    futures = [future for future in futures if future is not None]
+    for future in futures:
+        try:
+            future.result()
+        except Exception:
+            pass  # Already reported by the done callback
+    print(f"Rendered {len(futures)} product images.")
+
+# --- SHARED DATA VERSIONS ---
+# Product names, sizes, suppliers and barcodes: the text the in-memory search
+# and lookup indexes are built from. Stock and price changes leave it alone.
+CATALOG_LABELS = 'catalog_labels'
+CATALOG_LABEL_COLUMNS = {
+    Product: ('name',),
+    ProductVariant: ('product_id', 'quantity_value', 'quantity_unit', 'supplier'),
+    VariantCode: ('code', 'product_variant_id'),
+}
+
+def read_data_version(name, connection=None):
+    """Current value of the shared counter `name`; 0 until it is first bumped"""
+    connection = connection or db.session
+    return connection.execute(db.select(DataVersion.version).where(DataVersion.name == name)).scalar() or 0
+
+def bump_data_version(connection, name):
+    """Advance the shared counter `name` in the caller's transaction and return its new value"""
+    table = DataVersion.__table__
+    result = connection.execute(table.update().where(table.c.name == name).values(version=table.c.version + 1))
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(name=name, version=1))
+    return read_data_version(name, connection)
+
+def set_data_version(connection, name, version):
+    """Set the shared counter `name` in the caller's transaction"""
+    table = DataVersion.__table__
+    result = connection.execute(table.update().where(table.c.name == name).values(version=version))
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(name=name, version=version))
+
+def due_data_version_name(name):
+    """Counter holding when the latest move of the lagging counter `name` shows, in Unix seconds"""
+    return f'{name}_due'
+
+def bump_data_version_within(connection, name, delay):
+    """Advance the lagging counter `name` so it shows within `delay`, in the caller's transaction.
+
+    Every call until then is folded into the same move, and every process
+    shows it at the same moment (see due_data_version()).
+    """
+    now = time.time()
+    if read_data_version(due_data_version_name(name), connection) > now:
+        return
+    bump_data_version(connection, name)
+    if delay:
+        set_data_version(connection, due_data_version_name(name), int(now + delay.total_seconds()))
+
+def due_data_version(versions, name):
+    """Value of the lagging counter `name` to show now, from {name: version} read together"""
+    version = versions.get(name, 0)
+    return version - 1 if versions.get(due_data_version_name(name), 0) > time.time() else version
+
+def catalog_label_changes(session):
+    """(variant_ids, product_ids) whose labels the session is flushing"""
+    variant_ids, product_ids = set(), set()
+    dirty = session.dirty
+    for instance in list(session.new) + list(dirty) + list(session.deleted):
+        columns = CATALOG_LABEL_COLUMNS.get(type(instance))
+        if columns is None:
+            continue
+        state = db.inspect(instance)
+        if instance in dirty and not any(state.attrs[column].history.has_changes() for column in columns):
+            continue
+        if isinstance(instance, Product):
+            product_ids.add(instance.id)
+        elif isinstance(instance, ProductVariant):
+            variant_ids.add(instance.id)
+        else:
+            # A code moved to another variant changes both
+            history = state.attrs.product_variant_id.history
+            variant_ids.update(v for v in [instance.product_variant_id, *history.deleted] if v is not None)
+    return variant_ids, product_ids
+
+# Indexes told about the label changes this process commits
+catalog_label_indexes = []
+
+@event.listens_for(db.session, 'after_flush')
+def _bump_catalog_labels(session, flush_context):
+    variant_ids, product_ids = catalog_label_changes(session)
+    if not variant_ids and not product_ids:
+        return
+    version = bump_data_version(session.connection(), CATALOG_LABELS)
+    # Nobody else can move the counter until this transaction ends, so
+    # every bump in it continues from the first
+    changes = session.info.setdefault('catalog_label_changes', {
+        'from': version - 1, 'variants': set(), 'products': set()
+    })
+    changes['to'] = version
+    changes['variants'].update(variant_ids)
+    changes['products'].update(product_ids)
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_catalog_label_changes(session):
+    changes = session.info.pop('catalog_label_changes', None)
+    if changes:
+        for index in catalog_label_indexes:
+            index.queue_changes(changes['from'], changes['to'], changes['variants'], changes['products'])
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_catalog_label_changes(session):
+    session.info.pop('catalog_label_changes', None)
+
+class CatalogLabelIndex:
+    """Base for in-memory indexes over catalog labels, shared by every app process.
+
+    Built from the database on first use. Before each lookup the index reads
+    the shared catalog_labels version: when only this process's own commits
+    moved it, just the rows they touched are reloaded; when another process
+    changed labels, the whole index is rebuilt. Subclasses provide _reset(),
+    _rows(), _add() and _remove().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Forget everything; the index is rebuilt on the next lookup"""
+        with self._lock:
+            self._reset()
+            self.version = None
+            self._clear_pending()
+
+    def _clear_pending(self):
+        self._pending_variants = set()
+        self._pending_products = set()
+        self._pending_from = self._pending_to = None
+
+    def queue_changes(self, from_version, to_version, variant_ids, product_ids):
+        """Rows a commit in this process changed, moving the shared version from `from_version` to `to_version`"""
+        with self._lock:
+            if self._pending_to is None:
+                self._pending_from = from_version
+            elif self._pending_to != from_version:
+                # Another process committed in between; only a rebuild will do
+                self._pending_from = None
+            self._pending_to = to_version
+            self._pending_variants.update(variant_ids)
+            self._pending_products.update(product_ids)
+
+    @staticmethod
+    def _variant_id(row):
+        return row[0]
+
+    def _sync(self):
+        version = read_data_version(CATALOG_LABELS)
+        with self._lock:
+            if version == self.version:
+                return
+            if self.version is not None and self._pending_from == self.version and self._pending_to == version:
+                # A renamed product changes the labels of all its variants
+                variant_ids, product_ids = self._pending_variants, self._pending_products
+                conditions = []
+                if variant_ids:
+                    conditions.append(ProductVariant.id.in_(variant_ids))
+                if product_ids:
+                    conditions.append(ProductVariant.product_id.in_(product_ids))
+                rows = self._rows(db.or_(*conditions))
+                variant_ids.update(self._variant_id(row) for row in rows)
+                for variant_id in variant_ids:
+                    self._remove(variant_id)
+            else:
+                self._reset()
+                rows = self._rows()
+            for row in rows:
+                self._add(row)
+            self.version = version
+            self._clear_pending()
+
+# --- VARIANT TYPEAHEAD INDEX ---
+SUGGEST_LIMIT = 8
+SUGGEST_MAX_LIMIT = 25
+
+class _TrieNode:
+    __slots__ = ('children', 'ids')
+
+    def __init__(self):
+        self.children = {}
+        # Every variant with a token passing through this node, so a prefix
+        # lookup is a walk down len(prefix) nodes
+        self.ids = set()
+
+class VariantSuggestIndex(CatalogLabelIndex):
+    """In-memory prefix tries over variant product names, units and suppliers"""
+
+    @staticmethod
+    def tokenize(text):
+        return re.findall(r'\w+', (text or '').lower())
+
+    def _reset(self):
+        # One trie over every word, one over whole product names so that
+        # "dap fe" can rank "DAP Fertilizer" ahead of "Fertilizer for DAP"
+        self._token_root = _TrieNode()
+        self._name_root = _TrieNode()
+        self._entries = {}
+        self._sort_keys = {}
+
+    def _rows(self, condition=None):
+        query = db.session.query(
+            ProductVariant.id, Product.name, ProductVariant.quantity_value,
+            ProductVariant.quantity_unit, ProductVariant.supplier
+        ).join(Product, Product.id == ProductVariant.product_id)
+        if condition is not None:
+            query = query.filter(condition)
+        return query.all()
+
+    @staticmethod
+    def _insert(root, key, variant_id):
+        node = root
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+            node.ids.add(variant_id)
+
+    @staticmethod
+    def _discard(root, key, variant_id):
+        path = [root]
+        for char in key:
+            node = path[-1].children.get(char)
+            if node is None:
+                break
+            node.ids.discard(variant_id)
+            path.append(node)
+        # Prune branches that no longer lead to any variant
+        for depth in range(len(path) - 1, 0, -1):
+            if path[depth].ids:
+                break
+            del path[depth - 1].children[key[depth - 1]]
+
+    @staticmethod
+    def _lookup(root, key):
+        node = root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.ids
+
+    def _add(self, row):
+        variant_id, product_name, quantity_value, quantity_unit, supplier = row
+        name = ' '.join(self.tokenize(product_name))
+        tokens = set(self.tokenize(product_name))
+        tokens.update(self.tokenize(quantity_unit))
+        tokens.update(self.tokenize(supplier))
+        tokens.add(f"{quantity_value:g}{quantity_unit or ''}".lower())
+        self._entries[variant_id] = (name, tokens)
+        self._sort_keys[variant_id] = (name, quantity_value, variant_id)
+        self._insert(self._name_root, name, variant_id)
+        for token in tokens:
+            self._insert(self._token_root, token, variant_id)
+
+    def _remove(self, variant_id):
+        entry = self._entries.pop(variant_id, None)
+        if entry is None:
+            return
+        del self._sort_keys[variant_id]
+        name, tokens = entry
+        self._discard(self._name_root, name, variant_id)
+        for token in tokens:
+            self._discard(self._token_root, token, variant_id)
+
+    def suggest(self, text, limit=SUGGEST_LIMIT):
+        """Return up to `limit` variant ids whose words start with every word of `text`, best first"""
+        self._sync()
+        words = self.tokenize(text)
+        if not words:
+            return []
+
+        # Intersect starting from the rarest prefix
+        matches = sorted((self._lookup(self._token_root, word) for word in words), key=len)
+        candidates = set(matches[0])
+        for ids in matches[1:]:
+            candidates &= ids
+            if not candidates:
+                return []
+
+        # Names that start with the whole query come first, then alphabetical by name and size
+        sort_key = self._sort_keys.__getitem__
+        leading = candidates & self._lookup(self._name_root, ' '.join(words))
+        best = heapq.nsmallest(limit, leading, key=sort_key)
+        if len(best) < limit:
+            best += heapq.nsmallest(limit - len(best), candidates - leading, key=sort_key)
+        return best
+
+variant_suggest_index = VariantSuggestIndex()
+catalog_label_indexes.append(variant_suggest_index)
+
+# --- BARCODE LOOKUP ---
+VARIANT_CODE_BATCH_LIMIT = 200
+
+def normalize_variant_code(code):
+    """Codes match case-insensitively and without surrounding whitespace, as scanners send them"""
+    return str(code).strip().upper()
+
+def parse_variant_codes(text):
+    """Split a comma-separated list of codes, dropping blanks and repeats but keeping the order"""
+    codes = (normalize_variant_code(code) for code in (text or '').split(','))
+    return list(dict.fromkeys(code for code in codes if code))
+
+class VariantCodeIndex(CatalogLabelIndex):
+    """In-memory {code: variant label} map answering barcode scans with one dict lookup"""
+
+    def _reset(self):
+        # code -> (variant_id, product_id, product_name, quantity_value, quantity_unit)
+        self._entries = {}
+        self._codes_by_variant = {}
+
+    def _rows(self, condition=None):
+        query = db.session.query(
+            VariantCode.code, ProductVariant.id, Product.id, Product.name,
+            ProductVariant.quantity_value, ProductVariant.quantity_unit
+        ).join(ProductVariant, ProductVariant.id == VariantCode.product_variant_id).join(
+            Product, Product.id == ProductVariant.product_id
+        )
+        if condition is not None:
+            query = query.filter(condition)
+        return query.all()
+
+    def _add(self, row):
+        code, *entry = row
+        self._entries[code] = tuple(entry)
+        self._codes_by_variant.setdefault(entry[0], set()).add(code)
+
+    @staticmethod
+    def _variant_id(row):
+        return row[1]
+
+    def _remove(self, variant_id):
+        for code in self._codes_by_variant.pop(variant_id, ()):
+            self._entries.pop(code, None)
+
+    def lookup(self, codes):
+        """{code: (variant_id, product_id, product_name, quantity_value, quantity_unit)} for the known `codes`"""
+        self._sync()
+        entries = self._entries
+        return {code: entries[code] for code in codes if code in entries}
+
+variant_code_index = VariantCodeIndex()
+catalog_label_indexes.append(variant_code_index)
+
+def variants_by_code(codes):
+    """{code: variant dict} for the `codes` (already normalized) that belong to a variant.
+
+    Labels come from the in-memory map; price and stock change on every sale,
+    so they are read fresh by primary key, without a join.
+    """
+    found = variant_code_index.lookup(codes)
+    if not found:
+        return {}
+    variant_ids = {entry[0] for entry in found.values()}
+    current = {row.id: row for row in db.session.execute(
+        db.select(ProductVariant.id, ProductVariant.selling_price, ProductVariant.stock_level)
+        .where(ProductVariant.id.in_(variant_ids))
+    )}
+    held = held_stock(variant_ids)
+
+    result = {}
+    for code, (variant_id, product_id, product_name, quantity_value, quantity_unit) in found.items():
+        row = current.get(variant_id)
+        if row is None:
+            continue
+        result[code] = {
+            'id': variant_id,
+            'product_id': product_id,
+            'product_name': product_name,
+            'quantity_value': quantity_value,
+            'quantity_unit': quantity_unit,
+            'selling_price': row.selling_price,
+            'stock_level': row.stock_level,
+            'available': max(0, row.stock_level - held.get(variant_id, 0)),
+            'display_name': f"{product_name} ({quantity_value}{quantity_unit}) - KSh {row.selling_price}",
+            'code': code
+        }
+    return result
+
+# --- TYPO-TOLERANT SEARCH ---
+TRIGRAM_SIMILARITY_THRESHOLD = 0.3
+
+def trigrams(text):
+    """pg_trgm-style trigrams: each word padded with two leading blanks and one trailing blank"""
+    grams = set()
+    for word in re.findall(r'[^\W_]+', (text or '').lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class TrigramIndex:
+    """Inverted trigram index over product names and variant display names.
+
+    Each indexed string is a document; postings are compact int arrays of
+    document numbers. The index is built once per process and rebuilt only
+    when the shared catalog_labels version has moved on since the last
+    build, so sales and stock changes never trigger a rebuild.
+    """
+
+    def __init__(self):
+        self.version = None
+        self._postings = {}
+        self._doc_products = array('i')
+        self._doc_sizes = array('i')
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Forget the index; it is rebuilt on the next search"""
+        with self._lock:
+            self.version = None
+
+    def _build(self, version):
+        postings = {}
+        doc_products = array('i')
+        doc_sizes = array('i')
+
+        def add_document(product_id, text):
+            grams = trigrams(text)
+            if not grams:
+                return
+            doc = len(doc_products)
+            doc_products.append(product_id)
+            doc_sizes.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(doc)
+
+        seen_products = set()
+        rows = db.session.query(
+            Product.id, Product.name, ProductVariant.quantity_value, ProductVariant.quantity_unit
+        ).outerjoin(ProductVariant, ProductVariant.product_id == Product.id).all()
+        for product_id, name, quantity_value, quantity_unit in rows:
+            if product_id not in seen_products:
+                seen_products.add(product_id)
+                add_document(product_id, name)
+            if quantity_value is not None:
+                add_document(product_id, f"{name} ({quantity_value}{quantity_unit})")
+
+        self._postings = {gram: array('i', docs) for gram, docs in postings.items()}
+        self._doc_products = doc_products
+        self._doc_sizes = doc_sizes
+        self.version = version
+
+    def search(self, text, limit):
+        """Return up to `limit` (product_id, similarity) pairs, most similar first"""
+        version = read_data_version(CATALOG_LABELS)
+        with self._lock:
+            if self.version != version:
+                self._build(version)
+            postings, doc_products, doc_sizes = self._postings, self._doc_products, self._doc_sizes
+
+        query_grams = trigrams(text)
+        if not query_grams:
+            return []
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(postings.get(gram, ()))
+
+        best = {}
+        for doc, common in shared.items():
+            similarity = common / (len(query_grams) + doc_sizes[doc] - common)
+            product_id = doc_products[doc]
+            if similarity >= TRIGRAM_SIMILARITY_THRESHOLD and similarity > best.get(product_id, 0):
+                best[product_id] = similarity
+        return heapq.nlargest(limit, best.items(), key=lambda item: (item[1], -item[0]))
+
+trigram_index = TrigramIndex()
+
+# --- IDEMPOTENCY KEYS ---
+IDEMPOTENCY_KEY_MAX_LENGTH = 100
+
+def idempotent(scope):
+    """Make a POST view safe to retry when the client sends an Idempotency-Key.
+
+    The first request with a key claims it by inserting a row; the primary key
+    makes exactly one concurrent duplicate win. Its response (anything below
+    500) is stored and replayed to later requests with the same key until the
+    row expires. A duplicate arriving while the winner is still running gets a
+    409 with Retry-After. Requests without the header are not affected.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get('Idempotency-Key', '').strip()
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+                return jsonify({
+                    'success': False,
+                    'message': f'Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters'
+                }), 400
+
+            request_hash = hashlib.sha256(request.get_data()).digest()
+            now = datetime.utcnow()
+            db.session.execute(db.delete(IdempotencyKey).where(IdempotencyKey.expires_at < now))
+            try:
+                db.session.execute(db.insert(IdempotencyKey).values(
+                    scope=scope, key=key, request_hash=request_hash,
+                    expires_at=now + app.config['IDEMPOTENCY_KEY_TTL']
+                ))
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                return replay_idempotent_response(db.session.get(IdempotencyKey, (scope, key)), request_hash)
+
+            claimed = db.and_(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+            try:
+                response = app.make_response(view(*args, **kwargs))
+            except Exception:
+                db.session.rollback()
+                db.session.execute(db.delete(IdempotencyKey).where(claimed))
+                db.session.commit()
+                raise
+            if response.status_code >= 500:
+                # Failed without a result worth keeping: let the client retry with the same key
+                db.session.execute(db.delete(IdempotencyKey).where(claimed))
+            else:
+                db.session.execute(
+                    db.update(IdempotencyKey).where(claimed).values(
+                        status_code=response.status_code,
+                        content_type=response.content_type,
+                        response_body=response.get_data()
+                    )
+                )
+            db.session.commit()
+            return response
+        return wrapper
+    return decorator
+
+def replay_idempotent_response(record, request_hash):
+    if record is not None and record.request_hash != request_hash:
+        return jsonify({
+            'success': False,
+            'message': 'This Idempotency-Key was already used for a different request'
+        }), 422
+    if record is None or record.status_code is None:
+        # Still running (or expired just now): the client should retry shortly with the same key
+        response = jsonify({'success': False, 'message': 'A request with this Idempotency-Key is still being processed'})
+        response.status_code = 409
+        response.headers['Retry-After'] = '1'
+        return response
+    response = app.response_class(record.response_body, status=record.status_code, content_type=record.content_type)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+# --- STOCK HOLDS ---
+CART_ID_MAX_LENGTH = 64
+
+def held_stock_clause(cart_id=None):
+    """Correlated SUM of the live holds on each ProductVariant row, other than `cart_id`'s own"""
+    conditions = [StockHold.product_variant_id == ProductVariant.id, StockHold.expires_at > datetime.utcnow()]
+    if cart_id is not None:
+        conditions.append(StockHold.cart_id != cart_id)
+    return db.select(db.func.coalesce(db.func.sum(StockHold.quantity), 0)).where(*conditions).scalar_subquery()
+
+def held_stock(variant_ids):
+    """{variant_id: quantity held by live carts}, one grouped query over the covering index"""
+    if not variant_ids:
+        return {}
+    return dict(db.session.execute(
+        db.select(StockHold.product_variant_id, db.func.sum(StockHold.quantity))
+        .where(StockHold.product_variant_id.in_(variant_ids), StockHold.expires_at > datetime.utcnow())
+        .group_by(StockHold.product_variant_id)
+    ).all())
+
+def add_available_stock(variants, variant_dicts):
+    """Set 'available' (stock not held by any cart) on serialized variants"""
+    held = held_stock({variant.id for variant in variants})
+    for variant, variant_data in zip(variants, variant_dicts):
+        variant_data['available'] = max(0, variant.stock_level - held.get(variant.id, 0))
+
+class StockHoldSweeper:
+    """Deletes expired holds in expiry order, from a background thread.
+
+    `next_expiry` is the soonest expiry this process knows of; the thread
+    sleeps until then (waking at least every `max_wait` seconds), so a sweep
+    that is not due costs one comparison. A due sweep is a range DELETE from
+    the front of the expires_at index plus a MIN() read of the same index.
+    The thread starts with the first hold this process places, so requests
+    never sweep themselves.
+    """
+    max_wait = 60
+
+    def __init__(self):
+        self.next_expiry = datetime.min
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def note(self, expires_at):
+        """Remember a new hold's expiry, starting the sweeper thread if needed"""
+        with self._lock:
+            if expires_at < self.next_expiry:
+                self.next_expiry = expires_at
+                self._wake.set()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='stock-hold-sweeper', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            due_in = (self.next_expiry - datetime.utcnow()).total_seconds()
+            self._wake.wait(timeout=min(max(due_in, 0), self.max_wait))
+            self._wake.clear()
+            try:
+                with app.app_context():
+                    self.sweep()
+            except Exception as e:
+                print(f"Error sweeping stock holds: {e}")
+
+    def sweep(self):
+        now = datetime.utcnow()
+        if self.next_expiry > now:
+            return 0
+        with self._lock:
+            if self.next_expiry > now:
+                return 0
+            deleted = db.session.execute(db.delete(StockHold).where(StockHold.expires_at <= now)).rowcount
+            next_expiry = db.session.execute(db.select(db.func.min(StockHold.expires_at))).scalar()
+            if deleted:
+                # Released stock shows up as available in the catalog again
+                catalog_cache.bump()
+            db.session.commit()
+            self.next_expiry = next_expiry or datetime.max
+        return deleted
+
+stock_hold_sweeper = StockHoldSweeper()
+
+@app.route('/api/cart/holds', methods=['PUT'])
+def put_cart_holds():
+    """Hold stock for the whole cart, replacing its previous holds and renewing their TTL.
+
+    Each line holds as much of the requested quantity as other carts leave
+    available, up to STOCK_HOLD_MAX_LINE_QUANTITY per line and
+    STOCK_HOLD_MAX_CART_QUANTITY per cart; the response reports what was
+    held so the cart can show it.
+    """
+    data = request.get_json(silent=True) or {}
+    cart_id = str(data.get('cart_id') or '')
+    if not cart_id or len(cart_id) > CART_ID_MAX_LENGTH:
+        return jsonify({'success': False, 'message': f'cart_id must be 1 to {CART_ID_MAX_LENGTH} characters'}), 400
+    requested = Counter()
+    for i, item in enumerate(data.get('items', [])):
+        try:
+            variant_id, quantity = int(item['product_variant_id']), int(item['quantity'])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'success': False, 'message': f'Invalid item {i+1}: product_variant_id and quantity must be integers'}), 400
+        if quantity < 0:
+            return jsonify({'success': False, 'message': f'Invalid quantity in item {i+1}: must not be negative'}), 400
+        if quantity:
+            requested[variant_id] += quantity
+
+    lock_for_write()
+    variants = load_sale_variants(requested, cart_id=cart_id)
+    now = datetime.utcnow()
+    previous = dict(db.session.execute(
+        db.select(StockHold.product_variant_id, StockHold.quantity)
+        .where(StockHold.cart_id == cart_id, StockHold.expires_at > now)
+    ).all())
+    db.session.execute(db.delete(StockHold).where(StockHold.cart_id == cart_id))
+    expires_at = now + app.config['STOCK_HOLD_TTL']
+    line_limit = app.config['STOCK_HOLD_MAX_LINE_QUANTITY']
+    cart_budget = app.config['STOCK_HOLD_MAX_CART_QUANTITY']
+    holds, rows = [], []
+    for variant_id, quantity in sorted(requested.items()):
+        row = variants.get(variant_id)
+        available = max(0, row.stock_level - row.held) if row else 0
+        held = min(quantity, available, line_limit, cart_budget)
+        cart_budget -= held
+        if held:
+            rows.append({'cart_id': cart_id, 'product_variant_id': variant_id, 'quantity': held, 'expires_at': expires_at})
+        holds.append({'product_variant_id': variant_id, 'requested': quantity, 'held': held, 'available': available})
+    if rows:
+        db.session.execute(db.insert(StockHold), rows)
+    if previous != {row['product_variant_id']: row['quantity'] for row in rows}:
+        # Renewing the same holds changes nothing others see; edits reach the catalog within the delay
+        bump_data_version_within(db.session.connection(), STOCK_HOLDS, app.config['STOCK_HOLD_CATALOG_DELAY'])
+    db.session.commit()
+    if rows:
+        stock_hold_sweeper.note(expires_at)
+
+    return jsonify({
+        'success': True,
+        'cart_id': cart_id,
+        'expires_at': expires_at.isoformat() + 'Z',
+        'holds': holds
+    })
+
+# --- STOCK ---
+def lock_for_write():
+    """Start the transaction with the write lock held, so what it reads stays true until commit.
+
+    SQLite otherwise defers the lock to the first write, and savepoints opened
+    before then would each commit on their own.
+    """
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(db.text('BEGIN IMMEDIATE'))
+
+class InsufficientStock(Exception):
+    """Some sale lines could not be filled; `shortages` has one dict per variant"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__('; '.join(shortage['message'] for shortage in shortages))
+
+def load_sale_variants(variant_ids, cart_id=None):
+    """Price, stock, held stock and label of every requested variant, in one query keyed by id.
+
+    `held` counts the live holds of every cart except `cart_id`.
+    """
+    if not variant_ids:
+        return {}
+    rows = db.session.execute(
+        db.select(ProductVariant.id, ProductVariant.selling_price, ProductVariant.stock_level,
+                  held_stock_clause(cart_id).label('held'),
+                  ProductVariant.quantity_value, ProductVariant.quantity_unit, Product.name)
+        .join(Product)
+        .where(ProductVariant.id.in_(variant_ids))
+    ).all()
+    return {row.id: row for row in rows}
+
+def stock_shortages(quantities, variants):
+    """Lines of {variant_id: quantity} that `variants` (from load_sale_variants) cannot fill"""
+    shortages = []
+    for variant_id, requested in sorted(quantities.items()):
+        row = variants.get(variant_id)
+        # Stock other carts are holding is not for sale
+        available = max(0, row.stock_level - row.held) if row else 0
+        if row and available >= requested:
+            continue
+        shortage = {
+            'product_variant_id': variant_id,
+            'requested': requested,
+            'available': available,
+        }
+        if row:
+            shortage['message'] = f"Only {available} left of {row.name} ({row.quantity_value}{row.quantity_unit}), {requested} requested"
+        else:
+            shortage['message'] = f"Product variant with ID {variant_id} not found"
+        shortages.append(shortage)
+    return shortages
+
+def take_stock(quantities, cart_id=None):
+    """Decrement stock for {variant_id: quantity} with one conditional UPDATE.
+
+    Each line only applies while stock_level, less what other carts than
+    `cart_id` are holding, covers its quantity at the moment the database
+    writes the row, so concurrent sales can never oversell. If any line
+    falls short this raises InsufficientStock, and the caller must roll
+    back the lines that did apply.
+    """
+    if not quantities:
+        return
+    needed = db.case(quantities, value=ProductVariant.id)
+    updated = db.session.execute(
+        db.update(ProductVariant)
+        .where(ProductVariant.id.in_(quantities), ProductVariant.stock_level - held_stock_clause(cart_id) >= needed)
+        .values(stock_level=ProductVariant.stock_level - needed)
+        .returning(ProductVariant.id)
+        .execution_options(synchronize_session='fetch')
+    ).scalars().all()
+    # Core UPDATEs skip the mapper events, so POS terminals hear about the new stock here
+    log_catalog_changes(db.session.connection(), 'variant', updated)
+
+    short_ids = set(quantities) - set(updated)
+    if short_ids:
+        short = {variant_id: quantities[variant_id] for variant_id in short_ids}
+        raise InsufficientStock(stock_shortages(short, load_sale_variants(short_ids, cart_id)))
+
+def insufficient_stock_response(error):
+    return jsonify({
+        'success': False,
+        'message': f'Not enough stock: {error}',
+        'errors': error.shortages
+    }), 409
+
+def place_order(customer, lines, variants, cart_id=None, ordered_at=None):
+    """Insert an order for [(variant_id, quantity)] lines and take its stock, without committing.
+
+    Prices come from `variants` (from load_sale_variants). Stock held for
+    `cart_id` is sold to this order and its holds released. `ordered_at`
+    defaults to now. Raises
+    InsufficientStock, after which the caller must roll back. Returns the
+    new order's id.
+    """
+    quantities = Counter()
+    for variant_id, quantity in lines:
+        quantities[variant_id] += quantity
+    order = Order(
+        total_amount=sum(variants[variant_id].selling_price * quantity for variant_id, quantity in lines),
+        **customer
+    )
+    if ordered_at is not None:
+        order.ordered_at = ordered_at
+    db.session.add(order)
+    db.session.flush()  # Get the order ID
+    # Read now: after commit the expired order would cost another SELECT
+    order_id = order.id
+
+    # Create order items with a single executemany
+    db.session.execute(db.insert(OrderItem), [
+        {
+            'order_id': order_id,
+            'product_variant_id': variant_id,
+            'quantity': quantity,
+            'price_at_purchase': variants[variant_id].selling_price
+        }
+        for variant_id, quantity in lines
+    ])
+
+    # Update stock levels, all lines or none; stock may have moved since `variants` was read
+    take_stock(quantities, cart_id)
+    if cart_id:
+        db.session.execute(db.delete(StockHold).where(StockHold.cart_id == cart_id))
+    record_daily_sales(db.session.connection(), 'online', [
+        (order.ordered_at, [(variant_id, quantity, variants[variant_id].selling_price) for variant_id, quantity in lines])
+    ])
+    return order_id
+
+# --- ORDER INTAKE JOURNAL ---
+ORDER_CUSTOMER_FIELDS = ('customer_name', 'customer_email', 'customer_phone', 'delivery_address')
+
+def lock_file(f, shared=False, blocking=True):
+    """flock an open file until it is closed; returns False if `blocking` is off and it is taken.
+
+    Without fcntl (Windows) this is a no-op and the caller runs as the only process.
+    """
+    if fcntl is None:
+        return True
+    operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    try:
+        fcntl.flock(f, operation if blocking else operation | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+class OrderIntakeJournal:
+    """Append-only file of accepted checkouts, drained into the database in batches.
+
+    Each entry is one JSON line, fsync'd before the customer gets its
+    reference, so an acknowledged order survives a crash. Any worker may
+    append; appends and the truncate after a drain both hold an exclusive
+    flock on the file, so nothing lands between the drain's size check and
+    the truncate. Every worker runs a drain thread, but only the one
+    holding the flock on <journal>.lock drains; the others take over if it
+    exits. The owner applies entries ORDER_INTAKE_BATCH_SIZE at a time, one
+    transaction per batch, recording each outcome in OrderIntake, and
+    truncates the file once everything in it has been applied. On taking
+    ownership it replays the whole file, skipping references OrderIntake
+    already has.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._draining = threading.Lock()
+        self._thread = None
+        self._path = None
+        # The open <journal>.lock while this process owns the journal, and how far the file has been applied
+        self._owner = None
+        self._offset = 0
+
+    def append(self, customer, lines, cart_id=None):
+        """Durably journal an order and return its provisional reference"""
+        reference = 'P' + secrets.token_hex(6).upper()
+        entry = {
+            'reference': reference,
+            'received_at': datetime.utcnow().isoformat(),
+            'customer': customer,
+            'lines': lines,
+            'cart_id': cart_id
+        }
+        data = (json.dumps(entry, separators=(',', ':')) + '\n').encode()
+        self.start()
+        with self._lock, open(self._path, 'ab') as f:
+            lock_file(f)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self._wake.set()
+        return reference
+
+    def is_pending(self, reference):
+        """Whether `reference` is still in the journal file, whichever worker appended it"""
+        try:
+            with open(self._journal_path(), 'rb') as f:
+                lock_file(f, shared=True)
+                data = f.read()
+        except FileNotFoundError:
+            return False
+        if reference.encode() not in data:
+            return False
+        return any(entry['reference'] == reference for entry in self._parse(data[:data.rfind(b'\n') + 1]))
+
+    def _journal_path(self):
+        # Read once: the owner's offset and lock file belong to one path
+        return self._path or app.config['ORDER_INTAKE_JOURNAL']
+
+    def start(self):
+        """Start this process's drain thread; it drains whenever this process owns the journal"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._path = self._journal_path()
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name='order-intake', daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(timeout=5)
+            self._wake.clear()
+            try:
+                with app.app_context():
+                    self.drain()
+            except Exception as e:
+                print(f"Error draining order journal: {e}")
+
+    @staticmethod
+    def _parse(data):
+        entries = []
+        for line in data.splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                entry = None
+            if isinstance(entry, dict) and 'reference' in entry:
+                entries.append(entry)
+            else:
+                print(f"Skipping unreadable order journal line: {line[:80]!r}")
+        return entries
+
+    def drain(self):
+        """Apply every journaled entry not applied yet; returns how many were processed.
+
+        Returns None without reading the file while another process owns the journal.
+        """
+        with self._draining:
+            self._path = self._journal_path()
+            if not self._take_ownership():
+                return None
+            return self._drain()
+
+    def _take_ownership(self):
+        if self._owner is not None:
+            return True
+        owner = open(self._path + '.lock', 'ab')
+        if not lock_file(owner, blocking=False):
+            owner.close()
+            return False
+        self._owner = owner
+        with open(self._path, 'ab+') as f:
+            lock_file(f)
+            f.seek(0)
+            data = f.read()
+            # A torn last line was never acknowledged; drop it so appends start on a fresh line
+            complete = data.rfind(b'\n') + 1
+            if complete < len(data):
+                f.truncate(complete)
+        # Replay whatever the previous owner left from the start
+        self._offset = 0
+        return True
+
+    def _drain(self):
+        processed = 0
+        while True:
+            try:
+                with open(self._path, 'rb') as f:
+                    lock_file(f, shared=True)
+                    f.seek(self._offset)
+                    data = f.read()
+            except FileNotFoundError:
+                return processed
+            data = data[:data.rfind(b'\n') + 1]
+            if not data:
+                return processed
+            entries = self._parse(data)
+            batch_size = app.config['ORDER_INTAKE_BATCH_SIZE']
+            for start in range(0, len(entries), batch_size):
+                self._apply(entries[start:start + batch_size])
+            processed += len(entries)
+            self._offset += len(data)
+            with open(self._path, 'rb+') as f:
+                lock_file(f)
+                if os.fstat(f.fileno()).st_size == self._offset:
+                    # Everything in the file is in the database now
+                    f.truncate(0)
+                    self._offset = 0
+
+    @classmethod
+    def _apply(cls, entries):
+        """Apply a batch; when it fails for a reason other than stock, apply its entries
+        one at a time so only the entry at fault is recorded as failed"""
+        try:
+            apply_order_intake_batch(entries)
+        except OperationalError:
+            # The database itself is unavailable: leave the batch for the next wake
+            db.session.rollback()
+            raise
+        except Exception as e:
+            db.session.rollback()
+            if len(entries) > 1:
+                for entry in entries:
+                    cls._apply([entry])
+            else:
+                record_failed_order_intake(entries[0], e)
+
+order_intake = OrderIntakeJournal()
+
+def apply_order_intake_batch(entries):
+    """Turn journal entries into orders in one transaction, recording each outcome in OrderIntake"""
+    # Taking the write lock first also keeps the per-order savepoints below inside one transaction
+    lock_for_write()
+    references = [entry['reference'] for entry in entries]
+    applied = set(db.session.execute(
+        db.select(OrderIntake.reference).where(OrderIntake.reference.in_(references))
+    ).scalars())
+    entries = [entry for entry in entries if entry['reference'] not in applied]
+    variant_ids = {variant_id for entry in entries for variant_id, _ in entry['lines']}
+    # Only prices and names are taken from here; take_stock() checks stock and holds itself
+    variants = load_sale_variants(variant_ids)
+
+    for entry in entries:
+        lines = [(variant_id, quantity) for variant_id, quantity in entry['lines']]
+        outcome = OrderIntake(reference=entry['reference'], received_at=datetime.fromisoformat(entry['received_at']))
+        unknown = {variant_id: quantity for variant_id, quantity in lines if variant_id not in variants}
+        try:
+            if unknown:
+                raise InsufficientStock(stock_shortages(unknown, variants))
+            with db.session.begin_nested():
+                # Dated when the customer placed it, not when the drain got to it
+                outcome.order_id = place_order(entry['customer'], lines, variants, entry.get('cart_id'),
+                                               ordered_at=outcome.received_at)
+            outcome.status = 'confirmed'
+        except InsufficientStock as e:
+            outcome.status = 'rejected'
+            outcome.errors = json.dumps(e.shortages)
+        db.session.add(outcome)
+    catalog_cache.bump()
+    db.session.commit()
+
+def record_failed_order_intake(entry, error):
+    """Record a journal entry that cannot be applied, so it no longer holds up the ones behind it"""
+    print(f"Order journal entry {entry['reference']} failed: {error!r}")
+    try:
+        received_at = datetime.fromisoformat(entry['received_at'])
+    except (KeyError, TypeError, ValueError):
+        received_at = datetime.utcnow()
+    db.session.add(OrderIntake(
+        reference=entry['reference'], status='failed', received_at=received_at,
+        errors=json.dumps([{'message': f'{type(error).__name__}: {error}'}])
+    ))
+    db.session.commit()
+
+@app.before_request
+def start_order_intake():
+    # Replays anything a crashed run left in the journal as soon as the app serves again;
+    # every worker starts one, and whichever owns the journal drains it
+    if app.config['ORDER_INTAKE_MODE'] == 'journal':
+        order_intake.start()
+
+@app.route('/api/orders/intake/<reference>')
+def order_intake_status(reference):
+    """Where a journaled checkout stands: queued, confirmed (with its order id), rejected or failed"""
+    outcome = db.session.get(OrderIntake, reference)
+    if outcome is None:
+        if order_intake.is_pending(reference):
+            response = jsonify({'reference': reference, 'status': 'queued', 'order_id': None})
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        # The drain commits before it truncates, so an entry gone from the file is in the table
+        outcome = db.session.get(OrderIntake, reference)
+        if outcome is None:
+            return jsonify({'error': 'Unknown order reference'}), 404
+    body = {'reference': reference, 'status': outcome.status, 'order_id': outcome.order_id}
+    if outcome.status == 'confirmed':
+        body['message'] = f'Order submitted successfully! Order ID: {outcome.order_id}'
+    elif outcome.status == 'rejected':
+        body['errors'] = json.loads(outcome.errors)
+        body['message'] = 'Not enough stock: ' + '; '.join(error['message'] for error in body['errors'])
+    else:
+        body['errors'] = json.loads(outcome.errors)
+        body['message'] = f'Your order could not be processed. Please contact us quoting reference {reference}.'
+    response = jsonify(body)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.cli.command('drain-order-journal')
+def drain_order_journal_command():
+    """Apply every order waiting in the intake journal (e.g. after a crash, without serving)"""
+    order_intake.start()
+    processed = order_intake.drain()
+    if processed is None:
+        print("Another process owns the order journal and is draining it.")
+    else:
+        print(f"Applied {processed} journaled orders.")
+
+# --- TILL SESSIONS ---
+DEFAULT_TILL = 'main'
+TILL_NAME_MAX_LENGTH = 50
+CASH_PAYMENT_MODE = 'Cash'
+
+def sale_till(data):
+    """(till, cashier) a POS sale is counted under; the cashier defaults to whoever is logged in"""
+    till = str(data.get('till') or DEFAULT_TILL)[:TILL_NAME_MAX_LENGTH]
+    cashier = str(data.get('cashier') or session.get('admin_username') or 'admin')[:TILL_NAME_MAX_LENGTH]
+    return till, cashier
+
+def open_till_session_id(till, opened_by=None):
+    """Id of the open session of `till`, opening one if the till has none"""
+    session_id = db.session.execute(
+        db.select(TillSession.id).where(TillSession.till == till, TillSession.closed_at.is_(None))
+    ).scalar()
+    if session_id is None:
+        session_id = db.session.execute(
+            db.insert(TillSession).values(till=till, opened_by=opened_by, opened_at=datetime.utcnow())
+            .returning(TillSession.id)
+        ).scalar()
+    return session_id
+
+def count_till_sales(sales):
+    """Add [(till, cashier, sale values)] to the running totals of their open till sessions.
+
+    Call it in the transaction that records the sales, so the totals always
+    match what was sold. Costs one UPDATE (or INSERT) per cashier and payment
+    mode rather than per sale.
+    """
+    sums = {}
+    for till, cashier, sale in sales:
+        key = (till, cashier, sale['payment_mode'])
+        count, total_cost, amount_paid, change_given = sums.get(key, (0, 0.0, 0.0, 0.0))
+        sums[key] = (count + 1, total_cost + sale['total_cost'], amount_paid + sale['amount_paid'], change_given + sale['change_given'])
+
+    session_ids = {}
+    table = TillTotal.__table__
+    for (till, cashier, payment_mode), (count, total_cost, amount_paid, change_given) in sums.items():
+        if till not in session_ids:
+            session_ids[till] = open_till_session_id(till, opened_by=cashier)
+        key = (table.c.till_session_id == session_ids[till], table.c.cashier == cashier, table.c.payment_mode == payment_mode)
+        result = db.session.execute(
+            table.update().where(*key).values(
+                sale_count=table.c.sale_count + count,
+                total_cost=table.c.total_cost + total_cost,
+                amount_paid=table.c.amount_paid + amount_paid,
+                change_given=table.c.change_given + change_given
+            )
+        )
+        if result.rowcount == 0:
+            db.session.execute(table.insert().values(
+                till_session_id=session_ids[till], cashier=cashier, payment_mode=payment_mode,
+                sale_count=count, total_cost=total_cost, amount_paid=amount_paid, change_given=change_given
+            ))
+
+def till_report(till_session, counted_cash=None):
+    """Totals of a till session by payment mode and by cashier, from its counters alone"""
+    payment_modes, cashiers = {}, {}
+    totals = {'sales': 0, 'total_cost': 0.0, 'amount_paid': 0.0, 'change_given': 0.0}
+    rows = db.session.execute(
+        db.select(TillTotal).where(TillTotal.till_session_id == till_session.id)
+        .order_by(TillTotal.cashier, TillTotal.payment_mode)
+    ).scalars()
+    for row in rows:
+        for group in (payment_modes.setdefault(row.payment_mode, dict.fromkeys(totals, 0)),
+                      cashiers.setdefault(row.cashier, dict.fromkeys(totals, 0)),
+                      totals):
+            group['sales'] += row.sale_count
+            group['total_cost'] += row.total_cost
+            group['amount_paid'] += row.amount_paid
+            group['change_given'] += row.change_given
+    for group in list(payment_modes.values()) + list(cashiers.values()) + [totals]:
+        # What stayed in the till or the account once change was handed back
+        group['net'] = group['amount_paid'] - group['change_given']
+        for name in ('total_cost', 'amount_paid', 'change_given', 'net'):
+            group[name] = round(group[name], 2)
+
+    cash = payment_modes.get(CASH_PAYMENT_MODE, {}).get('net', 0.0)
+    expected_cash = round(till_session.opening_float + cash, 2)
+    return {
+        'id': till_session.id,
+        'till': till_session.till,
+        'opening_float': till_session.opening_float,
+        'opened_by': till_session.opened_by,
+        'opened_at': till_session.opened_at.isoformat() + 'Z',
+        'closed_by': till_session.closed_by,
+        'closed_at': till_session.closed_at.isoformat() + 'Z' if till_session.closed_at else None,
+        'payment_modes': payment_modes,
+        'cashiers': cashiers,
+        'totals': totals,
+        'expected_cash': expected_cash,
+        'counted_cash': counted_cash,
+        'cash_variance': round(counted_cash - expected_cash, 2) if counted_cash is not None else None
+    }
+
+@event.listens_for(TillSession, 'before_update')
+def _keep_z_reports_frozen(mapper, connection, target):
+    closed_at = db.inspect(target).attrs.closed_at.history
+    if (closed_at.deleted or closed_at.unchanged or [None])[0] is not None:
+        raise ValueError(f'Till session {target.id} is closed and its Z-report cannot change')
+
+def till_request_data():
+    """JSON body and till name of a till API call, or an error response"""
+    data = request.get_json(silent=True) or {}
+    till = str(data.get('till') or DEFAULT_TILL)
+    if len(till) > TILL_NAME_MAX_LENGTH:
+        return data, None, (jsonify({'success': False, 'message': f'till must be at most {TILL_NAME_MAX_LENGTH} characters'}), 400)
+    return data, till, None
+
+@app.route('/api/till/open', methods=['POST'])
+def open_till():
+    """Start a till session with the float counted into the drawer"""
+    if not session.get('admin_logged_in'):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    data, till, error = till_request_data()
+    if error:
+        return error
+    try:
+        opening_float = float(data.get('opening_float') or 0)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'opening_float must be a number'}), 400
+
+    lock_for_write()
+    if TillSession.query.filter_by(till=till, closed_at=None).first():
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Till {till} is already open'}), 409
+    till_session = TillSession(till=till, opening_float=opening_float, opened_by=session.get('admin_username'))
+    db.session.add(till_session)
+    db.session.commit()
+    return jsonify({'success': True, 'session': till_report(till_session)}), 201
+
+@app.route('/api/till/current')
+def current_till():
+    """Running totals of the open session (an X-report); nothing is frozen"""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    till = request.args.get('till') or DEFAULT_TILL
+    till_session = TillSession.query.filter_by(till=till, closed_at=None).first()
+    if till_session is None:
+        return jsonify({'error': f'Till {till} is not open'}), 404
+    return jsonify({'report': till_report(till_session)})
+
+@app.route('/api/till/close', methods=['POST'])
+def close_till():
+    """Close the open session of a till and freeze its Z-report.
+
+    The report is read from the session's counters, so it costs the same
+    however many sales the day had. With counted_cash, it also records how
+    far the drawer is from the float plus net cash sales.
+    """
+    if not session.get('admin_logged_in'):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    data, till, error = till_request_data()
+    if error:
+        return error
+    counted_cash = data.get('counted_cash')
+    if counted_cash is not None:
+        try:
+            counted_cash = float(counted_cash)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': 'counted_cash must be a number'}), 400
+
+    # Sales wait for the close, so none lands in a session after its report is taken
+    lock_for_write()
+    till_session = TillSession.query.filter_by(till=till, closed_at=None).first()
+    if till_session is None:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Till {till} is not open'}), 409
+    # Everything is written in one flush; a closed session never changes again
+    with db.session.no_autoflush:
+        till_session.closed_at = datetime.utcnow()
+        till_session.closed_by = session.get('admin_username')
+        report = till_report(till_session, counted_cash)
+        till_session.z_report = json.dumps(report)
+    db.session.commit()
+    return jsonify({'success': True, 'report': report})
+
+@app.route('/api/till/reports/<int:session_id>')
+def get_till_report(session_id):
+    """A frozen Z-report, exactly as it was taken at close"""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    till_session = db.session.get(TillSession, session_id)
+    if till_session is None or till_session.z_report is None:
+        return jsonify({'error': 'No closed till session with this id'}), 404
+    return json_response(till_session.z_report.encode('utf-8'))
+
+# --- API ROUTES FOR MANUAL SALES ---
+def serialize_products(products, fields=None, variant_fields=None):
+    with_variants = 'variants' in (fields or PRODUCT_FIELDS)
+    with_display_name = with_variants and (variant_fields is None or 'display_name' in variant_fields)
+    result = []
+    variants, variant_dicts = [], []
+    for product in products:
+        product_data = product.to_dict(fields, variant_fields)
+        if with_display_name:
+            for variant, variant_data in zip(product.variants, product_data['variants']):
+                variant_data['display_name'] = f"{product.name} ({variant.quantity_value}{variant.quantity_unit})"
+        if with_variants:
+            variants.extend(product.variants)
+            variant_dicts.extend(product_data['variants'])
+        result.append(product_data)
+    if with_variants and (variant_fields is None or 'available' in variant_fields):
+        add_available_stock(variants, variant_dicts)
+    return result
+
+def catalog_first_page_body():
+    """Encoded body of a bare /api/products request, shared with the home page"""
+    cache_key = ('products', ())
+    body = catalog_cache.get(cache_key)
+    if body is None:
+        catalog_version = catalog_cache.sync()
+        products, next_cursor = keyset_page(
+            Product.query.options(*product_load_options(None, None)), (Product.name, Product.id), None, CATALOG_PAGE_SIZE
+        )
+        body = json_body({
+            'products': serialize_products(products),
+            'next_cursor': next_cursor,
+            'fuzzy': False,
+            'facets': facet_counts()
+        })
+        catalog_cache.put(cache_key, catalog_version, body)
+    return body
+
+@app.route('/api/products')
+@versioned_etag('catalog')
+def get_products():
+    if not request.args:
+        return json_response(catalog_first_page_body())
+    search = request.args.get('search', '').strip()
+    cache_key = None
+    if not search:
+        cache_key = ('products', tuple(sorted(request.args.items(multi=True))))
+        body = catalog_cache.get(cache_key)
+        if body is not None:
+            return json_response(body)
+    catalog_version = catalog_cache.sync()
+    
+    try:
+        fields, variant_fields = get_requested_fields(PRODUCT_FIELDS, 'variants', VARIANT_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    load_options = product_load_options(fields, variant_fields)
+    
+    products_query = Product.query.options(*load_options)
+    sort_columns = (Product.name, Product.id)
+    
+    match = fts_match_expression(search) if search else ''
+    if match and search_index_available():
+        # Ranked prefix search, best matches first
+        ranking = search_ranking('product_fts', match, PRODUCT_SEARCH_WEIGHTS)
+        products_query = products_query.join(ranking, ranking.c.id == Product.id)
+        sort_columns = (ranking.c.rank, Product.id)
+    elif search:
+        products_query = products_query.filter(
+            db.or_(
+                Product.name.ilike(f'%{search}%'),
+                Product.description.ilike(f'%{search}%')
+            )
+        )
+    
+    try:
+        products_query = apply_catalog_filters(products_query)
+        products, next_cursor = keyset_page(
+            products_query, sort_columns, request.args.get('cursor'), get_page_limit()
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Nothing matched as typed: fall back to the closest names ("pestiside" -> "Pesticide")
+    fuzzy = False
+    if search and not products and not request.args.get('cursor'):
+        ranked = trigram_index.search(search, get_page_limit())
+        if ranked:
+            fuzzy = True
+            products_by_id = {
+                product.id: product
+                for product in apply_catalog_filters(Product.query).options(*load_options).filter(
+                    Product.id.in_([product_id for product_id, _ in ranked])
+                )
+            }
+            products = [products_by_id[product_id] for product_id, _ in ranked if product_id in products_by_id]
+    
+    payload = {
+        'products': serialize_products(products, fields, variant_fields),
+        'next_cursor': next_cursor,
+        'fuzzy': fuzzy
+    }
+    if not request.args.get('cursor'):
+        # Catalog-wide counts for the filter bar, read from the maintained aggregate table
+        payload['facets'] = facet_counts()
+    body = json_body(payload)
+    if cache_key:
+        catalog_cache.put(cache_key, catalog_version, body)
+    return json_response(body)
+
+@app.route('/api/product-variants')
+@versioned_etag('catalog')
+def get_product_variants():
+    search = request.args.get('search', '').strip()
+    cache_key = None
+    if not search:
+        cache_key = ('product-variants', tuple(sorted(request.args.items(multi=True))))
+        body = catalog_cache.get(cache_key)
+        if body is not None:
+            return json_response(body)
+    catalog_version = catalog_cache.sync()
+    
+    try:
+        fields, _ = get_requested_fields(VARIANT_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    product_loader = db.contains_eager(ProductVariant.product)
+    variants_query = ProductVariant.query.join(Product)
+    if fields is not None:
+        product_loader = product_loader.load_only(Product.name)
+        variants_query = variants_query.options(db.load_only(*variant_columns(fields)))
+    variants_query = variants_query.options(product_loader)
+    sort_columns = (Product.name, ProductVariant.id)
+    
+    match = fts_match_expression(search) if search else ''
+    if match and search_index_available():
+        ranking = search_ranking('variant_fts', match, VARIANT_SEARCH_WEIGHTS)
+        variants_query = variants_query.join(ranking, ranking.c.id == ProductVariant.id)
+        sort_columns = (ranking.c.rank, ProductVariant.id)
+    elif search:
+        variants_query = variants_query.filter(
+            db.or_(
+                Product.name.ilike(f'%{search}%'),
+                ProductVariant.quantity_unit.ilike(f'%{search}%'),
+                ProductVariant.supplier.ilike(f'%{search}%')
+            )
+        )
+    
+    try:
+        variants, next_cursor = keyset_page(
+            variants_query, sort_columns, request.args.get('cursor'), get_page_limit()
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    result = []
+    for variant in variants:
+        variant_data = variant.to_dict(fields=fields)
+        if fields is None or 'display_name' in fields:
+            variant_data['display_name'] = f"{variant.product.name} ({variant.quantity_value}{variant.quantity_unit}) - KSh {variant.selling_price}"
+        result.append(variant_data)
+    if fields is None or 'available' in fields:
+        add_available_stock(variants, result)
+    
+    body = json_body({
+        'variants': result,
+        'next_cursor': next_cursor
+    })
+    if cache_key:
+        catalog_cache.put(cache_key, catalog_version, body)
+    return json_response(body)
+
+@app.route('/api/variants/suggest')
+def suggest_variants():
+    """Typeahead for the manual sale screen, answered from the in-memory prefix index"""
+    try:
+        limit = int(request.args.get('limit', SUGGEST_LIMIT))
+    except (TypeError, ValueError):
+        limit = SUGGEST_LIMIT
+    limit = max(1, min(limit, SUGGEST_MAX_LIMIT))
+    variant_ids = variant_suggest_index.suggest(request.args.get('q', ''), limit)
+    if not variant_ids:
+        return jsonify({'suggestions': []})
+
+    # Price and stock change on every sale, so read them fresh by primary key
+    variants = ProductVariant.query.join(Product).options(
+        db.contains_eager(ProductVariant.product)
+    ).filter(ProductVariant.id.in_(variant_ids)).all()
+    variants_by_id = {variant.id: variant for variant in variants}
+
+    suggestions = []
+    for variant_id in variant_ids:
+        variant = variants_by_id.get(variant_id)
+        if variant is None:
+            continue
+        variant_data = variant.to_dict()
+        variant_data['display_name'] = f"{variant.product.name} ({variant.quantity_value}{variant.quantity_unit}) - KSh {variant.selling_price}"
+        suggestions.append(variant_data)
+    return jsonify({'suggestions': suggestions})
+
+@app.route('/api/variants/by-code/<code>')
+def get_variant_by_code(code):
+    """One barcode scan, answered from the in-memory code map"""
+    code = normalize_variant_code(code)
+    variant = variants_by_code([code]).get(code)
+    if variant is None:
+        return jsonify({'error': f'No product variant has code {code}'}), 404
+    return jsonify({'variant': variant})
+
+@app.route('/api/variants/by-code', methods=['POST'])
+def get_variants_by_codes():
+    """A stack of scans in one call; codes nothing carries come back under 'missing'"""
+    data = request.get_json(silent=True) or {}
+    codes = data.get('codes')
+    if not isinstance(codes, list) or not codes:
+        return jsonify({'success': False, 'message': 'codes must be a non-empty list'}), 400
+    if len(codes) > VARIANT_CODE_BATCH_LIMIT:
+        return jsonify({'success': False, 'message': f'At most {VARIANT_CODE_BATCH_LIMIT} codes per lookup'}), 400
+    codes = list(dict.fromkeys(normalize_variant_code(code) for code in codes))
+    variants = variants_by_code(codes)
+    return jsonify({
+        'success': True,
+        'variants': variants,
+        'missing': [code for code in codes if code not in variants]
+    })
+
+def testimonials_body():
+    cache = snapshot_caches['testimonials']
+    body = cache.get('approved')
+    if body is None:
+        version = cache.sync()
+        testimonials = Testimonial.query.filter_by(is_approved=True).order_by(Testimonial.created_at.desc()).all()
+        body = json_body([{
+            'id': testimonial.id,
+            'author_name': testimonial.author_name,
+            'author_position': testimonial.author_position,
+            'text': testimonial.text,
+            'image_url': testimonial.image_url,
+            'created_at': testimonial.created_at.isoformat() if testimonial.created_at else None
+        } for testimonial in testimonials])
+        cache.put('approved', version, body)
+    return body
+
+@app.route('/api/testimonials')
+@versioned_etag('testimonials')
+def get_testimonials():
+    try:
+        return json_response(testimonials_body())
+    except Exception as e:
+        print(f"Error in get_testimonials: {e}")
+        return jsonify({
+            'error': 'Failed to load testimonials',
+            'message': str(e)
+        }), 500
+
+def faqs_body():
+    cache = snapshot_caches['faqs']
+    body = cache.get('all')
+    if body is None:
+        version = cache.sync()
+        faqs = FAQ.query.order_by(FAQ.display_order, FAQ.id).all()
+        body = json_body([{
+            'id': faq.id,
+            'question': faq.question,
+            'answer': faq.answer,
+            'display_order': faq.display_order
+        } for faq in faqs])
+        cache.put('all', version, body)
+    return body
+
+@app.route('/api/faqs')
+@versioned_etag('faqs')
+def get_faqs():
+    try:
+        return json_response(faqs_body())
+    except Exception as e:
+        print(f"Error in get_faqs: {e}")
+        return jsonify({
+            'error': 'Failed to load FAQs',
+            'message': str(e)
+        }), 500
+
+@app.route('/api/contact', methods=['POST'])
+def submit_contact():
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'success': False, 'message': 'No data received'}), 400
+        
+        # Create contact message
+        contact_msg = ContactMessage(
+            name=data.get('name', ''),
+            email=data.get('email', ''),
+            phone=data.get('phone', ''),
+            subject=data.get('subject', 'General Inquiry'),
+            message=data.get('message', '')
+        )
+        db.session.add(contact_msg)
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'message': 'Contact message received successfully!'
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error processing contact form: {str(e)}'
+        }), 500
+
+@app.route('/api/cart/validate', methods=['POST'])
+def validate_cart():
+    """Current price and stock for every cart line in one query, with what changed since the client saved it.
+
+    Lines are reported in the order sent. `changes` lists each difference
+    from the client's copy: 'price' (selling_price moved), 'stock' (fewer
+    available than in the cart) or 'removed' (the variant no longer exists).
+    """
+    data = request.get_json(silent=True) or {}
+    cart_items = data.get('items', [])
+    if not isinstance(cart_items, list):
+        return jsonify({'success': False, 'message': 'items must be a list'}), 400
+    lines = []
+    for i, item in enumerate(cart_items):
+        try:
+            variant_id, quantity = int(item['product_variant_id']), int(item['quantity'])
+            client_price = float(item['selling_price']) if item.get('selling_price') is not None else None
+        except (KeyError, TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'message': f'Invalid item {i+1}: product_variant_id and quantity must be integers'
+            }), 400
+        lines.append((variant_id, quantity, client_price))
+
+    # Stock this cart holds counts as available to it
+    cart_id = str(data['cart_id']) if data.get('cart_id') else None
+    variants = load_sale_variants({variant_id for variant_id, _, _ in lines}, cart_id)
+
+    result, changes, total = [], [], 0.0
+    for variant_id, quantity, client_price in lines:
+        row = variants.get(variant_id)
+        if row is None:
+            result.append({'product_variant_id': variant_id, 'quantity': quantity, 'found': False, 'available': 0})
+            changes.append({'product_variant_id': variant_id, 'change': 'removed'})
+            continue
+        available = max(0, row.stock_level - row.held)
+        result.append({
+            'product_variant_id': variant_id,
+            'quantity': quantity,
+            'found': True,
+            'product_name': row.name,
+            'quantity_value': row.quantity_value,
+            'quantity_unit': row.quantity_unit,
+            'selling_price': row.selling_price,
+            'available': available,
+            'line_total': row.selling_price * quantity
+        })
+        total += row.selling_price * quantity
+        if client_price is not None and client_price != row.selling_price:
+            changes.append({'product_variant_id': variant_id, 'change': 'price', 'was': client_price, 'now': row.selling_price})
+        if available < quantity:
+            changes.append({'product_variant_id': variant_id, 'change': 'stock', 'was': quantity, 'now': available})
+
+    response = jsonify({
+        'success': True,
+        'valid': not changes,
+        'lines': result,
+        'changes': changes,
+        'total': total
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/api/submit-full-order', methods=['POST'])
+@idempotent('submit-full-order')
 def submit_full_order():
     """Submit a full order from the cart"""
     try:
@@ -1027,11 +3761,6 @@ def submit_full_order():
         if not data:
             return jsonify({'success': False, 'message': 'No data received'}), 400
         
-        # Extract order details
-        customer_name = data.get('customer_name', '')
-        customer_email = data.get('customer_email', '')
-        customer_phone = data.get('customer_phone', '')
-        delivery_address = data.get('delivery_address', '')
         cart_items = data.get('items', [])
         
         # Debug logging
@@ -1053,67 +3782,58 @@ def submit_full_order():
                     'success': False, 
                     'message': f'Missing quantity in item {i+1}'
                 }), 400
-            if 'selling_price' not in item:
-                return jsonify({
-                    'success': False, 
-                    'message': f'Missing selling_price in item {i+1}. Available fields: {list(item.keys())}'
-                }), 400
             
-            # Validate data types
+            # Validate data types; prices come from the database, so a client selling_price is ignored
             try:
+                int(item['product_variant_id'])
                 int(item['quantity'])
-                float(item['selling_price'])
             except (ValueError, TypeError):
                 return jsonify({
                     'success': False,
-                    'message': f'Invalid data types in item {i+1}. quantity must be a number, selling_price must be a number. Received: quantity={item["quantity"]} ({type(item["quantity"])}), selling_price={item["selling_price"]} ({type(item["selling_price"])})'
+                    'message': f'Invalid data types in item {i+1}. product_variant_id and quantity must be integers. Received: product_variant_id={item["product_variant_id"]}, quantity={item["quantity"]} ({type(item["quantity"])})'
                 }), 400
-        
-        # Calculate total amount with proper type conversion
-        total_amount = 0
-        for item in cart_items:
-            try:
-                selling_price = float(item['selling_price'])
-                quantity = int(item['quantity'])
-                total_amount += selling_price * quantity
-            except (ValueError, TypeError) as e:
+            if int(item['quantity']) < 1:
                 return jsonify({
                     'success': False,
-                    'message': f'Invalid data type in item {cart_items.index(item)+1}. selling_price: {item.get("selling_price")} ({type(item.get("selling_price"))}), quantity: {item.get("quantity")} ({type(item.get("quantity"))})'
+                    'message': f'Invalid quantity in item {i+1}: must be at least 1'
                 }), 400
         
-        # Create the order
-        order = Order(
-            customer_name=customer_name,
-            customer_email=customer_email,
-            customer_phone=customer_phone,
-            delivery_address=delivery_address,
-            total_amount=total_amount
-        )
-        db.session.add(order)
-        db.session.flush()  # Get the order ID
+        # Resolve every line in one query for authoritative prices and stock
+        lines = [(int(item['product_variant_id']), int(item['quantity'])) for item in cart_items]
+        quantities = Counter()
+        for variant_id, quantity in lines:
+            quantities[variant_id] += quantity
+        # Stock this cart holds counts as available to it
+        cart_id = str(data['cart_id']) if data.get('cart_id') else None
+        variants = load_sale_variants(quantities, cart_id)
+        shortages = stock_shortages(quantities, variants)
+        if shortages:
+            return insufficient_stock_response(InsufficientStock(shortages))
         
-        # Create order items
-        for item in cart_items:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_variant_id=item['product_variant_id'],
-                quantity=item['quantity'],
-                price_at_purchase=item['selling_price']
-            )
-            db.session.add(order_item)
-            
-            # Update stock level
-            variant = ProductVariant.query.get(item['product_variant_id'])
-            if variant:
-                variant.stock_level = max(0, variant.stock_level - item['quantity'])
+        customer = {field: data.get(field, '') for field in ORDER_CUSTOMER_FIELDS}
+        if app.config['ORDER_INTAKE_MODE'] == 'journal':
+            # Acknowledge now; the drain thread writes the order (or rejects it if stock ran out meanwhile)
+            reference = order_intake.append(customer, lines, cart_id)
+            return jsonify({
+                'status': 'accepted',
+                'message': f'Order received! Reference: {reference}',
+                'reference': reference,
+                'status_url': url_for('order_intake_status', reference=reference)
+            }), 202
         
+        try:
+            order_id = place_order(customer, lines, variants, cart_id)
+        except InsufficientStock as e:
+            db.session.rollback()
+            return insufficient_stock_response(e)
+        
+        catalog_cache.bump()
         db.session.commit()
         
         return jsonify({
             'status': 'success',
-            'message': f'Order submitted successfully! Order ID: {order.id}',
-            'order_id': order.id
+            'message': f'Order submitted successfully! Order ID: {order_id}',
+            'order_id': order_id
         })
         
     except Exception as e:
@@ -1126,7 +3846,67 @@ def submit_full_order():
             'message': f'Error submitting order: {str(e)}'
         }), 500
 
+MANUAL_SALE_BATCH_LIMIT = 500
+
+def parse_manual_sale(data):
+    """OfflineSale column values and [(variant_id, quantity, price)] lines from a POS sale; ValueError if malformed"""
+    for field in ('total_cost', 'amount_paid', 'payment_mode', 'items'):
+        if field not in data:
+            raise ValueError(f'Missing required field: {field}')
+    if not data['items']:
+        raise ValueError('No items in sale')
+    lines = []
+    for i, item in enumerate(data['items']):
+        if 'product_variant_id' not in item:
+            raise ValueError('Missing product_variant_id in item')
+        try:
+            variant_id, quantity, price = int(item['product_variant_id']), int(item['quantity']), float(item['price'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'Invalid item {i+1}: product_variant_id and quantity must be integers and price a number')
+        if quantity < 1:
+            raise ValueError(f'Invalid quantity for product variant {variant_id}: must be at least 1')
+        lines.append((variant_id, quantity, price))
+    try:
+        sale = {
+            'customer_name': data.get('customer_name', ''),
+            'total_cost': float(data['total_cost']),
+            'amount_paid': float(data['amount_paid']),
+            'change_given': float(data.get('change_given') or 0),
+            'payment_mode': data['payment_mode'],
+            'sale_date': datetime.utcnow()
+        }
+        if data.get('sold_at'):
+            # When the till rang the sale up, which may be well before it synced
+            sold_at = datetime.fromisoformat(data['sold_at'])
+            if sold_at.tzinfo:
+                sold_at = sold_at.astimezone(timezone.utc).replace(tzinfo=None)
+            sale['sale_date'] = sold_at
+    except (TypeError, ValueError):
+        raise ValueError('total_cost, amount_paid and change_given must be numbers and sold_at an ISO timestamp')
+    return sale, lines
+
+def sale_quantities(lines):
+    quantities = Counter()
+    for variant_id, quantity, _ in lines:
+        quantities[variant_id] += quantity
+    return quantities
+
+def insert_offline_sales(sales):
+    """Bulk-insert [(sale values, lines)] as OfflineSale and OfflineSaleItem rows; returns the sale ids in order"""
+    sale_ids = db.session.execute(
+        db.insert(OfflineSale).returning(OfflineSale.id, sort_by_parameter_order=True),
+        [sale for sale, _ in sales]
+    ).scalars().all()
+    db.session.execute(db.insert(OfflineSaleItem), [
+        {'offline_sale_id': sale_id, 'product_variant_id': variant_id, 'quantity': quantity, 'price_at_sale': price}
+        for sale_id, (_, lines) in zip(sale_ids, sales)
+        for variant_id, quantity, price in lines
+    ])
+    record_daily_sales(db.session.connection(), 'offline', [(sale['sale_date'], lines) for sale, lines in sales])
+    return sale_ids
+
 @app.route('/api/manual-sale', methods=['POST'])
+@idempotent('manual-sale')
 def submit_manual_sale():
     try:
         data = request.get_json()
@@ -1137,69 +3917,30 @@ def submit_manual_sale():
                 'message': 'No data received'
             }), 400
         
-        # Validate required fields
-        required_fields = ['total_cost', 'amount_paid', 'payment_mode', 'items']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({
-                    'success': False,
-                    'message': f'Missing required field: {field}'
-                }), 400
-        
-        if not data['items'] or len(data['items']) == 0:
+        try:
+            sale, lines = parse_manual_sale(data)
+        except ValueError as e:
             return jsonify({
                 'success': False,
-                'message': 'No items in sale'
+                'message': str(e)
             }), 400
         
-        # Create offline sale
-        sale = OfflineSale(
-            customer_name=data.get('customer_name', ''),
-            total_cost=float(data['total_cost']),
-            amount_paid=float(data['amount_paid']),
-            change_given=float(data['change_given']),
-            payment_mode=data['payment_mode']
-        )
-        db.session.add(sale)
-        db.session.flush()  # Get the sale ID
-        
-        # Add sale items
-        for item_data in data['items']:
-            if 'product_variant_id' not in item_data:
-                return jsonify({
-                    'success': False,
-                    'message': 'Missing product_variant_id in item'
-                }), 400
-                
-            variant_id = item_data['product_variant_id']
-            quantity = int(item_data['quantity'])
-            price = float(item_data['price'])
-            
-            # Verify product variant exists
-            variant = ProductVariant.query.get(variant_id)
-            if not variant:
-                return jsonify({
-                    'success': False,
-                    'message': f'Product variant with ID {variant_id} not found'
-                }), 400
-            
-            sale_item = OfflineSaleItem(
-                offline_sale_id=sale.id,
-                product_variant_id=variant_id,
-                quantity=quantity,
-                price_at_sale=price
-            )
-            db.session.add(sale_item)
-            
-            # Update stock level
-            variant.stock_level = max(0, variant.stock_level - quantity)
+        # Update stock levels, all lines or none; this also rejects unknown variants
+        try:
+            take_stock(sale_quantities(lines))
+        except InsufficientStock as e:
+            db.session.rollback()
+            return insufficient_stock_response(e)
         
+        sale_id, = insert_offline_sales([(sale, lines)])
+        count_till_sales([(*sale_till(data), sale)])
+        catalog_cache.bump()
         db.session.commit()
         
         return jsonify({
             'success': True,
             'message': 'Sale recorded successfully!',
-            'sale_id': sale.id
+            'sale_id': sale_id
         })
         
     except Exception as e:
@@ -1212,10 +3953,398 @@ def submit_manual_sale():
             'message': f'Error recording sale: {str(e)}'
         }), 500
 
+@app.route('/api/manual-sales/batch', methods=['POST'])
+def sync_manual_sales():
+    """Record POS sales a till queued while offline, all in one transaction.
+
+    Every sale carries a client_sale_id made when it was rung up. One
+    already recorded comes back as 'duplicate' with its sale_id, so a till
+    can resend a batch whose response it never saw. The other results, in
+    request order, are 'recorded', 'rejected' (not enough stock, with
+    errors) and 'invalid' (with a message).
+    """
+    data = request.get_json(silent=True) or {}
+    sales = data.get('sales')
+    if not isinstance(sales, list) or not sales:
+        return jsonify({'success': False, 'message': 'sales must be a non-empty list'}), 400
+    if len(sales) > MANUAL_SALE_BATCH_LIMIT:
+        return jsonify({'success': False, 'message': f'At most {MANUAL_SALE_BATCH_LIMIT} sales per batch'}), 400
+
+    results = []
+    parsed = {}  # client_sale_id -> (result, sale values, lines, (till, cashier)), first occurrence only
+    for sale_data in sales:
+        client_sale_id = str(sale_data.get('client_sale_id') or '') if isinstance(sale_data, dict) else ''
+        result = {'client_sale_id': client_sale_id}
+        results.append(result)
+        if not client_sale_id or len(client_sale_id) > 64:
+            result.update(status='invalid', message='client_sale_id must be 1 to 64 characters')
+        elif client_sale_id in parsed:
+            result['status'] = 'duplicate'
+        else:
+            try:
+                sale, lines = parse_manual_sale(sale_data)
+            except ValueError as e:
+                result.update(status='invalid', message=str(e))
+            else:
+                parsed[client_sale_id] = (result, sale, lines, sale_till(sale_data))
+
+    try:
+        lock_for_write()
+        recorded = dict(db.session.execute(
+            db.select(OfflineSaleSync.client_sale_id, OfflineSaleSync.offline_sale_id)
+            .where(OfflineSaleSync.client_sale_id.in_(parsed))
+        ).all())
+        pending = [entry for client_sale_id, entry in parsed.items() if client_sale_id not in recorded]
+
+        # Usually the whole batch fits, and one UPDATE takes the stock for all of it
+        total = Counter()
+        for _, _, lines, _ in pending:
+            total.update(sale_quantities(lines))
+        try:
+            with db.session.begin_nested():
+                take_stock(total)
+            accepted = pending
+        except InsufficientStock:
+            # Otherwise go sale by sale in the order they were rung up
+            accepted = []
+            for entry in pending:
+                result, _, lines, _ = entry
+                try:
+                    with db.session.begin_nested():
+                        take_stock(sale_quantities(lines))
+                    accepted.append(entry)
+                except InsufficientStock as e:
+                    result.update(status='rejected', errors=e.shortages, message=f'Not enough stock: {e}')
+
+        if accepted:
+            sale_ids = insert_offline_sales([(sale, lines) for _, sale, lines, _ in accepted])
+            db.session.execute(db.insert(OfflineSaleSync), [
+                {'client_sale_id': result['client_sale_id'], 'offline_sale_id': sale_id}
+                for (result, _, _, _), sale_id in zip(accepted, sale_ids)
+            ])
+            count_till_sales([(*till, sale) for _, sale, _, till in accepted])
+            for (result, _, _, _), sale_id in zip(accepted, sale_ids):
+                result.update(status='recorded', sale_id=sale_id)
+                recorded[result['client_sale_id']] = sale_id
+            catalog_cache.bump()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        import traceback
+        print(f"Error in manual sale batch: {str(e)}")
+        print(f"Traceback: {traceback.format_exc()}")
+        return jsonify({
+            'success': False,
+            'message': f'Error recording sales: {str(e)}'
+        }), 500
+
+    for result in results:
+        if 'status' not in result or result['status'] == 'duplicate':
+            result.update(status='duplicate', sale_id=recorded.get(result['client_sale_id']))
+    return jsonify({
+        'success': True,
+        'recorded': len(accepted),
+        'results': results
+    })
+
+# --- TIME-BUCKETED AGGREGATES ---
+PERIOD_GRANULARITIES = ('day', 'week', 'month')
+MAX_PERIODS = 1000
+
+def period_start(moment, granularity):
+    """First day of the day, week (from Monday) or month holding `moment`"""
+    day = moment.date() if isinstance(moment, datetime) else moment
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+def next_period(start, granularity):
+    if granularity == 'week':
+        return start + timedelta(weeks=1)
+    if granularity == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+def period_expression(column, granularity):
+    """SQL for the first day of the period holding `column`, to GROUP BY"""
+    if db.engine.dialect.name == 'sqlite':
+        if granularity == 'week':
+            # Forward to Sunday (or stay on it), then back to that week's Monday
+            return db.func.date(column, 'weekday 0', '-6 days')
+        if granularity == 'month':
+            return db.func.date(column, 'start of month')
+        return db.func.date(column)
+    return db.cast(db.func.date_trunc(granularity, column), db.Date)
+
+def aggregate_by_period(column, metrics, start, end, granularity='day', conditions=()):
+    """Aggregate rows into periods of the timestamp or date `column` with one GROUP BY query.
+
+    `metrics` maps names to aggregate expressions (e.g. func.sum(...)), all
+    computed by the same query. Covers `start` up to but not including `end`
+    and returns [(first day of the period, {name: value})] for every period
+    in the range, with zeros where no rows fell. Raises ValueError for an
+    unknown granularity or a range of more than MAX_PERIODS periods.
+    """
+    if granularity not in PERIOD_GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(PERIOD_GRANULARITIES)}")
+    periods = []
+    period = period_start(start, granularity)
+    while datetime.combine(period, datetime.min.time()) < end:
+        periods.append(period)
+        if len(periods) > MAX_PERIODS:
+            raise ValueError(f'A range may span at most {MAX_PERIODS} {granularity}s')
+        period = next_period(period, granularity)
+
+    if isinstance(column.type, db.Date):
+        # Whole days, compared as dates since SQLite stores them as text
+        start, end = start.date(), (end - timedelta(microseconds=1)).date() + timedelta(days=1)
+    bucket = period_expression(column, granularity).label('period')
+    rows = db.session.execute(
+        db.select(bucket, *[expression.label(name) for name, expression in metrics.items()])
+        .where(column >= start, column < end, *conditions)
+        .group_by(bucket)
+    ).all()
+    found = {}
+    for row in rows:
+        # SQLite hands the period back as 'YYYY-MM-DD' text
+        key = datetime.strptime(row.period, '%Y-%m-%d').date() if isinstance(row.period, str) else row.period
+        found[key] = {name: getattr(row, name) or 0 for name in metrics}
+    zero = dict.fromkeys(metrics, 0)
+    return [(period, found.get(period, zero)) for period in periods]
+
+# --- DAILY SALES ROLLUP ---
+# Orders in these states are not sales, and drop out of the rollup
+UNCOUNTED_PAYMENT_STATUSES = ('Cancelled', 'Refunded')
+DAILY_SALES_MEASURES = ('revenue', 'units', 'cost', 'order_count')
+# Per channel: the sale model, when it was sold, its line model, the line's sale id, the line price,
+# and which sales count
+DAILY_SALES_SOURCES = {
+    'online': (Order, Order.ordered_at, OrderItem, OrderItem.order_id, OrderItem.price_at_purchase,
+               Order.payment_status.notin_(UNCOUNTED_PAYMENT_STATUSES)),
+    'offline': (OfflineSale, OfflineSale.sale_date, OfflineSaleItem, OfflineSaleItem.offline_sale_id,
+                OfflineSaleItem.price_at_sale, db.true()),
+}
+# Per model: its channel, the attribute naming its sale and the relationship to it (None
+# for the sale itself), and the attributes whose change moves it within the rollup
+DAILY_SALES_TRACKED = {
+    Order: ('online', None, ('payment_status', 'ordered_at')),
+    OrderItem: ('online', ('order_id', 'order'), ('order_id', 'product_variant_id', 'quantity', 'price_at_purchase')),
+    OfflineSale: ('offline', None, ('sale_date',)),
+    OfflineSaleItem: ('offline', ('offline_sale_id', 'offline_sale'),
+                      ('offline_sale_id', 'product_variant_id', 'quantity', 'price_at_sale')),
+}
+
+def daily_sales_rows(connection, channel, sales, sign=1):
+    """Rollup increments for [(sold_at, [(variant_id, quantity, price)])], one per day and variant"""
+    variant_ids = {variant_id for _, lines in sales for variant_id, _, _ in lines}
+    buying_prices = dict(connection.execute(
+        db.select(ProductVariant.id, ProductVariant.buying_price).where(ProductVariant.id.in_(variant_ids))
+    ).all()) if variant_ids else {}
+    rows = {}
+    for sale_index, (sold_at, lines) in enumerate(sales):
+        day = sold_at.date()
+        for variant_id, quantity, price in lines:
+            row = rows.get((day, variant_id))
+            if row is None:
+                row = rows[day, variant_id] = {
+                    'day': day, 'channel': channel, 'product_variant_id': variant_id,
+                    'revenue': 0.0, 'units': 0, 'cost': 0.0, 'order_count': 0, 'sales': set()
+                }
+            row['revenue'] += sign * quantity * price
+            row['units'] += sign * quantity
+            row['cost'] += sign * quantity * (buying_prices.get(variant_id) or 0.0)
+            row['sales'].add(sale_index)
+    for row in rows.values():
+        # An order with two lines of one variant is still one order
+        row['order_count'] = sign * len(row.pop('sales'))
+    return list(rows.values())
+
+def record_daily_sales(connection, channel, sales, sign=1):
+    """Add [(sold_at, [(variant_id, quantity, price)])] to the rollup, in the caller's transaction.
+
+    sign=-1 takes them back out. Cost is at the current buying price, and
+    is repriced for every day when a variant's buying price changes. SQLite and PostgreSQL apply all the rows
+    with one upsert; other databases fall back to an UPDATE, then an
+    INSERT if the row did not exist, per day and variant.
+    """
+    rows = daily_sales_rows(connection, channel, sales, sign)
+    if not rows:
+        return
+    table = DailySalesSummary.__table__
+    dialect_insert = {'sqlite': sqlite_insert, 'postgresql': postgresql_insert}.get(connection.dialect.name)
+    if dialect_insert:
+        insert = dialect_insert(table)
+        connection.execute(insert.on_conflict_do_update(
+            index_elements=['day', 'channel', 'product_variant_id'],
+            set_={name: table.c[name] + insert.excluded[name] for name in DAILY_SALES_MEASURES}
+        ), rows)
+        return
+    for row in rows:
+        result = connection.execute(
+            table.update()
+            .where(table.c.day == row['day'], table.c.channel == channel, table.c.product_variant_id == row['product_variant_id'])
+            .values({name: table.c[name] + row[name] for name in DAILY_SALES_MEASURES})
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(**row))
+
+def stored_sales(connection, channel, sale_ids):
+    """Rollup entries [(sold_at, lines)] of the counted sales among `sale_ids`, as the database has them now"""
+    sale_model, sold_at, item_model, sale_id, price, counted = DAILY_SALES_SOURCES[channel]
+    sales = {}
+    rows = connection.execute(
+        db.select(sale_model.id, sold_at, item_model.product_variant_id, item_model.quantity, price)
+        .select_from(sale_model)
+        .join(item_model, sale_id == sale_model.id)
+        .where(sale_model.id.in_(sale_ids), sold_at.isnot(None), counted)
+    ) if sale_ids else ()
+    for row_id, row_sold_at, variant_id, quantity, row_price in rows:
+        sales.setdefault(row_id, (row_sold_at, []))[1].append((variant_id, quantity, row_price))
+    return list(sales.values())
+
+def sales_touched_by(session, objects, before):
+    """{channel: sale ids} whose rollup entry may change with `objects` flushed.
+
+    With `before`, the sales as stored (an edited line's old sale too);
+    otherwise as they will be once the flush has run.
+    """
+    touched = {channel: set() for channel in DAILY_SALES_SOURCES}
+    for obj in objects:
+        channel, parent, attributes = DAILY_SALES_TRACKED[type(obj)]
+        if parent is None:
+            touched[channel].add(obj.id)
+            continue
+        sale_id_attribute, sale_attribute = parent
+        sale_id = getattr(obj, sale_id_attribute)
+        if sale_id is None:
+            # A line appended to a sale's collection has no sale id until the flush
+            sale = getattr(obj, sale_attribute)
+            sale_id = sale.id if sale is not None else None
+        touched[channel].add(sale_id)
+        if before:
+            history = db.inspect(obj).attrs[sale_id_attribute].history
+            touched[channel].update(history.deleted or history.unchanged)
+    for ids in touched.values():
+        ids.discard(None)
+    return touched
+
+@event.listens_for(db.session, 'before_flush')
+def _take_edited_sales_out_of_the_rollup(session, flush_context, instances):
+    # Sales and lines edited or deleted through the admin views (cancelling or
+    # refunding an order, changing a line) leave the rollup here as stored, and
+    # go back in as they end up after the flush. Checkout and POS sales insert
+    # with Core and record their own rollup, so they do not pass through here.
+    objects = []
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        tracked = DAILY_SALES_TRACKED.get(type(obj))
+        if tracked is None or (tracked[1] is None and obj in session.new):
+            # A new sale has no lines stored yet; lines added with it come through on their own
+            continue
+        if obj in session.dirty and obj not in session.deleted and not any(
+                db.inspect(obj).attrs[name].history.has_changes() for name in tracked[2]):
+            continue
+        objects.append(obj)
+    if not objects:
+        return
+    connection = session.connection()
+    # A new line's sale is stored already unless it is new too, and leaves with its other lines
+    touched = sales_touched_by(session, objects, before=True)
+    for channel, ids in touched.items():
+        record_daily_sales(connection, channel, stored_sales(connection, channel, ids), sign=-1)
+    session.info['daily_sales_edits'] = (objects, touched)
+
+@event.listens_for(db.session, 'after_flush')
+def _put_edited_sales_back_in_the_rollup(session, flush_context):
+    edits = session.info.pop('daily_sales_edits', None)
+    if edits is None:
+        return
+    objects, touched = edits
+    # Sales that lost a line go back in without it; deleted sales are no longer there to read
+    after = sales_touched_by(session, [obj for obj in objects if obj not in session.deleted], before=False)
+    connection = session.connection()
+    for channel, ids in touched.items():
+        record_daily_sales(connection, channel, stored_sales(connection, channel, ids | after[channel]))
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_edited_sales(session):
+    session.info.pop('daily_sales_edits', None)
+
+@event.listens_for(ProductVariant, 'after_update')
+def _reprice_rolled_up_cost(mapper, connection, target):
+    # Cost is rolled up at the variant's current buying price, as a rebuild
+    # computes it; repricing every day now keeps a sale cancelled or edited
+    # later from taking out a different cost than it put in.
+    if not db.inspect(target).attrs.buying_price.history.has_changes():
+        return
+    table = DailySalesSummary.__table__
+    connection.execute(
+        table.update()
+        .where(table.c.product_variant_id == target.id)
+        .values(cost=table.c.units * (target.buying_price or 0.0))
+    )
+
+def rebuild_daily_sales(connection):
+    """Regenerate the rollup from every order and POS sale, at today's buying prices"""
+    table = DailySalesSummary.__table__
+    connection.execute(table.delete())
+    buying_price = db.func.coalesce(ProductVariant.buying_price, 0.0)
+    for channel, (sale_model, sold_at, item_model, sale_id, price, counted) in DAILY_SALES_SOURCES.items():
+        day = period_expression(sold_at, 'day')
+        connection.execute(table.insert().from_select(
+            ['day', 'channel', 'product_variant_id', *DAILY_SALES_MEASURES],
+            db.select(
+                day, db.literal(channel), item_model.product_variant_id,
+                db.func.sum(item_model.quantity * price),
+                db.func.sum(item_model.quantity),
+                db.func.sum(item_model.quantity * buying_price),
+                db.func.count(db.distinct(sale_id))
+            )
+            .select_from(item_model)
+            .join(sale_model, sale_model.id == sale_id)
+            .outerjoin(ProductVariant, ProductVariant.id == item_model.product_variant_id)
+            .where(sold_at.isnot(None), counted)
+            .group_by(day, item_model.product_variant_id)
+        ))
+
+@event.listens_for(db.metadata, 'after_create')
+def _backfill_daily_sales(target, connection, tables=(), **kw):
+    # The rollup is new to this database: roll up the history already there
+    if DailySalesSummary.__table__ in tables:
+        rebuild_daily_sales(connection)
+
+@app.cli.command('rebuild-daily-sales')
+def rebuild_daily_sales_command():
+    """Regenerate the daily sales rollup from the full order and POS sale history"""
+    with db.engine.begin() as connection:
+        rebuild_daily_sales(connection)
+    print("✅ Daily sales summary rebuilt")
+
 # --- ROUTES ---
+# Script-breaking characters can only occur inside JSON strings, where these escapes mean the same
+JSON_ISLAND_ESCAPES = {ord('<'): '\\u003c', ord('>'): '\\u003e', ord('&'): '\\u0026'}
+_home_data_fragment = {'versions': None, 'html': None}
+
+def home_data_fragment():
+    """JSON island for index.html: first catalog page, FAQs and testimonials.
+
+    Assembled from the already-encoded API bodies and cached until any of the
+    three snapshot versions moves.
+    """
+    versions = tuple(snapshot_caches[name].sync() for name in ('catalog', 'faqs', 'testimonials'))
+    if _home_data_fragment['versions'] != versions:
+        island = (
+            '{"faqs":' + faqs_body().decode('utf-8') +
+            ',"products":' + catalog_first_page_body().decode('utf-8') +
+            ',"testimonials":' + testimonials_body().decode('utf-8') + '}'
+        )
+        _home_data_fragment.update(versions=versions, html=Markup(island.translate(JSON_ISLAND_ESCAPES)))
+    return _home_data_fragment['html']
+
 @app.route('/')
 def home():
-    return render_template('index.html')
+    return render_template('index.html', initial_data=home_data_fragment())
 
 @app.route('/cart')
 def cart_page():
@@ -1230,6 +4359,8 @@ def admin_login():
         # Simple admin login (you can enhance this)
         if username == 'admin' and password == 'admin123':
             session['admin_logged_in'] = True
+            # Till sessions record who opened and closed them, and who rang up each sale
+            session['admin_username'] = username
             return redirect(url_for('admin.index'))
         else:
             flash('Invalid credentials', 'error')
@@ -1239,6 +4370,7 @@ def admin_login():
 @app.route('/admin-logout')
 def admin_logout():
     session.pop('admin_logged_in', None)
+    session.pop('admin_username', None)
     return redirect(url_for('admin_login'))
 
 @app.route('/admin-dashboard/')
@@ -1255,56 +4387,101 @@ def admin_orders():
         return redirect(url_for('admin_login'))
     return render_template('admin_orders.html')
 
+# Periods the revenue trend covers when no start date is given
+DASHBOARD_TREND_PERIODS = {'day': 7, 'week': 12, 'month': 12}
+
+def dashboard_trend_range(now, granularity):
+    """[start, end) of the dashboard trend from ?start= and ?end= (inclusive ISO dates).
+
+    Without them the trend ends today and covers DASHBOARD_TREND_PERIODS
+    periods. Raises ValueError for a bad date or granularity.
+    """
+    if granularity not in DASHBOARD_TREND_PERIODS:
+        raise ValueError(f"granularity must be one of {', '.join(DASHBOARD_TREND_PERIODS)}")
+    try:
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d') if request.args.get('end') else now
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d') if request.args.get('start') else None
+    except ValueError:
+        raise ValueError('start and end must be dates (YYYY-MM-DD)')
+    end = datetime.combine(end.date() + timedelta(days=1), datetime.min.time())
+    if start is None:
+        first = period_start(end - timedelta(days=1), granularity)
+        for _ in range(DASHBOARD_TREND_PERIODS[granularity] - 1):
+            first = period_start(first - timedelta(days=1), granularity)
+        start = datetime.combine(first, datetime.min.time())
+    if start >= end:
+        raise ValueError('start must not be after end')
+    return start, end
+
 @app.route('/api/dashboard-data')
 def get_dashboard_data():
     """Get dashboard analytics data"""
     if not session.get('admin_logged_in'):
         return jsonify({'error': 'Unauthorized'}), 401
     
+    now = datetime.utcnow()
+    granularity = request.args.get('granularity', 'day')
     try:
-        # Get current date and last month date
-        now = datetime.utcnow()
-        last_month = now - timedelta(days=30)
+        trend_start, trend_end = dashboard_trend_range(now, granularity)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        last_month = (now - timedelta(days=30)).date()
+        online = DailySalesSummary.channel == 'online'
+        
+        counted = Order.payment_status.notin_(UNCOUNTED_PAYMENT_STATUSES)
         
-        # Calculate statistics
-        total_revenue = db.session.query(db.func.sum(Order.total_amount)).scalar() or 0
-        total_orders = Order.query.count()
+        # Revenue comes from the daily rollup, which skips cancelled and refunded orders; customers
+        # cannot be summed per variant, so the counts stay on the order table, in the same statement
+        # and leaving out the same orders
+        total_revenue, last_month_revenue, total_orders, total_customers = db.session.query(
+            db.func.coalesce(db.func.sum(DailySalesSummary.revenue), 0),
+            db.func.coalesce(db.func.sum(db.case((DailySalesSummary.day >= last_month, DailySalesSummary.revenue), else_=0)), 0),
+            db.select(db.func.count(Order.id)).where(counted).scalar_subquery(),
+            db.select(db.func.count(db.func.distinct(Order.customer_email))).where(counted).scalar_subquery()
+        ).filter(online).one()
         total_products = Product.query.count()
-        total_customers = db.session.query(db.func.count(db.func.distinct(Order.customer_email))).scalar() or 0
         
         # Calculate revenue change (simplified - you can enhance this)
-        last_month_revenue = db.session.query(db.func.sum(Order.total_amount)).filter(
-            Order.ordered_at >= last_month
-        ).scalar() or 0
-        
         revenue_change = 0
         if last_month_revenue > 0:
             revenue_change = ((total_revenue - last_month_revenue) / last_month_revenue) * 100
         
-        # Get revenue trend for last 7 days
-        revenue_trend = []
-        for i in range(7):
-            date = now - timedelta(days=i)
-            day_start = date.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = day_start + timedelta(days=1)
-            
-            daily_revenue = db.session.query(db.func.sum(Order.total_amount)).filter(
-                Order.ordered_at >= day_start,
-                Order.ordered_at < day_end
-            ).scalar() or 0
-            
-            revenue_trend.insert(0, {
-                'date': date.strftime('%a'),
-                'revenue': daily_revenue
-            })
+        # Revenue trend, one GROUP BY over the rollup whatever the range; an order spans
+        # several rollup rows, so the order count is one more GROUP BY over the order table
+        try:
+            periods = aggregate_by_period(
+                DailySalesSummary.day, {
+                    'revenue': db.func.sum(db.case((online, DailySalesSummary.revenue), else_=0)),
+                    'pos_revenue': db.func.sum(db.case((DailySalesSummary.channel == 'offline', DailySalesSummary.revenue), else_=0))
+                },
+                trend_start, trend_end, granularity
+            )
+            order_periods = aggregate_by_period(
+                Order.ordered_at, {'orders': db.func.count(Order.id)}, trend_start, trend_end, granularity, (counted,)
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        label_format = {'day': '%a' if len(periods) <= 7 else '%d %b', 'week': '%d %b', 'month': '%b %Y'}[granularity]
+        revenue_trend = [
+            {
+                'date': period.strftime(label_format),
+                'period': period.isoformat(),
+                'revenue': values['revenue'],
+                'orders': orders['orders'],
+                'pos_revenue': values['pos_revenue']
+            }
+            for (period, values), (_, orders) in zip(periods, order_periods)
+        ]
         
         # Get top products by sales
         try:
             top_products = db.session.query(
                 Product.name,
-                db.func.count(OrderItem.id).label('sales')
-            ).select_from(Product).join(ProductVariant, Product.id == ProductVariant.product_id).join(OrderItem, ProductVariant.id == OrderItem.product_variant_id).group_by(Product.id).order_by(
-                db.func.count(OrderItem.id).desc()
+                db.func.sum(DailySalesSummary.order_count).label('sales')
+            ).select_from(DailySalesSummary).join(ProductVariant, ProductVariant.id == DailySalesSummary.product_variant_id).join(Product, Product.id == ProductVariant.product_id).filter(online).group_by(Product.id).order_by(
+                db.func.sum(DailySalesSummary.order_count).desc()
             ).limit(5).all()
             
             top_products_data = []
@@ -1387,6 +4564,22 @@ def get_dashboard_data():
         traceback.print_exc()
         return jsonify({'error': 'Failed to load dashboard data'}), 500
 
+ORDER_FIELDS = ('id', 'customer_name', 'customer_email', 'customer_phone', 'total_amount', 'date', 'payment_info', 'order_type', 'status_color')
+ONLINE_ORDER_COLUMNS = {
+    'id': Order.id,
+    'customer_name': Order.customer_name,
+    'customer_email': Order.customer_email,
+    'customer_phone': Order.customer_phone,
+    'total_amount': Order.total_amount,
+    'payment_info': Order.payment_status,
+}
+OFFLINE_SALE_COLUMNS = {
+    'id': OfflineSale.id,
+    'customer_name': OfflineSale.customer_name,
+    'total_amount': OfflineSale.total_cost,
+    'payment_info': OfflineSale.payment_mode,
+}
+
 @app.route('/api/all-orders')
 def get_all_orders():
     """Get all orders (online + offline) for the orders dashboard"""
@@ -1394,61 +4587,60 @@ def get_all_orders():
         return jsonify({'error': 'Unauthorized'}), 401
     
     try:
+        fields, _ = get_requested_fields(ORDER_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    fields = fields or set(ORDER_FIELDS)
+    
+    try:
+        # Select only the columns behind the requested fields; the date is always needed for sorting
+        online_columns = {'date': Order.ordered_at.label('date')}
+        offline_columns = {'date': OfflineSale.sale_date.label('date')}
+        for name in fields:
+            if name in ONLINE_ORDER_COLUMNS:
+                online_columns[name] = ONLINE_ORDER_COLUMNS[name].label(name)
+            if name in OFFLINE_SALE_COLUMNS:
+                offline_columns[name] = OFFLINE_SALE_COLUMNS[name].label(name)
+        if 'status_color' in fields:
+            online_columns['payment_info'] = Order.payment_status.label('payment_info')
+        
         # Get online orders
-        online_orders = db.session.query(
-            Order.id,
-            Order.customer_name,
-            Order.customer_email,
-            Order.customer_phone,
-            Order.total_amount,
-            Order.ordered_at,
-            Order.payment_status,
-            db.literal('online').label('order_type')
-        ).order_by(Order.ordered_at.desc()).all()
+        online_orders = db.session.query(*online_columns.values()).order_by(Order.ordered_at.desc()).all()
         
         # Get offline sales
-        offline_sales = db.session.query(
-            OfflineSale.id,
-            OfflineSale.customer_name,
-            db.literal('').label('customer_email'),
-            db.literal('').label('customer_phone'),
-            OfflineSale.total_cost,
-            OfflineSale.sale_date,
-            OfflineSale.payment_mode,
-            db.literal('offline').label('order_type')
-        ).order_by(OfflineSale.sale_date.desc()).all()
+        offline_sales = db.session.query(*offline_columns.values()).order_by(OfflineSale.sale_date.desc()).all()
         
         # Combine and format data
         all_orders = []
         
         for order in online_orders:
-            all_orders.append({
-                'id': order.id,
-                'customer_name': order.customer_name or 'N/A',
-                'customer_email': order.customer_email or 'N/A',
-                'customer_phone': order.customer_phone or 'N/A',
-                'total_amount': order.total_amount,
-                'date': order.ordered_at,
-                'payment_info': order.payment_status,
-                'order_type': order.order_type,
-                'status_color': 'success' if order.payment_status == 'Paid' else 'warning' if order.payment_status == 'Pending' else 'danger'
-            })
+            row = order._asdict()
+            for name in ('customer_name', 'customer_email', 'customer_phone'):
+                if name in row:
+                    row[name] = row[name] or 'N/A'
+            if 'order_type' in fields:
+                row['order_type'] = 'online'
+            if 'status_color' in fields:
+                row['status_color'] = 'success' if row['payment_info'] == 'Paid' else 'warning' if row['payment_info'] == 'Pending' else 'danger'
+            all_orders.append(row)
         
         for sale in offline_sales:
-            all_orders.append({
-                'id': sale.id,
-                'customer_name': sale.customer_name or 'Walk-in Customer',
-                'customer_email': 'N/A',
-                'customer_phone': 'N/A',
-                'total_amount': sale.total_cost,
-                'date': sale.sale_date,
-                'payment_info': sale.payment_mode,
-                'order_type': sale.order_type,
-                'status_color': 'success'  # Offline sales are always completed
-            })
+            row = sale._asdict()
+            if 'customer_name' in row:
+                row['customer_name'] = row['customer_name'] or 'Walk-in Customer'
+            for name in ('customer_email', 'customer_phone'):
+                if name in fields:
+                    row[name] = 'N/A'
+            if 'order_type' in fields:
+                row['order_type'] = 'offline'
+            if 'status_color' in fields:
+                row['status_color'] = 'success'  # Offline sales are always completed
+            all_orders.append(row)
         
         # Sort by date (newest first)
         all_orders.sort(key=lambda x: x['date'], reverse=True)
+        if fields != set(ORDER_FIELDS):
+            all_orders = [{name: row[name] for name in fields} for row in all_orders]
         
         return jsonify({
             'orders': all_orders,
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark: a 50-line wholesale checkout, batched path vs the previous per-line path
+
+The previous submit_full_order() body (per-line OrderItem through the unit of
+work, a Query.get() per variant, stock written back from Python) is mounted at
+/bench/legacy-order so both run through the same request stack.
+
+Usage: python bench_checkout.py [lines] [rounds]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import jsonify, request
+from sqlalchemy import event
+
+from app import app, db, Order, OrderItem, Product, ProductVariant
+
+
+@app.route('/bench/legacy-order', methods=['POST'])
+def legacy_order():
+    data = request.get_json()
+    cart_items = data['items']
+    total_amount = sum(float(item['selling_price']) * int(item['quantity']) for item in cart_items)
+    order = Order(customer_name=data['customer_name'], customer_email=data['customer_email'],
+                  customer_phone=data['customer_phone'], delivery_address=data['delivery_address'],
+                  total_amount=total_amount)
+    db.session.add(order)
+    db.session.flush()
+    for item in cart_items:
+        db.session.add(OrderItem(order_id=order.id, product_variant_id=item['product_variant_id'],
+                                 quantity=item['quantity'], price_at_purchase=item['selling_price']))
+        variant = db.session.get(ProductVariant, item['product_variant_id'])
+        if variant:
+            variant.stock_level = max(0, variant.stock_level - item['quantity'])
+    db.session.commit()
+    return jsonify({'status': 'success', 'order_id': order.id})
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    with app.app_context():
+        db.create_all()
+        for i in range(lines):
+            product = Product(name=f"Product {i:03d}", category="Fertilizer", description="Bench product")
+            product.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2500.0,
+                                                   stock_level=1_000_000))
+            db.session.add(product)
+        db.session.commit()
+        variant_ids = [variant.id for variant in ProductVariant.query]
+        db.session.remove()
+
+        payload = {
+            'customer_name': 'Wholesale Buyer', 'customer_email': 'buyer@example.com',
+            'customer_phone': '0712345678', 'delivery_address': 'Meru',
+            'items': [{'product_variant_id': variant_id, 'quantity': 2, 'selling_price': 2500.0} for variant_id in variant_ids]
+        }
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+
+        client = app.test_client()
+        for label, url in (('per-line (previous)', '/bench/legacy-order'), ('batched (current)', '/api/submit-full-order')):
+            client.post(url, json=payload)
+            statements.clear()
+            start = time.perf_counter()
+            for _ in range(rounds):
+                response = client.post(url, json=payload)
+                assert response.status_code == 200, response.data
+            ms = (time.perf_counter() - start) / rounds * 1000
+            print(f"{label:<20} {lines} lines: {len(statements) / rounds:5.1f} statements  {ms:6.2f} ms per order")
+
+
+if __name__ == '__main__':
+    main()
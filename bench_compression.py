@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark: CPU cost against bytes saved for gzip/brotli on our largest responses
+
+Seeds a throwaway database, renders the catalog API and storefront page through
+the Flask test client, reads the big static/template files from disk, and times
+each encoder on each body.
+
+Usage: python bench_compression.py [rounds]
+"""
+
+import gzip
+import os
+import sys
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+
+from app import app, db, brotli, Product, ProductVariant
+
+ENCODERS = [
+    ('gzip-1', lambda data: gzip.compress(data, compresslevel=1, mtime=0)),
+    ('gzip-6', lambda data: gzip.compress(data, compresslevel=6, mtime=0)),
+    ('gzip-9', lambda data: gzip.compress(data, compresslevel=9, mtime=0)),
+]
+if brotli:
+    ENCODERS += [
+        ('br-4', lambda data: brotli.compress(data, quality=4)),
+        ('br-11', lambda data: brotli.compress(data, quality=11)),
+    ]
+
+
+def bodies():
+    for i in range(100):
+        product = Product(name=f"Product {i:03d}", category="Fertilizer",
+                          description="Suitable for planting and top dressing of maize and beans.")
+        for value in (1.0, 5.0, 25.0, 50.0):
+            product.variants.append(ProductVariant(quantity_value=value, quantity_unit="kg", selling_price=60.0 * value,
+                                                   stock_level=20, supplier="Yara East Africa Ltd"))
+        db.session.add(product)
+    db.session.commit()
+
+    client = app.test_client()
+    yield '/api/products?limit=100', client.get('/api/products?limit=100').data
+    yield 'index.html (rendered)', client.get('/').data
+    for path in ('templates/admin_dashboard.html', 'static/js/main.js', 'static/css/style.css'):
+        with open(os.path.join(BASE_DIR, path), 'rb') as f:
+            yield path, f.read()
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    if not brotli:
+        print("brotli is not installed; timing gzip only\n")
+    with app.app_context():
+        db.create_all()
+        for name, data in bodies():
+            print(f"{name}: {len(data)} bytes")
+            for label, encode in ENCODERS:
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    size = len(encode(data))
+                ms = (time.perf_counter() - start) / rounds * 1000
+                print(f"  {label:<7} {size:>7} bytes  {100 - size * 100 / len(data):3.0f}% saved  {ms:6.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark: payload size and latency of the catalog APIs with and without ?fields=
+
+Seeds a throwaway database, then times each URL through the Flask test client.
+The snapshot cache is bumped before every request so each one hits the database.
+
+Usage: python bench_sparse_fields.py [products] [rounds]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db, catalog_cache, Product, ProductVariant
+
+GRID_FIELDS = 'id,name,image_url,variants.id,variants.selling_price,variants.stock_level,variants.display_name'
+
+CASES = [
+    ('/api/products?limit=100', '/api/products?limit=100&fields=' + GRID_FIELDS),
+    ('/api/product-variants?limit=100', '/api/product-variants?limit=100&fields=id,display_name,stock_level'),
+]
+
+
+def seed(count):
+    description = "Suitable for planting and top dressing of maize, beans and vegetables. " * 4
+    for i in range(count):
+        product = Product(name=f"Product {i:04d}", category="Fertilizer", description=description,
+                          image_url=f"/static/images/product-{i}.jpg")
+        for value in (1.0, 5.0, 25.0, 50.0):
+            product.variants.append(ProductVariant(quantity_value=value, quantity_unit="kg", selling_price=60.0 * value,
+                                                   stock_level=20, supplier="Yara East Africa Ltd"))
+        db.session.add(product)
+    db.session.commit()
+
+
+def measure(client, url, rounds):
+    size = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        catalog_cache.bump()
+        response = client.get(url)
+        assert response.status_code == 200, response.data
+        size = len(response.data)
+        db.session.remove()
+    return size, (time.perf_counter() - start) / rounds * 1000
+
+
+def main():
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    with app.app_context():
+        db.create_all()
+        seed(products)
+        client = app.test_client()
+        for full_url, sparse_url in CASES:
+            measure(client, full_url, 3)
+            full_size, full_ms = measure(client, full_url, rounds)
+            sparse_size, sparse_ms = measure(client, sparse_url, rounds)
+            print(full_url.split('?')[0])
+            print(f"  full:   {full_size:>7} bytes  {full_ms:6.2f} ms")
+            print(f"  sparse: {sparse_size:>7} bytes  {sparse_ms:6.2f} ms  "
+                  f"({100 - sparse_size * 100 / full_size:.0f}% smaller, {100 - sparse_ms * 100 / full_ms:.0f}% faster)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Build static assets: minify and fingerprint static/css and static/js into static/dist
+
+Each file is minified with rjsmin/rcssmin when they are installed and copied as-is
+otherwise, named after a hash of its content, and written next to .gz (and .br,
+when brotli is installed) siblings. static/dist/manifest.json maps source names to
+built names; asset_url() in app.py reads it. `flask build-assets` runs the same build.
+
+Usage: python build_assets.py [static_folder]
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sys
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only .gz siblings are written
+    brotli = None
+
+try:
+    from rjsmin import jsmin
+except ImportError:  # Optional: without it scripts are fingerprinted unminified
+    jsmin = None
+
+try:
+    from rcssmin import cssmin
+except ImportError:  # Optional: without it stylesheets are fingerprinted unminified
+    cssmin = None
+
+ASSET_SOURCE_DIRS = ('css', 'js')
+ASSET_BUILD_DIR = 'dist'
+ASSET_MANIFEST = 'manifest.json'
+MINIFIERS = {'.css': cssmin, '.js': jsmin}
+
+
+def precompress(path, data):
+    """Write .gz (and .br) siblings of a built file that do not exist yet"""
+    encoders = {'.gz': lambda: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli:
+        encoders['.br'] = lambda: brotli.compress(data, quality=11)
+    for suffix, encode in encoders.items():
+        if not os.path.isfile(path + suffix):
+            with open(path + suffix, 'wb') as f:
+                f.write(encode())
+
+
+def build_assets(static_folder):
+    """Minify and fingerprint every stylesheet and script, returning the new manifest"""
+    manifest = {}
+    for source_dir in ASSET_SOURCE_DIRS:
+        for directory, _, filenames in os.walk(os.path.join(static_folder, source_dir)):
+            for filename in sorted(filenames):
+                stem, ext = os.path.splitext(filename)
+                if ext not in MINIFIERS:
+                    continue
+                path = os.path.join(directory, filename)
+                with open(path, encoding='utf-8') as f:
+                    source = f.read()
+                minify = MINIFIERS[ext]
+                data = (minify(source) if minify else source).encode('utf-8')
+                digest = hashlib.sha256(data).hexdigest()[:12]
+
+                name = os.path.relpath(path, static_folder).replace(os.sep, '/')
+                built = f"{ASSET_BUILD_DIR}/{os.path.dirname(name)}/{stem}.{digest}{ext}"
+                target = os.path.join(static_folder, *built.split('/'))
+                if not os.path.isfile(target):
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with open(target, 'wb') as f:
+                        f.write(data)
+                precompress(target, data)
+                manifest[name] = built
+
+    manifest_path = os.path.join(static_folder, ASSET_BUILD_DIR, ASSET_MANIFEST)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def main():
+    static_folder = sys.argv[1] if len(sys.argv) > 1 else \
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    for label, minifier in (('rjsmin', jsmin), ('rcssmin', cssmin)):
+        if minifier is None:
+            print(f"{label} is not installed; copying those files unminified")
+    manifest = build_assets(static_folder)
+    for name, built in sorted(manifest.items()):
+        print(f"{name} -> {built}")
+    print(f"Built {len(manifest)} assets.")
+
+
+if __name__ == '__main__':
+    main()
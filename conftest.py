@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Shared pytest setup: a throwaway database, a fresh schema per test and a SQL statement counter
+"""
+
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
+# Run against a throwaway database instead of kaboy_agrovet.db
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy import event
+
+from app import app, db, snapshot_caches, stock_hold_sweeper, trigram_index, variant_code_index, variant_suggest_index
+
+
+@pytest.fixture
+def database():
+    """An empty schema inside an app context"""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture
+def seed():
+    """Rows every test in a module starts with; modules override this"""
+    return []
+
+
+@pytest.fixture
+def client(database, seed):
+    database.session.add_all(seed)
+    database.session.commit()
+    # The in-memory caches and indexes outlive the schema they were built from
+    for cache in snapshot_caches.values():
+        cache.clear()
+    variant_suggest_index.clear()
+    variant_code_index.clear()
+    trigram_index.clear()
+    # Nothing is held in a fresh schema, so the sweeper thread has nothing due during the test
+    stock_hold_sweeper.next_expiry = datetime.max
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def count_statements():
+    """Context manager collecting every SQL statement sent while it is open"""
+    @contextmanager
+    def count():
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+    return count
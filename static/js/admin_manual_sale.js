@@ -14,30 +14,27 @@ document.getElementById('productVariantSearch').addEventListener('input', functi
     const resultsDiv = document.getElementById('searchResults');
     resultsDiv.innerHTML = '';
     if (query.length < 2) return;
-    // TODO: Replace with actual AJAX call to backend API
-    fetch(`/api/products?search=${encodeURIComponent(query)}`)
+    fetch(`/api/variants/suggest?q=${encodeURIComponent(query)}`)
         .then(res => res.json())
-        .then(products => {
-            products.forEach(product => {
-                product.variants.forEach(variant => {
-                    const item = document.createElement('a');
-                    item.className = 'list-group-item list-group-item-action';
-                    item.href = '#';
-                    item.textContent = `${product.name} (${variant.quantity_value}${variant.quantity_unit}) - KSh ${variant.selling_price} | Stock: ${variant.stock_level}`;
-                    item.dataset.variantId = variant.id;
-                    item.dataset.variantName = product.name + " (" + variant.quantity_value + variant.quantity_unit + ")";
-                    item.dataset.unitPrice = variant.selling_price;
-                    item.dataset.stockLevel = variant.stock_level;
-                    item.onclick = function (e) {
-                        e.preventDefault();
-                        document.getElementById('productVariantSearch').value = item.dataset.variantName;
-                        document.getElementById('productVariantSearch').dataset.variantId = item.dataset.variantId;
-                        document.getElementById('productVariantSearch').dataset.unitPrice = item.dataset.unitPrice;
-                        document.getElementById('productVariantSearch').dataset.stockLevel = item.dataset.stockLevel;
-                        resultsDiv.innerHTML = '';
-                    };
-                    resultsDiv.appendChild(item);
-                });
+        .then(data => {
+            data.suggestions.forEach(variant => {
+                const item = document.createElement('a');
+                item.className = 'list-group-item list-group-item-action';
+                item.href = '#';
+                item.textContent = `${variant.product_name} (${variant.quantity_value}${variant.quantity_unit}) - KSh ${variant.selling_price} | Stock: ${variant.stock_level}`;
+                item.dataset.variantId = variant.id;
+                item.dataset.variantName = variant.product_name + " (" + variant.quantity_value + variant.quantity_unit + ")";
+                item.dataset.unitPrice = variant.selling_price;
+                item.dataset.stockLevel = variant.stock_level;
+                item.onclick = function (e) {
+                    e.preventDefault();
+                    document.getElementById('productVariantSearch').value = item.dataset.variantName;
+                    document.getElementById('productVariantSearch').dataset.variantId = item.dataset.variantId;
+                    document.getElementById('productVariantSearch').dataset.unitPrice = item.dataset.unitPrice;
+                    document.getElementById('productVariantSearch').dataset.stockLevel = item.dataset.stockLevel;
+                    resultsDiv.innerHTML = '';
+                };
+                resultsDiv.appendChild(item);
             });
         });
 });
@@ -143,29 +140,23 @@ document.getElementById('manualSaleForm').onsubmit = function (e) {
         items: saleItems.map(item => ({
             product_variant_id: item.variantId,
             quantity: item.quantity,
-            price_at_sale: item.unitPrice
+            price: item.unitPrice
         }))
     };
 
-    // TODO: Replace with actual backend endpoint for offline sale
-    fetch('/api/manual-offline-sale', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(payload)
-    })
-    .then(res => res.json())
-    .then(data => {
-        if (data.status === 'success') {
-            document.getElementById('manualSaleFormMessage').textContent = data.message || "Sale recorded successfully!";
+    // Queued in IndexedDB first (pos_sale_queue.js), so a dropped connection cannot lose the sale
+    PosSaleQueue.record(payload)
+    .then(result => {
+        if (result.status === 'recorded' || result.status === 'duplicate' || result.status === 'queued') {
+            document.getElementById('manualSaleFormMessage').textContent = result.status === 'queued'
+                ? "Offline: sale saved on this till and will sync automatically."
+                : "Sale recorded successfully!";
             saleItems = [];
             renderSaleItems();
             document.getElementById('manualSaleForm').reset();
         } else {
-            document.getElementById('manualSaleFormMessage').textContent = data.message || "Error saving sale.";
+            document.getElementById('manualSaleFormMessage').textContent = result.message || "Error saving sale.";
         }
-    })
-    .catch(() => {
-        document.getElementById('manualSaleFormMessage').textContent = "Network error. Please try again.";
     });
 };
 
@@ -234,38 +225,36 @@ document.addEventListener('DOMContentLoaded', () => {
         }
         searchTimeout = setTimeout(async () => {
             try {
-                const response = await fetch(`/api/products?search=${encodeURIComponent(searchTerm)}`);
-                const products = await response.json();
+                const response = await fetch(`/api/variants/suggest?q=${encodeURIComponent(searchTerm)}`);
+                const { suggestions } = await response.json();
                 searchResultsDiv.innerHTML = '';
                 selectedVariantForAdd = null;
-                if (products.length === 0) {
+                if (suggestions.length === 0) {
                     searchResultsDiv.innerHTML = '<p class="list-group-item">No matching products found.</p>';
                     return;
                 }
-                products.forEach(product => {
-                    product.variants.forEach(variant => {
-                        const resultItem = document.createElement('a');
-                        resultItem.href = '#';
-                        resultItem.className = 'list-group-item list-group-item-action';
-                        resultItem.innerHTML = `
-                            <strong>${product.name}</strong> (${variant.quantity_value}${variant.quantity_unit}) - KSh ${Number(variant.selling_price).toLocaleString()}
-                            <br><small>Stock: ${variant.stock_level}</small>
-                        `;
-                        resultItem.addEventListener('click', (e) => {
-                            e.preventDefault();
-                            productVariantSearchInput.value = `${product.name} (${variant.quantity_value}${variant.quantity_unit})`;
-                            searchResultsDiv.innerHTML = '';
-                            selectedVariantForAdd = {
-                                id: variant.id,
-                                productName: product.name,
-                                quantityValue: variant.quantity_value,
-                                quantityUnit: variant.quantity_unit,
-                                sellingPrice: variant.selling_price,
-                                stockLevel: variant.stock_level
-                            };
-                        });
-                        searchResultsDiv.appendChild(resultItem);
+                suggestions.forEach(variant => {
+                    const resultItem = document.createElement('a');
+                    resultItem.href = '#';
+                    resultItem.className = 'list-group-item list-group-item-action';
+                    resultItem.innerHTML = `
+                        <strong>${variant.product_name}</strong> (${variant.quantity_value}${variant.quantity_unit}) - KSh ${Number(variant.selling_price).toLocaleString()}
+                        <br><small>Stock: ${variant.stock_level}</small>
+                    `;
+                    resultItem.addEventListener('click', (e) => {
+                        e.preventDefault();
+                        productVariantSearchInput.value = `${variant.product_name} (${variant.quantity_value}${variant.quantity_unit})`;
+                        searchResultsDiv.innerHTML = '';
+                        selectedVariantForAdd = {
+                            id: variant.id,
+                            productName: variant.product_name,
+                            quantityValue: variant.quantity_value,
+                            quantityUnit: variant.quantity_unit,
+                            sellingPrice: variant.selling_price,
+                            stockLevel: variant.stock_level
+                        };
                     });
+                    searchResultsDiv.appendChild(resultItem);
                 });
             } catch (error) {
                 searchResultsDiv.innerHTML = '<p class="list-group-item text-danger">Error searching. Please try again.</p>';
@@ -401,20 +390,15 @@ document.addEventListener('DOMContentLoaded', () => {
             items: currentSaleItems.map(item => ({
                 product_variant_id: item.variantId,
                 quantity: item.quantity,
-                price_at_sale: item.sellingPrice
+                price: item.sellingPrice
             }))
         };
         try {
-            const response = await fetch('/api/manual-sale', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(saleData)
-            });
-            const result = await response.json();
-            if (response.ok && result.status === 'success') {
-                manualSaleFormMessage.textContent = result.message || 'Sale recorded successfully!';
+            const result = await PosSaleQueue.record(saleData);
+            if (result.status !== 'rejected' && result.status !== 'invalid') {
+                manualSaleFormMessage.textContent = result.status === 'queued'
+                    ? 'Offline: sale saved on this till and will sync automatically.'
+                    : 'Sale recorded successfully!';
                 manualSaleFormMessage.classList.remove('error');
                 manualSaleFormMessage.classList.add('success');
                 currentSaleItems = [];
@@ -428,7 +412,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 manualSaleFormMessage.classList.add('error');
             }
         } catch (error) {
-            manualSaleFormMessage.textContent = 'Network error. Please try again.';
+            manualSaleFormMessage.textContent = 'Could not save the sale on this device. Please try again.';
             manualSaleFormMessage.classList.add('error');
         } finally {
             setTimeout(() => {
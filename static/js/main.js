@@ -5,6 +5,87 @@
 // Get cart count element
 const cartItemCountSpan = document.getElementById('cartItemCount');
 
+// One Idempotency-Key per distinct order payload. Resubmitting the same order after a
+// network error (or a double submit) reuses the key, so the server creates it only once.
+const orderIdempotencyKeys = new Map();
+
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    const bytes = crypto.getRandomValues(new Uint8Array(16));
+    return Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+}
+
+// POST an order as JSON; the key is dropped once the server has answered
+async function postOrder(url, orderData) {
+    const body = JSON.stringify(orderData);
+    if (!orderIdempotencyKeys.has(body)) orderIdempotencyKeys.set(body, newIdempotencyKey());
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Idempotency-Key': orderIdempotencyKeys.get(body)
+        },
+        body
+    });
+    orderIdempotencyKeys.delete(body);
+    return response;
+}
+
+// A journaled checkout answers 202 with a reference; poll its status until it is confirmed, rejected or failed
+async function awaitOrderConfirmation(result) {
+    if (result.status !== 'accepted') return result;
+    const received = `Order received! Reference: ${result.reference}. We will confirm it shortly.`;
+    for (let attempt = 0; attempt < 30; attempt++) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        try {
+            const status = await (await fetch(result.status_url, { cache: 'no-store' })).json();
+            if (status.status === 'confirmed') return { status: 'success', message: status.message, order_id: status.order_id };
+            if (status.status === 'rejected' || status.status === 'failed') return { status: 'error', message: status.message };
+        } catch (error) {
+            console.error('Error checking order status:', error);
+        }
+    }
+    // Still queued: the order is safely journaled, so report it as received
+    return { status: 'success', message: received };
+}
+
+// Refresh price and stock of the whole cart in one request; returns what changed
+async function revalidateCart() {
+    const cart = getCart();
+    if (cart.length === 0) return [];
+    const response = await fetch('/api/cart/validate', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            cart_id: getCartId(),
+            items: cart.map(item => ({
+                product_variant_id: item.variantId,
+                quantity: item.customerQuantity,
+                selling_price: item.sellingPrice
+            }))
+        })
+    });
+    if (!response.ok) return [];
+    const result = await response.json();
+    const lines = new Map(result.lines.map(line => [String(line.product_variant_id), line]));
+    result.changes.forEach(change => {
+        if (change.change === 'price') cartPriceChanges[change.product_variant_id] = change.was;
+        if (change.change === 'stock') cartHoldShortfalls[change.product_variant_id] = change.now;
+    });
+    // Take current prices and names; drop lines whose variant no longer exists
+    const refreshed = cart.filter(item => lines.get(String(item.variantId))?.found !== false);
+    refreshed.forEach(item => {
+        const line = lines.get(String(item.variantId));
+        if (!line) return;
+        item.sellingPrice = line.selling_price;
+        item.productName = line.product_name;
+        item.quantityValue = line.quantity_value;
+        item.quantityUnit = line.quantity_unit;
+    });
+    saveCart(refreshed);
+    return result.changes;
+}
+
 // Load cart from localStorage
 function getCart() {
     const cart = localStorage.getItem('shoppingCart');
@@ -15,6 +96,54 @@ function getCart() {
 function saveCart(cart) {
     localStorage.setItem('shoppingCart', JSON.stringify(cart));
     updateCartCount(); // Update count whenever cart is saved
+    scheduleCartHoldSync();
+}
+
+// Stable id for this browser's cart; the server holds stock against it
+function getCartId() {
+    let cartId = localStorage.getItem('cartId');
+    if (!cartId) {
+        cartId = newIdempotencyKey();
+        localStorage.setItem('cartId', cartId);
+    }
+    return cartId;
+}
+
+// Lines the server could not fully hold: {variantId: units it did hold}
+let cartHoldShortfalls = {};
+// Lines whose price changed since they were added: {variantId: price the cart had}
+let cartPriceChanges = {};
+let cartHoldSyncTimer = null;
+
+// Coalesce quick +/- clicks into one hold update
+function scheduleCartHoldSync() {
+    clearTimeout(cartHoldSyncTimer);
+    cartHoldSyncTimer = setTimeout(syncCartHolds, 300);
+}
+
+// Hold stock for everything in the cart (renewing the hold), or release it for an empty cart
+async function syncCartHolds() {
+    const cart = getCart();
+    if (cart.length === 0 && !localStorage.getItem('cartId')) return;
+    try {
+        const response = await fetch('/api/cart/holds', {
+            method: 'PUT',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                cart_id: getCartId(),
+                items: cart.map(item => ({ product_variant_id: item.variantId, quantity: item.customerQuantity }))
+            })
+        });
+        if (!response.ok) return;
+        const result = await response.json();
+        cartHoldShortfalls = {};
+        result.holds.forEach(hold => {
+            if (hold.held < hold.requested) cartHoldShortfalls[hold.product_variant_id] = hold.held;
+        });
+        if (document.getElementById('cartContent')) renderCartItems();
+    } catch (error) {
+        console.error('Error holding cart stock:', error);
+    }
 }
 
 // Update cart count display in navbar
@@ -161,6 +290,24 @@ function attachTestimonialDotListeners(slides, dots) {
     });
 }
 
+// Data home() embeds in index.html (#initial-data); each entry is used for the first render only
+const initialData = (() => {
+    const island = document.getElementById('initial-data');
+    if (!island) return {};
+    try {
+        return JSON.parse(island.textContent);
+    } catch (error) {
+        console.error('Ignoring malformed initial data:', error);
+        return {};
+    }
+})();
+
+function takeInitialData(key) {
+    const data = initialData[key];
+    delete initialData[key];
+    return data;
+}
+
 // Load Testimonials from API
 async function loadTestimonials() {
     const testimonialSlider = document.querySelector('.testimonial-slider');
@@ -171,9 +318,12 @@ async function loadTestimonials() {
     testimonialNav.innerHTML = '';
 
     try {
-        const response = await fetch('/api/testimonials');
-        if (!response.ok) throw new Error('Failed to fetch testimonials');
-        const testimonials = await response.json();
+        let testimonials = takeInitialData('testimonials');
+        if (!testimonials) {
+            const response = await fetch('/api/testimonials');
+            if (!response.ok) throw new Error('Failed to fetch testimonials');
+            testimonials = await response.json();
+        }
 
         if (testimonials.length === 0) {
             testimonialSlider.innerHTML = '<div class="testimonial-slide active"><p class="testimonial-text">No testimonials available yet.</p></div>';
@@ -262,9 +412,12 @@ async function loadFAQs() {
     faqContainer.innerHTML = '';
 
     try {
-        const response = await fetch('/api/faqs');
-        if (!response.ok) throw new Error('Failed to fetch FAQs');
-        const faqs = await response.json();
+        let faqs = takeInitialData('faqs');
+        if (!faqs) {
+            const response = await fetch('/api/faqs');
+            if (!response.ok) throw new Error('Failed to fetch FAQs');
+            faqs = await response.json();
+        }
 
         if (faqs.length === 0) {
             faqContainer.innerHTML = '<div class="faq-item"><div class="faq-question"><h3>No FAQs available yet.</h3></div></div>';
@@ -292,21 +445,93 @@ async function loadFAQs() {
     }
 }
 
-// Load Products from API
-async function loadProducts(searchTerm = '') {
+// Render one filter button per category, with its product count, after "All Products"
+function renderCategoryFilters(categoryCounts) {
+    const filtersBar = document.querySelector('.product-filters');
+    const allBtn = filtersBar ? filtersBar.querySelector('.filter-btn[data-filter="all"]') : null;
+    if (!allBtn) return;
+
+    filtersBar.querySelectorAll('.filter-btn:not([data-filter="all"])').forEach(btn => btn.remove());
+    let previous = allBtn;
+    Object.entries(categoryCounts).forEach(([category, count]) => {
+        const btn = document.createElement('button');
+        btn.type = 'button';
+        btn.className = 'filter-btn' + (productFilters.category === category ? ' active' : '');
+        btn.dataset.filter = category;
+        btn.textContent = `${category} (${count})`;
+        previous.after(btn);
+        previous = btn;
+    });
+}
+
+// Show a "Load more" button under the grid while the API reports another page
+function renderLoadMoreButton(searchTerm, nextCursor) {
+    const productsGrid = document.querySelector('.products-grid');
+    let loadMoreBtn = document.getElementById('loadMoreProducts');
+    if (!nextCursor) {
+        if (loadMoreBtn) loadMoreBtn.remove();
+        return;
+    }
+    if (!loadMoreBtn) {
+        loadMoreBtn = document.createElement('button');
+        loadMoreBtn.id = 'loadMoreProducts';
+        loadMoreBtn.type = 'button';
+        loadMoreBtn.className = 'btn load-more-btn';
+        loadMoreBtn.textContent = 'Load more products';
+        productsGrid.after(loadMoreBtn);
+    }
+    loadMoreBtn.onclick = () => loadProducts(searchTerm, nextCursor);
+}
+
+// Load Products from API, one page at a time (pass a cursor to append the next page)
+// Cards are one grid column wide (minmax(280px, 1fr)), full width on phones
+const PRODUCT_IMAGE_SIZES = '(max-width: 600px) 100vw, 320px';
+
+// Responsive, lazy-loaded card image: WebP/JPEG renditions when the server has them,
+// with the blurred placeholder shown until the real image arrives
+function productImageMarkup(product, altText) {
+    const imageUrl = product.image_url ? product.image_url : '/static/images/placeholder.png';
+    const placeholderStyle = product.placeholder ? ` style="background-image: url('${product.placeholder}')"` : '';
+    const img = `<img src="${imageUrl}"${product.srcset ? ` srcset="${product.srcset}" sizes="${PRODUCT_IMAGE_SIZES}"` : ''} alt="${altText}" loading="lazy" decoding="async"${placeholderStyle}>`;
+    if (!product.srcset_webp) {
+        return img;
+    }
+    return `<picture><source type="image/webp" srcset="${product.srcset_webp}" sizes="${PRODUCT_IMAGE_SIZES}">${img}</picture>`;
+}
+
+async function loadProducts(searchTerm = '', cursor = null) {
     const productsGrid = document.querySelector('.products-grid');
     if (!productsGrid) return;
-    productsGrid.innerHTML = 'Loading products...';
+    if (!cursor) productsGrid.innerHTML = 'Loading products...';
     try {
+        const params = new URLSearchParams();
+        if (searchTerm) params.set('search', searchTerm);
+        if (productFilters.category) params.set('category', productFilters.category);
+        if (productFilters.inStock) params.set('in_stock', '1');
+        if (cursor) params.set('cursor', cursor);
         let url = '/api/products';
-        if (searchTerm) {
-            url += `?search=${encodeURIComponent(searchTerm)}`;
+        if (params.toString()) {
+            url += `?${params.toString()}`;
         }
 
-        const response = await fetch(url);
-        if (!response.ok) throw new Error('Failed to fetch products');
-        const products = await response.json();
-        productsGrid.innerHTML = '';
+        // The embedded first page only stands in for the bare, unfiltered request
+        const initialPage = takeInitialData('products');
+        let data = url === '/api/products' ? initialPage : undefined;
+        if (!data) {
+            const response = await fetch(url);
+            if (!response.ok) throw new Error('Failed to fetch products');
+            data = await response.json();
+        }
+        const products = data.products;
+        if (!cursor) productsGrid.innerHTML = '';
+        if (data.facets) renderCategoryFilters(data.facets.category);
+
+        if (data.fuzzy) {
+            const fuzzyNote = document.createElement('p');
+            fuzzyNote.className = 'search-fuzzy-note';
+            fuzzyNote.textContent = `No exact matches for "${searchTerm}". Showing the closest products.`;
+            productsGrid.appendChild(fuzzyNote);
+        }
 
         products.forEach(product => {
             // Ensure product.name is not null/undefined/empty string before using it in data-attribute
@@ -315,10 +540,9 @@ async function loadProducts(searchTerm = '') {
             const productCard = document.createElement('div');
             productCard.className = 'product-card';
             productCard.dataset.category = product.category;
-            const imageUrl = product.image_url ? product.image_url : '/static/images/placeholder.png';
             productCard.innerHTML = `
                 <div class="product-img">
-                    <img src="${imageUrl}" alt="${productNameForDisplay}">
+                    ${productImageMarkup(product, productNameForDisplay)}
                 </div>
                 <div class="product-info">
                     <span class="product-category">${product.category.charAt(0).toUpperCase() + product.category.slice(1).replace('-', ' ')}</span>
@@ -355,6 +579,7 @@ async function loadProducts(searchTerm = '') {
         // Ensure listeners are attached AFTER products are appended
         attachOrderButtonListeners();
         attachVariantSelectListeners();
+        renderLoadMoreButton(searchTerm, data.next_cursor);
 
     } catch (error) {
         console.error('Error loading products:', error);
@@ -486,8 +711,8 @@ const header = document.getElementById('header');
 // Active Navigation Link sections
 const sections = document.querySelectorAll('section');
 
-// Product Filter
-const filterBtns = document.querySelectorAll('.filter-btn');
+// Product Filter (applied server-side by /api/products)
+const productFilters = { category: '', inStock: false };
 
 // Gallery Lightbox
 const galleryItems = document.querySelectorAll('.gallery-item');
@@ -585,8 +810,12 @@ function renderCartItems() {
                 <img src="${item.imageUrl || '/static/images/placeholder.png'}" alt="${item.productName}" class="cart-item-image">
                 <span class="cart-item-name">${item.productName} (${item.quantityValue}${item.quantityUnit})</span>
             </td>
-            <td>KSh ${Number(item.sellingPrice).toLocaleString()}</td>
             <td>
+                KSh ${Number(item.sellingPrice).toLocaleString()}
+                ${item.variantId in cartPriceChanges ? `<div class="cart-item-shortfall">Was KSh ${Number(cartPriceChanges[item.variantId]).toLocaleString()}</div>` : ''}
+            </td>
+            <td>
+                ${item.variantId in cartHoldShortfalls ? `<div class="cart-item-shortfall">Only ${cartHoldShortfalls[item.variantId]} available</div>` : ''}
                 <div class="cart-item-actions">
                     <button class="btn btn-sm btn-secondary decrease-quantity" data-variant-id="${item.variantId}">-</button>
                     <span>${item.customerQuantity}</span>
@@ -720,22 +949,24 @@ window.addEventListener('scroll', () => {
     });
 });
 
-// Product Filter Listeners (These are fine as they target static filter buttons, then re-select dynamic product cards)
-if (filterBtns) {
-    filterBtns.forEach(btn => {
-        btn.addEventListener('click', () => {
-            filterBtns.forEach(filterBtn => filterBtn.classList.remove('active'));
-            btn.classList.add('active');
-            const filter = btn.dataset.filter;
-            const currentProductCards = document.querySelectorAll('.product-card'); // Re-select dynamic cards
-            currentProductCards.forEach(card => {
-                if (filter === 'all' || card.dataset.category === filter) {
-                    card.style.display = 'block';
-                } else {
-                    card.style.display = 'none';
-                }
-            });
-        });
+// Product Filter Listeners (delegated, since category buttons are rendered from the API's facet counts)
+const productFiltersBar = document.querySelector('.product-filters');
+if (productFiltersBar) {
+    productFiltersBar.addEventListener('click', (e) => {
+        const btn = e.target.closest('.filter-btn');
+        if (!btn) return;
+        productFiltersBar.querySelectorAll('.filter-btn').forEach(filterBtn => filterBtn.classList.remove('active'));
+        btn.classList.add('active');
+        productFilters.category = btn.dataset.filter === 'all' ? '' : btn.dataset.filter;
+        loadProducts(productSearchInput ? productSearchInput.value.trim() : '');
+    });
+}
+
+const inStockFilter = document.getElementById('inStockFilter');
+if (inStockFilter) {
+    inStockFilter.addEventListener('change', () => {
+        productFilters.inStock = inStockFilter.checked;
+        loadProducts(productSearchInput ? productSearchInput.value.trim() : '');
     });
 }
 
@@ -890,15 +1121,9 @@ if (orderForm && orderFormMessage) {
                     }]
                 };
 
-                const response = await fetch('/api/submit-full-order', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify(orderData)
-                });
+                const response = await postOrder('/api/submit-full-order', orderData);
 
-                const result = await response.json();
+                const result = await awaitOrderConfirmation(await response.json());
                 if (response.ok && result.status === 'success') {
                     orderFormMessage.innerHTML = `
                         ${result.message || 'Thank you for your order! We will contact you soon to confirm.'}
@@ -1201,11 +1426,15 @@ function attachVariantSelectListeners() {
     });
 }
 
-// Call dynamic content loading functions on window load
-window.addEventListener('load', async () => {
+// Render dynamic content as soon as the DOM is ready; with the embedded data
+// there is nothing to wait for, and 'load' would also wait on every image
+document.addEventListener('DOMContentLoaded', async () => {
     if (window.location.pathname === '/cart') {
         updateCartCount(); // Ensure count is correct on cart page
         renderCartItems(); // Render items on cart page
+        syncCartHolds(); // Renew the stock hold while the customer is checking out
+        // Prices and stock may have moved since the items were added
+        revalidateCart().then(renderCartItems).catch(error => console.error('Error refreshing cart:', error));
     } else {
         // Only load these on the homepage (index.html)
         await loadProducts('');
@@ -1273,12 +1502,27 @@ if (checkoutForm && checkoutFormMessage) {
             return;
         }
 
+        // Order at today's prices and stock: if the cart was out of date, show it before submitting
+        try {
+            const changes = await revalidateCart();
+            if (changes.length > 0) {
+                renderCartItems();
+                checkoutFormMessage.textContent = 'Some prices or stock levels in your cart have changed. Please review your cart and submit again.';
+                checkoutFormMessage.classList.remove('success');
+                checkoutFormMessage.classList.add('error');
+                return;
+            }
+        } catch (error) {
+            console.error('Error refreshing cart:', error);
+        }
+
         // Create a comprehensive order object to send to backend
         const orderData = {
             customer_name: name,
             customer_email: email,
             customer_phone: phone,
             delivery_address: address,
+            cart_id: getCartId(), // Stock held for this cart is sold to this order
             items: cart.map(item => ({
                 product_variant_id: item.variantId,
                 quantity: item.customerQuantity,
@@ -1292,15 +1536,9 @@ if (checkoutForm && checkoutFormMessage) {
 
         // --- Actual Backend Submission (Call /api/submit-full-order) ---
         try {
-            const response = await fetch('/api/submit-full-order', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json' // Important: Sending JSON
-                },
-                body: JSON.stringify(orderData) // Send the orderData object as JSON
-            });
+            const response = await postOrder('/api/submit-full-order', orderData);
 
-            const result = await response.json();
+            const result = await awaitOrderConfirmation(await response.json());
 
             if (response.ok && result.status === 'success') {
                 checkoutFormMessage.innerHTML = `
@@ -0,0 +1,158 @@
+// Offline-first queue for POS sales
+//
+// Every sale is written to IndexedDB before anything is sent, with a client_sale_id
+// made at the till, then flushed to /api/manual-sales/batch whenever the network is
+// up. The server records each id once, so a batch can be resent safely after a
+// dropped connection. Sales the server turns away are kept for staff to retry or
+// dismiss, and are not sent again until they do.
+
+const PosSaleQueue = (() => {
+    const DB_NAME = 'kaboy-pos';
+    const STORE = 'pendingSales';
+    const BATCH_SIZE = 200;
+    const RETRY_INTERVAL_MS = 30000;
+
+    let dbPromise = null;
+    let flushing = null;
+    const listeners = [];
+
+    function openDb() {
+        if (!dbPromise) {
+            dbPromise = new Promise((resolve, reject) => {
+                const request = indexedDB.open(DB_NAME, 1);
+                request.onupgradeneeded = () => {
+                    const store = request.result.createObjectStore(STORE, { keyPath: 'client_sale_id' });
+                    store.createIndex('queued_at', 'queued_at');
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            });
+        }
+        return dbPromise;
+    }
+
+    // Run `work(store)` in one transaction and resolve with its request's result
+    async function withStore(mode, work) {
+        const db = await openDb();
+        return new Promise((resolve, reject) => {
+            const tx = db.transaction(STORE, mode);
+            const request = work(tx.objectStore(STORE));
+            tx.oncomplete = () => resolve(request ? request.result : undefined);
+            tx.onerror = () => reject(tx.error);
+        });
+    }
+
+    function newSaleId() {
+        if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+        const bytes = crypto.getRandomValues(new Uint8Array(16));
+        return Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    // Oldest first, so the earliest sales get the stock if it runs short
+    function pending() {
+        return withStore('readonly', store => store.index('queued_at').getAll());
+    }
+
+    async function notify() {
+        const sales = await pending();
+        const summary = {
+            pending: sales.length,
+            needsAttention: sales.filter(sale => sale.error).length,
+            sales
+        };
+        listeners.forEach(listener => listener(summary));
+    }
+
+    async function sendBatch(sales) {
+        const response = await fetch('/api/manual-sales/batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ sales: sales.map(({ queued_at, error, ...sale }) => sale) })
+        });
+        if (!response.ok) throw new Error(`Sync failed with HTTP ${response.status}`);
+        return (await response.json()).results;
+    }
+
+    // Send everything queued; resolves with {client_sale_id: result} for what the server answered
+    function flush() {
+        if (flushing) return flushing;
+        flushing = (async () => {
+            const outcomes = {};
+            try {
+                // A turned-away sale resent unasked could go through hours later, once stock turns up
+                const sales = (await pending()).filter(sale => !sale.error);
+                for (let start = 0; start < sales.length; start += BATCH_SIZE) {
+                    const batch = sales.slice(start, start + BATCH_SIZE);
+                    const results = await sendBatch(batch);
+                    await withStore('readwrite', store => {
+                        results.forEach((result, i) => {
+                            outcomes[result.client_sale_id] = result;
+                            if (result.status === 'recorded' || result.status === 'duplicate') {
+                                store.delete(batch[i].client_sale_id);
+                            } else {
+                                // Rejected for stock or invalid: kept for staff to retry or dismiss
+                                store.put({ ...batch[i], error: result.message || result.status });
+                            }
+                        });
+                    });
+                }
+            } catch (error) {
+                // Offline or the server is down: everything stays queued for the next attempt
+                console.warn('POS sales not synced yet:', error);
+            } finally {
+                flushing = null;
+                notify();
+            }
+            return outcomes;
+        })();
+        return flushing;
+    }
+
+    // Queue a sale and try to send it straight away.
+    // Resolves with the server's result for it, or {status: 'queued'} when offline.
+    async function record(sale) {
+        const queued = {
+            ...sale,
+            client_sale_id: newSaleId(),
+            sold_at: new Date().toISOString(),
+            queued_at: Date.now()
+        };
+        await withStore('readwrite', store => store.put(queued));
+        if (flushing) await flushing;
+        const outcome = (await flush())[queued.client_sale_id];
+        if (outcome && (outcome.status === 'rejected' || outcome.status === 'invalid')) {
+            // The cashier is still at the till to fix this one, so do not keep it queued
+            await withStore('readwrite', store => store.delete(queued.client_sale_id));
+            notify();
+        }
+        return outcome || { client_sale_id: queued.client_sale_id, status: 'queued' };
+    }
+
+    // Send a sale the server turned away once more, e.g. after a stock delivery.
+    // Resolves like record(), or with undefined when the sale is no longer queued.
+    async function retry(clientSaleId) {
+        const sale = await withStore('readonly', store => store.get(clientSaleId));
+        if (!sale) return undefined;
+        const { error, ...queued } = sale;
+        await withStore('readwrite', store => store.put(queued));
+        if (flushing) await flushing;
+        return (await flush())[clientSaleId] || { client_sale_id: clientSaleId, status: 'queued' };
+    }
+
+    // Give up on a sale the server turned away
+    async function discard(clientSaleId) {
+        await withStore('readwrite', store => store.delete(clientSaleId));
+        notify();
+    }
+
+    function onChange(listener) {
+        listeners.push(listener);
+        notify();
+    }
+
+    window.addEventListener('online', flush);
+    setInterval(flush, RETRY_INTERVAL_MS);
+    flush();
+
+    return { record, flush, pending, retry, discard, onChange };
+})();
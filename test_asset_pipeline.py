@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests for the build_assets.py fingerprint build and the asset_url() template helper
+"""
+
+import json
+
+import pytest
+
+import build_assets
+from app import app, asset_url
+
+SCRIPT = """// Cart helpers
+const pattern = /^[^\\s@]+@[^\\s@]+$/;   // email check
+function total(items) {
+    /* sum every line */
+    return items.reduce((sum, item) => sum + item.price * item.qty, 0) / 1;
+}
+"""
+STYLESHEET = "/* Layout */\nbody {\n    margin: 0;\n    padding: 0;\n}\n"
+
+
+@pytest.fixture
+def static_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'static_folder', str(tmp_path))
+    (tmp_path / 'js').mkdir()
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'js' / 'app.js').write_text(SCRIPT * 20)
+    (tmp_path / 'css' / 'site.css').write_text(STYLESHEET)
+    return tmp_path
+
+
+def test_files_are_copied_as_is_without_a_minifier(static_dir, monkeypatch):
+    monkeypatch.setattr(build_assets, 'MINIFIERS', {'.css': None, '.js': None})
+    manifest = build_assets.build_assets(str(static_dir))
+    assert (static_dir / manifest['js/app.js']).read_text() == SCRIPT * 20
+    assert (static_dir / manifest['css/site.css']).read_text() == STYLESHEET
+
+
+def test_minifiers_are_applied_when_installed(static_dir, monkeypatch):
+    monkeypatch.setattr(build_assets, 'MINIFIERS', {'.css': str.strip, '.js': str.upper})
+    manifest = build_assets.build_assets(str(static_dir))
+    assert (static_dir / manifest['js/app.js']).read_text() == (SCRIPT * 20).upper()
+    assert (static_dir / manifest['css/site.css']).read_text() == STYLESHEET.strip()
+
+
+def test_build_writes_fingerprinted_files_and_manifest(static_dir):
+    result = app.test_cli_runner().invoke(args=['build-assets'])
+    assert result.exit_code == 0
+
+    manifest = json.loads((static_dir / 'dist' / 'manifest.json').read_text())
+    assert set(manifest) == {'js/app.js', 'css/site.css'}
+    built = static_dir / manifest['css/site.css']
+    assert built.name.startswith('site.')
+    minify = build_assets.MINIFIERS['.css']
+    assert built.read_text() == (minify(STYLESHEET) if minify else STYLESHEET)
+    assert (static_dir / (manifest['js/app.js'] + '.gz')).exists()
+
+    # Same content, same name: a rebuild is a no-op for unchanged files
+    app.test_cli_runner().invoke(args=['build-assets'])
+    assert json.loads((static_dir / 'dist' / 'manifest.json').read_text()) == manifest
+
+
+def test_asset_url_and_immutable_caching(static_dir):
+    with app.test_request_context():
+        assert asset_url('js/app.js') == '/static/js/app.js'
+
+    app.test_cli_runner().invoke(args=['build-assets'])
+    with app.test_request_context():
+        url = asset_url('js/app.js')
+    assert url.startswith('/static/dist/js/app.') and url.endswith('.js')
+
+    client = app.test_client()
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    response.close()
+
+    source = client.get('/static/js/app.js')
+    assert 'immutable' not in source.headers.get('Cache-Control', '')
+    source.close()
+
+
+def test_templates_use_asset_url(static_dir):
+    (static_dir / 'js' / 'main.js').write_text("console.log('storefront');\n")
+    (static_dir / 'css' / 'style.css').write_text("body { color: #333; }\n")
+    app.test_cli_runner().invoke(args=['build-assets'])
+    manifest = json.loads((static_dir / 'dist' / 'manifest.json').read_text())
+
+    with app.test_request_context():
+        html = app.jinja_env.get_template('cart.html').render()
+    assert f"/static/{manifest['js/main.js']}" in html
+    assert f"/static/{manifest['css/style.css']}" in html
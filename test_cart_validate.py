@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for /api/cart/validate, the single-query cart refresh
+"""
+
+import pytest
+
+from app import db, Product, ProductVariant
+
+
+@pytest.fixture
+def seed():
+    products = []
+    for i in range(40):
+        product = Product(name=f"Product {i:02d}", category="Seed", description="Test product")
+        product.variants.append(ProductVariant(quantity_value=1.0, quantity_unit="kg", selling_price=100.0 + i, stock_level=5))
+        products.append(product)
+    return products
+
+
+def variant_ids():
+    return [variant.id for variant in ProductVariant.query.order_by(ProductVariant.id)]
+
+
+def validate(client, lines, cart_id=None):
+    body = {'items': [{'product_variant_id': variant_id, 'quantity': quantity, 'selling_price': price}
+                      for variant_id, quantity, price in lines]}
+    if cart_id:
+        body['cart_id'] = cart_id
+    return client.post('/api/cart/validate', json=body)
+
+
+def test_current_cart_is_valid(client):
+    first, second = variant_ids()[:2]
+    body = validate(client, [(second, 2, 101.0), (first, 1, 100.0)]).get_json()
+    assert body['valid'] is True
+    assert body['changes'] == []
+    assert [line['product_variant_id'] for line in body['lines']] == [second, first]
+    assert body['lines'][0]['product_name'] == "Product 01"
+    assert body['lines'][0]['available'] == 5
+    assert body['total'] == 2 * 101.0 + 100.0
+
+
+def test_changes_are_reported(client):
+    first, second = variant_ids()[:2]
+    db.session.get(ProductVariant, first).selling_price = 120.0
+    db.session.commit()
+
+    body = validate(client, [(first, 1, 100.0), (second, 9, 101.0), (999, 1, 50.0)]).get_json()
+    assert body['valid'] is False
+    assert body['changes'] == [
+        {'product_variant_id': first, 'change': 'price', 'was': 100.0, 'now': 120.0},
+        {'product_variant_id': second, 'change': 'stock', 'was': 9, 'now': 5},
+        {'product_variant_id': 999, 'change': 'removed'},
+    ]
+    assert body['lines'][0]['selling_price'] == 120.0
+    assert body['lines'][2] == {'product_variant_id': 999, 'quantity': 1, 'found': False, 'available': 0}
+
+
+def test_one_query_for_any_cart_size(client, count_statements):
+    ids = variant_ids()
+    counts = []
+    for size in (1, 40):
+        with count_statements() as statements:
+            assert validate(client, [(variant_id, 1, None) for variant_id in ids[:size]]).status_code == 200
+        counts.append(len(statements))
+    assert counts == [1, 1]
+
+
+def test_own_holds_count_as_available(client):
+    first = variant_ids()[0]
+    client.put('/api/cart/holds', json={'cart_id': 'cart-a', 'items': [{'product_variant_id': first, 'quantity': 4}]})
+    assert validate(client, [(first, 4, None)], cart_id='cart-a').get_json()['valid'] is True
+    other = validate(client, [(first, 4, None)], cart_id='cart-b').get_json()
+    assert other['changes'] == [{'product_variant_id': first, 'change': 'stock', 'was': 4, 'now': 1}]
+
+
+def test_invalid_items(client):
+    assert client.post('/api/cart/validate', json={'items': [{'quantity': 1}]}).status_code == 400
+    assert client.post('/api/cart/validate', json={'items': 'nope'}).status_code == 400
+    assert client.post('/api/cart/validate', json={}).get_json()['lines'] == []
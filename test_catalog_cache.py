@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests for the versioned catalog snapshot cache
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from app import db, catalog_cache, Product, ProductVariant, ProductVariantAdminView
+
+
+@pytest.fixture
+def seed():
+    product = Product(name="DAP Fertilizer", category="Fertilizer", description="Phosphate fertilizer")
+    product.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2800.0, stock_level=12))
+    return [product]
+
+
+def stock_levels(client):
+    products = client.get('/api/products').get_json()['products']
+    return [variant['stock_level'] for product in products for variant in product['variants']]
+
+
+def test_repeat_request_is_served_without_queries(client, count_statements):
+    first = client.get('/api/products').data
+
+    with count_statements() as statements:
+        second = client.get('/api/products').data
+
+    assert second == first
+    # Only the shared version is read, to learn whether another process changed the catalog
+    assert len(statements) == 1
+
+
+def test_checkout_invalidates_snapshot(client):
+    assert stock_levels(client) == [12]
+    variant = ProductVariant.query.one()
+
+    response = client.post('/api/submit-full-order', json={
+        'customer_name': 'Jane Doe',
+        'customer_email': 'jane@example.com',
+        'customer_phone': '0712345678',
+        'delivery_address': 'Nchiru',
+        'items': [{'product_variant_id': variant.id, 'quantity': 2, 'selling_price': 2800.0}]
+    })
+    assert response.status_code == 200
+    assert stock_levels(client) == [10]
+
+
+def test_manual_sale_invalidates_snapshot(client):
+    assert stock_levels(client) == [12]
+    variant = ProductVariant.query.one()
+
+    response = client.post('/api/manual-sale', json={
+        'total_cost': 2800.0,
+        'amount_paid': 3000.0,
+        'change_given': 200.0,
+        'payment_mode': 'Cash',
+        'items': [{'product_variant_id': variant.id, 'quantity': 1, 'price': 2800.0}]
+    })
+    assert response.status_code == 200
+    assert stock_levels(client) == [11]
+
+
+def test_admin_save_invalidates_snapshot(client):
+    assert stock_levels(client) == [12]
+    variant = ProductVariant.query.one()
+    variant.stock_level = 40
+    db.session.commit()
+    # Direct writes are not seen until an admin hook bumps the version
+    assert stock_levels(client) == [12]
+
+    # The admin bumps before it commits, as the edit form does
+    variant.stock_level = 41
+    ProductVariantAdminView(ProductVariant, db.session).on_model_change(SimpleNamespace(barcodes=SimpleNamespace(data='')), variant, False)
+    db.session.commit()
+    assert stock_levels(client) == [41]
+
+
+def test_writes_from_another_process_invalidate_snapshot(client):
+    assert stock_levels(client) == [12]
+    # Start the next request from a new session, as a real request would
+    db.session.remove()
+    # Another worker's sale: its own connection and transaction, nothing shared in memory
+    with db.engine.begin() as connection:
+        connection.execute(db.update(ProductVariant).values(stock_level=7))
+        catalog_cache.bump(connection)
+    assert stock_levels(client) == [7]
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Tests for /api/catalog/changes, the delta feed POS terminals sync their local catalog from
+"""
+
+import pytest
+
+from app import db, catalog_cache, CatalogChange, Product, ProductVariant
+
+
+@pytest.fixture
+def seed():
+    products = []
+    for i in range(3):
+        product = Product(name=f"Product {i}", category="Seed", description="Test product")
+        product.variants.append(ProductVariant(quantity_value=1.0, quantity_unit="kg", selling_price=100.0, stock_level=10))
+        product.variants.append(ProductVariant(quantity_value=5.0, quantity_unit="kg", selling_price=450.0, stock_level=10))
+        products.append(product)
+    return products
+
+
+def changes(client, since, **args):
+    return client.get('/api/catalog/changes', query_string={'since': since, **args}).get_json()
+
+
+def latest(client):
+    return changes(client, 0)['next_since']
+
+
+def test_full_sync_from_zero(client):
+    body = changes(client, 0)
+    assert body['has_more'] is False
+    assert [product['name'] for product in body['products']] == ["Product 0", "Product 1", "Product 2"]
+    assert len(body['variants']) == 6
+    variant = body['variants'][0]
+    assert variant['product_id'] == body['products'][0]['id']
+    assert variant['display_name'] == "Product 0 (1.0kg) - KSh 100.0"
+    assert variant['updated_at'].endswith('Z')
+    assert body['deleted'] == {'products': [], 'variants': []}
+    # Nothing new since then
+    again = changes(client, body['next_since'])
+    assert again['products'] == again['variants'] == []
+    assert again['next_since'] == body['next_since']
+
+
+def test_only_changed_rows_are_sent(client):
+    since = latest(client)
+    variant = ProductVariant.query.order_by(ProductVariant.id).first()
+    variant.selling_price = 120.0
+    catalog_cache.bump()
+    db.session.commit()
+
+    body = changes(client, since)
+    assert body['products'] == []
+    assert [(row['id'], row['selling_price']) for row in body['variants']] == [(variant.id, 120.0)]
+    assert body['next_since'] > since
+
+
+def test_sequence_numbers_are_never_reused(client):
+    variant = ProductVariant.query.order_by(ProductVariant.id.desc()).first()
+    seen = [latest(client)]
+    for price in (1.0, 2.0, 3.0):
+        # The same row is the newest entry every time, and is replaced each time
+        variant.selling_price = price
+        catalog_cache.bump()
+        db.session.commit()
+        body = changes(client, seen[-1])
+        assert [row['selling_price'] for row in body['variants']] == [price]
+        seen.append(body['next_since'])
+    assert seen == sorted(set(seen))
+    assert CatalogChange.query.count() == 9
+
+
+def test_sales_send_the_new_stock(client):
+    since = latest(client)
+    variant_id = ProductVariant.query.order_by(ProductVariant.id).first().id
+    response = client.post('/api/manual-sale', json={
+        'total_cost': 300.0, 'amount_paid': 300.0, 'change_given': 0.0, 'payment_mode': 'Cash',
+        'items': [{'product_variant_id': variant_id, 'quantity': 3, 'price': 100.0}]
+    })
+    assert response.status_code == 200
+
+    body = changes(client, since)
+    assert [(row['id'], row['stock_level']) for row in body['variants']] == [(variant_id, 7)]
+
+
+def test_renamed_product_resends_its_variants(client):
+    since = latest(client)
+    product = Product.query.order_by(Product.id).first()
+    product.name = "Renamed"
+    catalog_cache.bump()
+    db.session.commit()
+
+    body = changes(client, since)
+    assert [row['name'] for row in body['products']] == ["Renamed"]
+    assert [row['product_name'] for row in body['variants']] == ["Renamed", "Renamed"]
+
+
+def test_deletes_are_reported(client):
+    since = latest(client)
+    product = Product.query.order_by(Product.id).first()
+    product_id, variant_ids = product.id, sorted(variant.id for variant in product.variants)
+    db.session.delete(product)
+    catalog_cache.bump()
+    db.session.commit()
+
+    body = changes(client, since)
+    assert body['products'] == body['variants'] == []
+    assert body['deleted'] == {'products': [product_id], 'variants': variant_ids}
+
+
+def test_paging(client):
+    seen, since, pages = [], 0, 0
+    while True:
+        body = changes(client, since, limit=4)
+        seen += [row['id'] for row in body['products']]
+        since, pages = body['next_since'], pages + 1
+        if not body['has_more']:
+            break
+    assert pages == 3
+    assert sorted(seen) == [product.id for product in Product.query.order_by(Product.id)]
+
+
+def test_query_count_does_not_grow_with_the_page(client, count_statements):
+    with count_statements() as statements:
+        assert len(changes(client, 0)['variants']) == 6
+    # Snapshot version, the change log page and the rows it names
+    assert len(statements) == 4
+
+
+def test_existing_catalog_is_backfilled(client):
+    CatalogChange.__table__.drop(db.engine)
+    db.create_all()
+    catalog_cache.bump()
+    db.session.commit()
+    body = changes(client, 0)
+    assert len(body['products']) == 3
+    assert len(body['variants']) == 6
+
+
+def test_invalid_since(client):
+    assert client.get('/api/catalog/changes?since=abc').status_code == 400
+    assert client.get('/api/catalog/changes?since=-1').status_code == 400
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests for /api/products filters and the maintained facet counts
+"""
+
+import pytest
+
+from app import app, db, facet_counts, Product, ProductVariant
+
+
+@pytest.fixture
+def seed():
+    dap = Product(name="DAP Fertilizer", category="Fertilizer", description="Phosphate fertilizer")
+    dap.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2800.0, stock_level=0, supplier="Yara"))
+    dap.variants.append(ProductVariant(quantity_value=25.0, quantity_unit="kg", selling_price=1500.0, stock_level=6, supplier="Yara"))
+    can = Product(name="CAN", category="Fertilizer", description="Nitrogen fertilizer")
+    can.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2500.0, stock_level=0, supplier="Mea Ltd"))
+    sevin = Product(name="Sevin Dust", category="Pesticide", description="Insecticide")
+    sevin.variants.append(ProductVariant(quantity_value=1.0, quantity_unit="l", selling_price=800.0, stock_level=30, supplier="Bayer"))
+    return [dap, can, sevin]
+
+
+def names(client, **params):
+    response = client.get('/api/products', query_string=params)
+    assert response.status_code == 200
+    return [p['name'] for p in response.get_json()['products']]
+
+
+def test_filters(client):
+    assert names(client, category="Fertilizer") == ["CAN", "DAP Fertilizer"]
+    assert names(client, in_stock=1) == ["DAP Fertilizer", "Sevin Dust"]
+    assert names(client, category="Fertilizer", in_stock=1) == ["DAP Fertilizer"]
+    assert names(client, min_price=2000) == ["CAN", "DAP Fertilizer"]
+    assert names(client, max_price=1000) == ["Sevin Dust"]
+    assert names(client, supplier="Yara", max_price=2000) == ["DAP Fertilizer"]
+    # Both conditions must hold for one variant: DAP's in-stock bag costs 1500
+    assert names(client, in_stock=1, min_price=2000) == []
+
+
+def test_bad_price_is_rejected(client):
+    assert client.get('/api/products?min_price=cheap').status_code == 400
+
+
+def test_facets_on_first_page_only(client):
+    data = client.get('/api/products?limit=1').get_json()
+    assert data['facets'] == {
+        'category': {'Fertilizer': 2, 'Pesticide': 1},
+        'supplier': {'Bayer': 1, 'Mea Ltd': 1, 'Yara': 2},
+    }
+    assert 'facets' not in client.get(f"/api/products?limit=1&cursor={data['next_cursor']}").get_json()
+
+
+def test_counts_follow_writes(client):
+    sevin = Product.query.filter_by(name="Sevin Dust").one()
+    sevin.category = "Fertilizer"
+    db.session.commit()
+    assert facet_counts()['category'] == {'Fertilizer': 3}
+
+    variant = ProductVariant.query.filter_by(supplier="Mea Ltd").one()
+    variant.supplier = "Yara"
+    db.session.commit()
+    assert facet_counts()['supplier'] == {'Bayer': 1, 'Yara': 3}
+
+    db.session.delete(Product.query.filter_by(name="DAP Fertilizer").one())
+    db.session.commit()
+    assert facet_counts() == {'category': {'Fertilizer': 2}, 'supplier': {'Bayer': 1, 'Yara': 1}}
+
+
+def test_rebuild_command_recounts(client):
+    db.session.execute(db.text("DELETE FROM catalog_facet"))
+    db.session.commit()
+    assert facet_counts() == {'category': {}, 'supplier': {}}
+
+    result = app.test_cli_runner().invoke(args=['rebuild-facet-counts'])
+    assert result.exit_code == 0
+    assert facet_counts()['category'] == {'Fertilizer': 2, 'Pesticide': 1}
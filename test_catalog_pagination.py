@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Tests for keyset pagination on /api/products and /api/product-variants
+"""
+
+import pytest
+
+from app import Product, ProductVariant, CATALOG_MAX_PAGE_SIZE
+
+
+@pytest.fixture
+def seed():
+    # Duplicate names make sure the id tie-breaker is honoured
+    products = []
+    for i in range(30):
+        product = Product(name=f"Product {i % 10:02d}", category="Fertilizer", description="Test product")
+        product.variants.append(ProductVariant(quantity_value=1.0, quantity_unit="kg", selling_price=100.0 + i, stock_level=5))
+        product.variants.append(ProductVariant(quantity_value=5.0, quantity_unit="kg", selling_price=400.0 + i, stock_level=5))
+        products.append(product)
+    return products
+
+
+def collect_pages(client, url, key, limit):
+    seen = []
+    cursor = None
+    while True:
+        query = f"{url}?limit={limit}" + (f"&cursor={cursor}" if cursor else "")
+        data = client.get(query).get_json()
+        assert len(data[key]) <= limit
+        seen.extend(data[key])
+        cursor = data['next_cursor']
+        if not cursor:
+            return seen
+
+
+def test_products_pages_cover_catalog_in_order(client):
+    products = collect_pages(client, '/api/products', 'products', 7)
+    keys = [(p['name'], p['id']) for p in products]
+    assert len(keys) == 30
+    assert keys == sorted(keys)
+    assert len(set(keys)) == 30
+
+
+def test_variants_pages_cover_catalog_in_order(client):
+    variants = collect_pages(client, '/api/product-variants', 'variants', 11)
+    keys = [(v['product_name'], v['id']) for v in variants]
+    assert len(keys) == 60
+    assert keys == sorted(keys)
+
+
+def test_page_size_is_capped(client):
+    data = client.get(f'/api/products?limit={CATALOG_MAX_PAGE_SIZE * 10}').get_json()
+    assert len(data['products']) == 30
+    assert data['next_cursor'] is None
+
+
+def test_invalid_cursor_is_rejected(client):
+    response = client.get('/api/products?cursor=not-a-cursor')
+    assert response.status_code == 400
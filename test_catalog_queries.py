@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Tests that catalog reads issue a fixed number of SQL statements, whatever the catalog size
+"""
+
+import pytest
+
+from app import db, catalog_cache, Product, ProductVariant
+
+
+def add_products(count):
+    for i in range(count):
+        product = Product(name=f"Product {i:03d}", category="Seed", description="Test product")
+        for value in (1.0, 2.0, 5.0):
+            product.variants.append(ProductVariant(quantity_value=value, quantity_unit="kg", selling_price=100.0 * value, stock_level=5, supplier="Local Supplier"))
+        db.session.add(product)
+    catalog_cache.bump()
+    db.session.commit()
+    # Start every request from an empty identity map, as a real request would
+    db.session.expunge_all()
+
+
+def statements_for(client, count_statements, url):
+    with count_statements() as statements:
+        response = client.get(url)
+    assert response.status_code == 200
+    db.session.remove()
+    return len(statements)
+
+
+@pytest.mark.parametrize('url', [
+    '/api/products?limit=100',
+    '/api/products?limit=100&search=product',
+    '/api/product-variants?limit=100',
+    '/api/product-variants?limit=100&search=local',
+])
+def test_statement_count_does_not_grow_with_catalog(client, count_statements, url):
+    add_products(2)
+    small = statements_for(client, count_statements, url)
+
+    add_products(30)
+    large = statements_for(client, count_statements, url)
+
+    assert small == large
+    # Snapshot version, page query, variants selectin load, held stock and, on /api/products, the facet counts
+    assert large <= 5
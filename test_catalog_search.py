@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests for the FTS5 product search index
+"""
+
+import pytest
+
+from app import app, db, Product, ProductVariant, ProductAdminView, ProductVariantAdminView
+
+
+@pytest.fixture
+def seed():
+    dap = Product(name="DAP Fertilizer", category="Fertilizer", description="Phosphate fertilizer for planting")
+    dap.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2800.0, stock_level=12, supplier="Yara"))
+    npk = Product(name="NPK 23:23:0", category="Fertilizer", description="Top dressing, works well after DAP")
+    npk.variants.append(ProductVariant(quantity_value=25.0, quantity_unit="kg", selling_price=1300.0, stock_level=15, supplier="Mea Ltd"))
+    sevin = Product(name="Sevin Dust", category="Pesticide", description="Controls insects on vegetables")
+    sevin.variants.append(ProductVariant(quantity_value=1.0, quantity_unit="l", selling_price=800.0, stock_level=30, supplier="Bayer"))
+    return [dap, npk, sevin]
+
+
+def product_names(client, search):
+    return [p['name'] for p in client.get(f'/api/products?search={search}').get_json()['products']]
+
+
+def test_prefix_search_ranks_name_matches_first(client):
+    assert product_names(client, 'da') == ["DAP Fertilizer", "NPK 23:23:0"]
+    assert product_names(client, 'fert phos') == ["DAP Fertilizer"]
+
+
+def test_variant_search_covers_supplier_and_unit(client):
+    variants = client.get('/api/product-variants?search=bay').get_json()['variants']
+    assert [v['product_name'] for v in variants] == ["Sevin Dust"]
+
+
+def test_index_follows_model_changes(client):
+    sevin = Product.query.filter_by(name="Sevin Dust").one()
+    sevin.name = "Duduthrin"
+    db.session.commit()
+    assert product_names(client, 'sevin') == []
+    assert product_names(client, 'dudu') == ["Duduthrin"]
+    variants = client.get('/api/product-variants?search=dudu').get_json()['variants']
+    assert [v['product_name'] for v in variants] == ["Duduthrin"]
+
+    db.session.delete(sevin)
+    db.session.commit()
+    assert product_names(client, 'dudu') == []
+    assert client.get('/api/product-variants?search=bayer').get_json()['variants'] == []
+
+
+def test_rebuild_command_repopulates_index(client):
+    db.session.execute(db.text("DELETE FROM product_fts"))
+    db.session.commit()
+    assert product_names(client, 'dap') == []
+
+    result = app.test_cli_runner().invoke(args=['rebuild-search-index'])
+    assert result.exit_code == 0
+    assert product_names(client, 'dap') == ["DAP Fertilizer", "NPK 23:23:0"]
+
+
+def test_admin_search_uses_index(client):
+    count, products = ProductAdminView(Product, db.session).get_list(0, None, False, 'insect', [])
+    assert count == 1
+    assert [p.name for p in products] == ["Sevin Dust"]
+
+    count, variants = ProductVariantAdminView(ProductVariant, db.session).get_list(0, None, False, 'mea', [])
+    assert count == 1
+    assert [v.supplier for v in variants] == ["Mea Ltd"]
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Tests that checkout resolves all cart lines in one query, bulk-inserts its items
+and prices them from the database
+"""
+
+
+import pytest
+
+from app import db, Order, OrderItem, Product, ProductVariant
+
+
+@pytest.fixture
+def seed():
+    products = []
+    for i in range(60):
+        product = Product(name=f"Product {i:02d}", category="Seed", description="Test product")
+        product.variants.append(ProductVariant(quantity_value=1.0, quantity_unit="kg", selling_price=100.0 + i, stock_level=50))
+        products.append(product)
+    return products
+
+
+def checkout(client, lines):
+    return client.post('/api/submit-full-order', json={
+        'customer_name': 'Wholesale Buyer',
+        'customer_email': 'buyer@example.com',
+        'customer_phone': '0712345678',
+        'delivery_address': 'Meru',
+        'items': [{'product_variant_id': variant_id, 'quantity': quantity, 'selling_price': 1.0}
+                  for variant_id, quantity in lines]
+    })
+
+
+def test_round_trips_do_not_grow_with_lines(client, count_statements):
+    variant_ids = [variant.id for variant in ProductVariant.query.order_by(ProductVariant.id)]
+
+    with count_statements() as small:
+        assert checkout(client, [(variant_ids[0], 1)]).status_code == 200
+    with count_statements() as large:
+        assert checkout(client, [(variant_id, 2) for variant_id in variant_ids[:50]]).status_code == 200
+
+    assert len(large) == len(small)
+    assert OrderItem.query.count() == 51
+
+
+def test_prices_come_from_the_database(client):
+    variants = ProductVariant.query.order_by(ProductVariant.id).limit(2).all()
+    response = checkout(client, [(variants[0].id, 2), (variants[1].id, 1)])
+    assert response.status_code == 200
+
+    order = db.session.get(Order, response.get_json()['order_id'])
+    assert order.total_amount == 2 * 100.0 + 101.0
+    assert sorted(item.price_at_purchase for item in order.items) == [100.0, 101.0]
+
+
+def test_unknown_variant_rejected_before_any_write(client, count_statements):
+    with count_statements() as statements:
+        response = checkout(client, [(999, 1)])
+    assert response.status_code == 409
+    assert response.get_json()['errors'][0]['message'] == "Product variant with ID 999 not found"
+    assert not any(statement.lstrip().upper().startswith(('INSERT', 'UPDATE')) for statement in statements)
+    assert Order.query.count() == 0
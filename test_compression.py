@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for gzip/brotli response compression and precompressed static files
+"""
+
+import gzip
+import os
+
+import pytest
+
+from app import app, compress_stream, Product, ProductVariant
+
+
+@pytest.fixture
+def seed():
+    products = []
+    for i in range(20):
+        product = Product(name=f"Maize Seed H{i:02d}", category="Seed", description="Hybrid maize for mid-altitude areas")
+        product.variants.append(ProductVariant(quantity_value=2.0, quantity_unit="kg", selling_price=650.0, stock_level=40, supplier="Kenya Seed"))
+        products.append(product)
+    return products
+
+
+@pytest.fixture
+def static_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'static_folder', str(tmp_path))
+    (tmp_path / 'app.js').write_text('console.log("kaboy");\n' * 100)
+    return tmp_path
+
+
+def test_gzip_is_negotiated(client):
+    plain = client.get('/api/products')
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    compressed = client.get('/api/products', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert int(compressed.headers['Content-Length']) == len(compressed.data) < len(plain.data)
+    assert gzip.decompress(compressed.data) == plain.data
+
+
+def test_small_and_refused_responses_stay_plain(client):
+    assert 'Content-Encoding' not in client.get('/api/products?limit=1&fields=id', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'Content-Encoding' not in client.get('/api/products', headers={'Accept-Encoding': 'identity'}).headers
+    assert 'Content-Encoding' not in client.get('/api/products', headers={'Accept-Encoding': 'gzip;q=0'}).headers
+
+
+def test_compressed_etag_revalidates(client):
+    first = client.get('/api/products', headers={'Accept-Encoding': 'gzip'})
+    etag = first.headers['ETag']
+    assert etag.startswith('W/')
+
+    second = client.get('/api/products', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.headers['ETag'] == etag
+
+
+def test_stream_compression_flushes_each_chunk():
+    chunks = [b'{"products": [', b'{"id": 1}, ' * 50, b'{"id": 2}]}']
+    parts = list(compress_stream(iter(chunks), 'gzip'))
+    assert len(parts) >= len(chunks)
+    assert gzip.decompress(b''.join(parts)) == b''.join(chunks)
+
+
+def test_precompressed_sibling_is_served(client, static_dir):
+    assert client.get('/static/app.js', headers={'Accept-Encoding': 'gzip'}).headers.get('Content-Encoding') is None
+
+    result = app.test_cli_runner().invoke(args=['compress-static'])
+    assert result.exit_code == 0
+    assert (static_dir / 'app.js.gz').exists()
+
+    response = client.get('/static/app.js', headers={'Accept-Encoding': 'br, gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/javascript'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.get_data()) == (static_dir / 'app.js').read_bytes()
+    response.close()
+
+    plain = client.get('/static/app.js')
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.get_data() == (static_dir / 'app.js').read_bytes()
+    plain.close()
+
+
+def test_stale_sibling_is_ignored(client, static_dir):
+    app.test_cli_runner().invoke(args=['compress-static'])
+    sibling = static_dir / 'app.js.gz'
+    os.utime(sibling, (0, 0))
+
+    response = client.get('/static/app.js', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    response.close()
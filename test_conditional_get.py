@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for ETag / If-None-Match handling on the public read APIs
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app import db, snapshot_caches, Product, ProductVariant, FAQ, Testimonial, FAQAdminView
+
+PUBLIC_APIS = ['/api/products', '/api/products?limit=5', '/api/faqs', '/api/testimonials']
+
+
+@pytest.fixture
+def seed():
+    product = Product(name="DAP Fertilizer", category="Fertilizer", description="Phosphate fertilizer")
+    product.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2800.0, stock_level=12))
+    return [
+        product,
+        FAQ(question="Do you deliver?", answer="Yes, within Meru County.", display_order=1),
+        Testimonial(author_name="Jane", text="Great seeds!", is_approved=True),
+    ]
+
+
+@pytest.mark.parametrize('url', PUBLIC_APIS)
+def test_matching_etag_returns_304_without_queries(client, url, count_statements):
+    first = client.get(url)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert not etag.startswith('W/')
+    assert 'no-cache' in first.headers['Cache-Control']
+
+    with count_statements() as statements:
+        second = client.get(url, headers={'If-None-Match': etag})
+
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == etag
+    # Only the shared version is read
+    assert len(statements) == 1
+
+
+def test_every_process_hands_out_the_same_etag(client):
+    etag = client.get('/api/products').headers['ETag']
+    # Another worker, against the same database
+    other = subprocess.run([sys.executable, '-c', (
+        "from app import app\n"
+        "with app.test_client() as client: print(client.get('/api/products').headers['ETag'])"
+    )], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True)
+    assert other.stdout.splitlines()[-1] == etag
+
+    # A write committed by another worker moves the tag here too
+    db.session.remove()
+    with db.engine.begin() as connection:
+        connection.execute(db.update(ProductVariant).values(stock_level=7))
+        snapshot_caches['catalog'].bump(connection)
+    response = client.get('/api/products', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_etag_differs_per_query(client):
+    assert client.get('/api/products').headers['ETag'] != client.get('/api/products?limit=5').headers['ETag']
+
+
+def test_admin_change_invalidates_etag(client):
+    etag = client.get('/api/faqs').headers['ETag']
+    faq = FAQ.query.one()
+    faq.answer = "Yes, countrywide."
+    FAQAdminView(FAQ, db.session).on_model_change(None, faq, False)
+    db.session.commit()
+
+    response = client.get('/api/faqs', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()[0]['answer'] == "Yes, countrywide."
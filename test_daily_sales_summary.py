@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Tests for the daily sales rollup kept up to date by checkout and POS sales
+"""
+
+import pytest
+
+from app import db, rebuild_daily_sales, DailySalesSummary, OfflineSale, OfflineSaleAdminView, OfflineSaleItem, Order, OrderItem, Product, ProductVariant
+
+
+@pytest.fixture
+def seed():
+    dap = Product(name="DAP Fertilizer", category="Fertilizer", description="Phosphate fertilizer")
+    dap.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2800.0,
+                                       buying_price=2400.0, stock_level=100))
+    dap.variants.append(ProductVariant(quantity_value=25.0, quantity_unit="kg", selling_price=1500.0,
+                                       buying_price=1300.0, stock_level=100))
+    return [dap]
+
+
+@pytest.fixture
+def client(client):
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+    return client
+
+
+def variant_ids():
+    return [variant.id for variant in ProductVariant.query.order_by(ProductVariant.id)]
+
+
+def checkout(client, lines):
+    response = client.post('/api/submit-full-order', json={
+        'customer_name': 'Jane Doe',
+        'customer_email': 'jane@example.com',
+        'customer_phone': '0712345678',
+        'delivery_address': 'Nchiru',
+        'items': [{'product_variant_id': variant_id, 'quantity': quantity, 'selling_price': 1.0}
+                  for variant_id, quantity in lines]
+    })
+    assert response.status_code == 200
+    return response.get_json()['order_id']
+
+
+def manual_sale(client, lines):
+    total = sum(quantity * price for _, quantity, price in lines)
+    response = client.post('/api/manual-sale', json={
+        'total_cost': total, 'amount_paid': total, 'change_given': 0.0, 'payment_mode': 'Cash',
+        'items': [{'product_variant_id': variant_id, 'quantity': quantity, 'price': price}
+                  for variant_id, quantity, price in lines]
+    })
+    assert response.status_code == 200
+
+
+def rollup():
+    return {
+        (row.channel, row.product_variant_id): (row.revenue, row.units, row.cost, row.order_count)
+        for row in DailySalesSummary.query.filter(DailySalesSummary.revenue != 0)
+    }
+
+
+def test_checkout_and_pos_sales_are_rolled_up(client):
+    big, small = variant_ids()
+    checkout(client, [(big, 2), (small, 1)])
+    checkout(client, [(big, 1)])
+    manual_sale(client, [(small, 3, 1400.0)])
+
+    assert rollup() == {
+        ('online', big): (3 * 2800.0, 3, 3 * 2400.0, 2),
+        ('online', small): (1500.0, 1, 1300.0, 1),
+        ('offline', small): (3 * 1400.0, 3, 3 * 1300.0, 1),
+    }
+    # Repeat sales on the same day land in the same row
+    assert DailySalesSummary.query.count() == 3
+
+
+def test_batch_sync_is_rolled_up(client):
+    big, _ = variant_ids()
+    sales = [{
+        'client_sale_id': f'sale-{i}', 'total_cost': 2800.0, 'amount_paid': 2800.0, 'change_given': 0.0,
+        'payment_mode': 'Cash', 'items': [{'product_variant_id': big, 'quantity': 1, 'price': 2800.0}]
+    } for i in range(4)]
+    assert client.post('/api/manual-sales/batch', json={'sales': sales}).get_json()['recorded'] == 4
+    # A resent batch is not counted again
+    client.post('/api/manual-sales/batch', json={'sales': sales})
+    assert rollup() == {('offline', big): (4 * 2800.0, 4, 4 * 2400.0, 4)}
+
+
+def test_cancelled_orders_drop_out(client):
+    big, small = variant_ids()
+    checkout(client, [(big, 1)])
+    order_id = checkout(client, [(big, 2), (small, 1)])
+
+    order = db.session.get(Order, order_id)
+    order.payment_status = 'Cancelled'
+    db.session.commit()
+    assert rollup() == {('online', big): (2800.0, 1, 2400.0, 1)}
+
+    # Moving between uncounted states changes nothing; reinstating puts it back
+    order.payment_status = 'Refunded'
+    db.session.commit()
+    assert rollup() == {('online', big): (2800.0, 1, 2400.0, 1)}
+    order.payment_status = 'Paid'
+    db.session.commit()
+    assert rollup()[('online', big)] == (3 * 2800.0, 3, 3 * 2400.0, 2)
+
+    db.session.delete(order)
+    db.session.commit()
+    assert rollup() == {('online', big): (2800.0, 1, 2400.0, 1)}
+
+
+def test_buying_price_changes_reprice_the_rolled_up_cost(client):
+    big, _ = variant_ids()
+    first = checkout(client, [(big, 1)])
+    order_id = checkout(client, [(big, 2)])
+
+    db.session.get(ProductVariant, big).buying_price = 2500.0
+    db.session.commit()
+    assert rollup() == {('online', big): (3 * 2800.0, 3, 3 * 2500.0, 2)}
+    assert_matches_a_rebuild()
+
+    # Cancelled later, the order takes out the cost it now carries, leaving none behind
+    db.session.get(Order, order_id).payment_status = 'Cancelled'
+    db.session.commit()
+    assert rollup() == {('online', big): (2800.0, 1, 2500.0, 1)}
+    db.session.get(Order, first).payment_status = 'Cancelled'
+    db.session.commit()
+    assert DailySalesSummary.query.filter(DailySalesSummary.cost != 0).count() == 0
+
+
+def test_rebuild_matches_the_incremental_rollup(client):
+    big, small = variant_ids()
+    checkout(client, [(big, 2), (small, 1)])
+    checkout(client, [(small, 4)])
+    cancelled = checkout(client, [(big, 5)])
+    manual_sale(client, [(big, 1, 2700.0), (small, 2, 1500.0)])
+    db.session.get(Order, cancelled).payment_status = 'Cancelled'
+    db.session.commit()
+    incremental = rollup()
+
+    rebuild_daily_sales(db.session.connection())
+    db.session.commit()
+    assert rollup() == incremental
+
+    # A database created before the rollup existed is backfilled
+    DailySalesSummary.__table__.drop(db.engine)
+    db.create_all()
+    assert rollup() == incremental
+
+
+def assert_matches_a_rebuild():
+    incremental = rollup()
+    rebuild_daily_sales(db.session.connection())
+    assert rollup() == incremental
+    db.session.rollback()
+
+
+def test_admin_edits_to_order_lines_are_rolled_up(client):
+    big, small = variant_ids()
+    order_id = checkout(client, [(big, 2), (small, 1)])
+    other = checkout(client, [(small, 1)])
+
+    # As OrderItemAdminView does it: change a line, move one to another order, add and delete lines
+    line = OrderItem.query.filter_by(order_id=order_id, product_variant_id=big).one()
+    line.quantity = 3
+    db.session.commit()
+    assert rollup()[('online', big)] == (3 * 2800.0, 3, 3 * 2400.0, 1)
+    OrderItem.query.filter_by(order_id=order_id, product_variant_id=small).one().order_id = other
+    db.session.add(OrderItem(order_id=other, product_variant_id=big, quantity=1, price_at_purchase=2700.0))
+    db.session.commit()
+    assert_matches_a_rebuild()
+    db.session.delete(OrderItem.query.filter_by(order_id=order_id).one())
+    db.session.commit()
+    assert_matches_a_rebuild()
+    assert rollup() == {('online', big): (2700.0, 1, 2400.0, 1), ('online', small): (2 * 1500.0, 2, 2 * 1300.0, 1)}
+
+    # Lines of a cancelled order stay out whatever happens to them
+    db.session.get(Order, other).payment_status = 'Cancelled'
+    db.session.commit()
+    OrderItem.query.filter_by(order_id=other, product_variant_id=big).one().quantity = 5
+    db.session.commit()
+    assert rollup() == {}
+
+
+def test_admin_edits_to_pos_sales_are_rolled_up(client):
+    big, small = variant_ids()
+    manual_sale(client, [(big, 1, 2800.0), (small, 2, 1400.0)])
+
+    line = OfflineSaleItem.query.filter_by(product_variant_id=small).one()
+    line.price_at_sale = 1500.0
+    db.session.commit()
+    assert rollup()[('offline', small)] == (2 * 1500.0, 2, 2 * 1300.0, 1)
+    db.session.delete(line)
+    db.session.commit()
+    assert rollup() == {('offline', big): (2800.0, 1, 2400.0, 1)}
+
+    db.session.delete(OfflineSale.query.one())
+    db.session.commit()
+    assert rollup() == {}
+    assert_matches_a_rebuild()
+
+
+def test_adding_a_line_to_an_existing_sale(client):
+    big, small = variant_ids()
+    order_id = checkout(client, [(big, 2)])
+    manual_sale(client, [(big, 2, 2800.0)])
+
+    # By sale id, as the admin form sets it, and through the sale's collection
+    db.session.add(OrderItem(order_id=order_id, product_variant_id=small, quantity=1, price_at_purchase=1500.0))
+    db.session.commit()
+    assert_matches_a_rebuild()
+    sale = OfflineSale.query.one()
+    sale.items_sold.append(OfflineSaleItem(product_variant_id=small, quantity=1, price_at_sale=1500.0))
+    db.session.commit()
+    assert_matches_a_rebuild()
+    assert rollup() == {
+        ('online', big): (2 * 2800.0, 2, 2 * 2400.0, 1), ('online', small): (1500.0, 1, 1300.0, 1),
+        ('offline', big): (2 * 2800.0, 2, 2 * 2400.0, 1), ('offline', small): (1500.0, 1, 1300.0, 1),
+    }
+
+
+def test_pos_sale_amounts_are_read_only_in_the_admin():
+    # A sale does not record its till session, so the till totals could not follow an edit
+    assert not OfflineSaleAdminView.can_create and not OfflineSaleAdminView.can_delete
+    assert OfflineSaleAdminView.form_columns == ['customer_name']
+
+
+def test_rollup_costs_one_statement_per_checkout(client, count_statements):
+    ids = variant_ids()
+    with count_statements() as small:
+        checkout(client, [(ids[0], 1)])
+    with count_statements() as large:
+        checkout(client, [(ids[0], 1), (ids[1], 2)])
+    assert len(large) == len(small)
+    assert sum('daily_sales_summary' in statement for statement in large) == 1
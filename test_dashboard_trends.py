@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Tests for aggregate_by_period() and the dashboard trend built on it
+"""
+
+from datetime import datetime
+
+import pytest
+
+from app import db, aggregate_by_period, Order, OrderItem, Product, ProductVariant
+
+
+def order(ordered_at, total_amount, email='jane@example.com', payment_status='Pending'):
+    result = Order(customer_name='Jane Doe', customer_email=email, customer_phone='0712345678',
+                   delivery_address='Nchiru', total_amount=total_amount, ordered_at=ordered_at,
+                   payment_status=payment_status)
+    result.items.append(OrderItem(product_variant_id=1, quantity=1, price_at_purchase=total_amount))
+    return result
+
+
+@pytest.fixture
+def seed():
+    dap = Product(name="DAP Fertilizer", category="Fertilizer", description="Phosphate fertilizer")
+    dap.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2800.0, stock_level=5))
+    return [
+        dap,
+        order(datetime(2026, 3, 2, 9), 100.0),                    # Monday
+        order(datetime(2026, 3, 2, 23, 59), 50.0, 'joe@example.com'),
+        order(datetime(2026, 3, 8, 12), 25.0),                    # Sunday, same week
+        order(datetime(2026, 3, 9, 0, 0), 10.0),                  # next Monday
+        order(datetime(2026, 4, 30, 18), 5.0),
+        # Not a sale: left out of revenue, order and customer counts alike
+        order(datetime(2026, 3, 3, 10), 1000.0, 'ann@example.com', payment_status='Cancelled'),
+    ]
+
+
+@pytest.fixture
+def client(client):
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+    return client
+
+
+def revenue(start, end, granularity):
+    periods = aggregate_by_period(Order.ordered_at, {'revenue': db.func.sum(Order.total_amount), 'orders': db.func.count(Order.id)},
+                                  start, end, granularity, (Order.payment_status != 'Cancelled',))
+    return [(period.isoformat(), values['revenue'], values['orders']) for period, values in periods]
+
+
+def test_days_are_zero_filled(client):
+    assert revenue(datetime(2026, 3, 1), datetime(2026, 3, 4), 'day') == [
+        ('2026-03-01', 0, 0), ('2026-03-02', 150.0, 2), ('2026-03-03', 0, 0)
+    ]
+
+
+def test_weeks_start_on_monday(client):
+    assert revenue(datetime(2026, 3, 2), datetime(2026, 3, 16), 'week') == [
+        ('2026-03-02', 175.0, 3), ('2026-03-09', 10.0, 1)
+    ]
+
+
+def test_months(client):
+    assert revenue(datetime(2026, 2, 1), datetime(2026, 5, 1), 'month') == [
+        ('2026-02-01', 0, 0), ('2026-03-01', 185.0, 4), ('2026-04-01', 5.0, 1)
+    ]
+
+
+def test_bad_arguments(client):
+    with pytest.raises(ValueError):
+        revenue(datetime(2026, 3, 1), datetime(2026, 3, 2), 'hour')
+    with pytest.raises(ValueError):
+        revenue(datetime(2000, 1, 1), datetime(2026, 1, 1), 'day')
+
+
+def dashboard(client, count_statements, **args):
+    with count_statements() as statements:
+        response = client.get('/api/dashboard-data', query_string=args)
+    return response, len(statements)
+
+
+def test_dashboard_trend_and_stats(client, count_statements):
+    response, _ = dashboard(client, count_statements, start='2026-03-01', end='2026-03-09')
+    body = response.get_json()
+    assert [(row['period'], row['revenue']) for row in body['revenue_trend'] if row['revenue']] == [
+        ('2026-03-02', 150.0), ('2026-03-08', 25.0), ('2026-03-09', 10.0)
+    ]
+    assert [(row['period'], row['orders']) for row in body['revenue_trend'] if row['orders']] == [
+        ('2026-03-02', 2), ('2026-03-08', 1), ('2026-03-09', 1)
+    ]
+    assert len(body['revenue_trend']) == 9
+    assert body['stats']['total_revenue'] == 190.0
+    assert body['stats']['total_orders'] == 5
+    assert body['stats']['total_customers'] == 2
+
+    # The default is the last seven days, labelled by weekday
+    trend = dashboard(client, count_statements)[0].get_json()['revenue_trend']
+    assert len(trend) == 7
+    assert trend[-1]['period'] == datetime.utcnow().date().isoformat()
+    assert trend[-1]['date'] == datetime.utcnow().strftime('%a')
+
+
+def test_query_count_does_not_depend_on_the_range(client, count_statements):
+    counts = [
+        dashboard(client, count_statements, **args)[1]
+        for args in ({}, {'start': '2025-01-01', 'end': '2026-12-31'}, {'granularity': 'month', 'start': '2020-01-01'})
+    ]
+    assert len(set(counts)) == 1
+    assert counts[0] <= 7
+
+
+def test_dashboard_rejects_bad_ranges(client):
+    assert client.get('/api/dashboard-data?granularity=hour').status_code == 400
+    assert client.get('/api/dashboard-data?start=yesterday').status_code == 400
+    assert client.get('/api/dashboard-data?start=2026-03-05&end=2026-03-01').status_code == 400
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Tests for the catalog/FAQ/testimonial JSON island that home() embeds in index.html
+"""
+
+import json
+import re
+
+import pytest
+
+from app import db, Product, ProductVariant, FAQ, Testimonial, ProductAdminView
+
+ISLAND = re.compile(r'<script id="initial-data" type="application/json">(.*?)</script>', re.S)
+
+
+@pytest.fixture
+def seed():
+    product = Product(name="DAP Fertilizer", category="Fertilizer", description="Use <b>before</b> planting </script><script>alert(1)</script>")
+    product.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2800.0, stock_level=12))
+    return [
+        product,
+        FAQ(question="Do you deliver?", answer="Yes & fast.", display_order=1),
+        Testimonial(author_name="Jane", text="Great seeds!", is_approved=True),
+    ]
+
+
+def initial_data(client):
+    html = client.get('/').get_data(as_text=True)
+    islands = ISLAND.findall(html)
+    assert len(islands) == 1
+    return islands[0]
+
+
+def test_island_matches_the_apis(client):
+    data = json.loads(initial_data(client))
+    assert data['products'] == client.get('/api/products').get_json()
+    assert data['faqs'] == client.get('/api/faqs').get_json()
+    assert data['testimonials'] == client.get('/api/testimonials').get_json()
+    assert data['products']['products'][0]['description'].endswith('</script><script>alert(1)</script>')
+
+
+def test_island_cannot_close_its_script_tag(client):
+    raw = initial_data(client)
+    assert '<' not in raw and '>' not in raw and '&' not in raw
+
+
+def test_repeat_render_runs_no_queries(client, count_statements):
+    initial_data(client)
+
+    with count_statements() as statements:
+        initial_data(client)
+    # One read of the shared versions covers all three snapshots
+    assert len(statements) == 1
+
+
+def test_island_follows_catalog_changes(client):
+    initial_data(client)
+    product = Product.query.one()
+    product.name = "DAP 18:46:0"
+    ProductAdminView(Product, db.session).on_model_change(None, product, False)
+    db.session.commit()
+
+    data = json.loads(initial_data(client))
+    assert data['products']['products'][0]['name'] == "DAP 18:46:0"
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Tests for Idempotency-Key handling on checkout and manual sales
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import app, db, IdempotencyKey, Order, OfflineSale, Product, ProductVariant
+
+
+@pytest.fixture
+def seed():
+    dap = Product(name="DAP Fertilizer", category="Fertilizer", description="Phosphate fertilizer")
+    dap.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2800.0, stock_level=10))
+    return [dap]
+
+
+def variant_id():
+    return ProductVariant.query.one().id
+
+
+def stock_level():
+    db.session.expire_all()
+    return ProductVariant.query.one().stock_level
+
+
+def checkout(client, quantity, key=None, variant=None):
+    headers = {'Idempotency-Key': key} if key else {}
+    return client.post('/api/submit-full-order', headers=headers, json={
+        'customer_name': 'Jane Doe',
+        'customer_email': 'jane@example.com',
+        'customer_phone': '0712345678',
+        'delivery_address': 'Nchiru',
+        'items': [{'product_variant_id': variant or variant_id(), 'quantity': quantity, 'selling_price': 2800.0}]
+    })
+
+
+def manual_sale(client, quantity, key=None):
+    headers = {'Idempotency-Key': key} if key else {}
+    return client.post('/api/manual-sale', headers=headers, json={
+        'total_cost': 2800.0 * quantity, 'amount_paid': 2800.0 * quantity, 'change_given': 0.0, 'payment_mode': 'Cash',
+        'items': [{'product_variant_id': variant_id(), 'quantity': quantity, 'price': 2800.0}]
+    })
+
+
+def test_retry_replays_the_first_response(client, count_statements):
+    first = checkout(client, 2, key='order-1')
+    assert first.status_code == 200
+    assert 'Idempotent-Replayed' not in first.headers
+
+    with count_statements() as statements:
+        retry = checkout(client, 2, key='order-1')
+
+    assert retry.status_code == 200
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+    # The replay writes nothing but its own (rejected) claim
+    writes = [statement for statement in statements if statement.lstrip().upper().startswith(('INSERT', 'UPDATE'))]
+    assert writes and all('idempotency_key' in statement for statement in writes)
+    assert Order.query.count() == 1
+    assert stock_level() == 8
+
+
+def test_key_reused_with_a_different_body_is_rejected(client):
+    assert checkout(client, 2, key='order-1').status_code == 200
+    response = checkout(client, 3, key='order-1')
+    assert response.status_code == 422
+    assert response.get_json()['success'] is False
+    assert Order.query.count() == 1
+
+
+def test_key_still_in_progress_is_a_conflict(client):
+    assert checkout(client, 2, key='order-1').status_code == 200
+    record = db.session.get(IdempotencyKey, ('submit-full-order', 'order-1'))
+    record.status_code = None
+    record.response_body = None
+    db.session.commit()
+
+    response = checkout(client, 2, key='order-1')
+    assert response.status_code == 409
+    assert response.headers['Retry-After'] == '1'
+    assert Order.query.count() == 1
+
+
+def test_expired_keys_are_purged(client):
+    assert checkout(client, 1, key='order-1').status_code == 200
+    record = db.session.get(IdempotencyKey, ('submit-full-order', 'order-1'))
+    record.expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+    response = checkout(client, 1, key='order-1')
+    assert response.status_code == 200
+    assert 'Idempotent-Replayed' not in response.headers
+    assert Order.query.count() == 2
+    assert IdempotencyKey.query.count() == 1
+
+
+def test_rejected_requests_are_replayed_too(client):
+    assert checkout(client, 50, key='order-1').status_code == 409
+    stock = ProductVariant.query.one()
+    stock.stock_level = 100
+    db.session.commit()
+    # Same key, same body: the stored 409 stands until the client picks a new key
+    assert checkout(client, 50, key='order-1').status_code == 409
+    assert checkout(client, 50, key='order-2').status_code == 200
+
+
+def test_scopes_are_independent(client):
+    assert checkout(client, 1, key='shared').status_code == 200
+    response = manual_sale(client, 1, key='shared')
+    assert response.status_code == 200
+    assert 'Idempotent-Replayed' not in response.headers
+    assert stock_level() == 8
+
+
+def test_manual_sale_double_submit(client):
+    assert manual_sale(client, 3, key='till-1').status_code == 200
+    assert manual_sale(client, 3, key='till-1').headers['Idempotent-Replayed'] == 'true'
+    assert OfflineSale.query.count() == 1
+    assert stock_level() == 7
+
+
+def test_requests_without_a_key_are_unaffected(client):
+    assert checkout(client, 1).status_code == 200
+    assert checkout(client, 1).status_code == 200
+    assert Order.query.count() == 2
+    assert IdempotencyKey.query.count() == 0
+
+
+def test_overlong_key_is_rejected(client):
+    assert checkout(client, 1, key='x' * 101).status_code == 400
+    assert Order.query.count() == 0
+
+
+def test_concurrent_duplicates_create_one_order(client):
+    variant = variant_id()
+    results = []
+    start = threading.Barrier(8)
+
+    def submit():
+        with app.test_client() as duplicate_client:
+            start.wait()
+            response = checkout(duplicate_client, 1, key='order-1', variant=variant)
+            results.append(response.status_code)
+
+    threads = [threading.Thread(target=submit) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count(200) >= 1
+    assert set(results) <= {200, 409}
+    assert Order.query.count() == 1
+    assert stock_level() == 9
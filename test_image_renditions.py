@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for product image renditions (resized JPEG/WebP, placeholder, srcset)
+"""
+
+import pytest
+
+from app import app, image_renditions, Product, ProductVariant
+
+
+@pytest.fixture
+def static_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'static_folder', str(tmp_path))
+    monkeypatch.setattr(app, 'static_url_path', '/static')
+    (tmp_path / 'images').mkdir()
+    return tmp_path
+
+
+@pytest.fixture
+def seed():
+    product = Product(name="DAP Fertilizer", category="Fertilizer", description="Phosphate fertilizer",
+                      image_url="/static/images/dap.jpg")
+    product.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2800.0, stock_level=12))
+    return [product]
+
+
+@pytest.fixture
+def client(static_dir, client):
+    return client
+
+
+def first_product(client):
+    return client.get('/api/products').get_json()['products'][0]
+
+
+def test_srcset_is_null_until_rendered(client):
+    product = first_product(client)
+    assert product['srcset'] is None and product['srcset_webp'] is None and product['placeholder'] is None
+
+
+def test_recorded_renditions_are_exposed(client):
+    first_product(client)
+    image_renditions.record('/static/images/dap.jpg', {
+        'digest': 'abc123', 'widths': [160, 320], 'source_mtime': 0, 'placeholder': 'data:image/jpeg;base64,AAAA'
+    })
+
+    # Recording bumps the catalog snapshot, so the next read sees it
+    product = first_product(client)
+    assert product['srcset'] == ('/static/uploads/renditions/abc123-160w.jpg 160w, '
+                                 '/static/uploads/renditions/abc123-320w.jpg 320w')
+    assert product['srcset_webp'].endswith('abc123-320w.webp 320w')
+    assert product['placeholder'] == 'data:image/jpeg;base64,AAAA'
+
+    sparse = client.get('/api/products?fields=name,srcset').get_json()['products'][0]
+    assert set(sparse) == {'name', 'srcset'}
+
+
+def test_remote_and_missing_images_are_skipped(client):
+    assert image_renditions.queue('https://example.com/dap.jpg') is None
+    assert image_renditions.queue('/static/images/missing.jpg') is None
+
+
+def test_renditions_are_rendered_off_thread(client, static_dir):
+    Image = pytest.importorskip('PIL.Image')
+    Image.new('RGB', (800, 600), (74, 143, 41)).save(static_dir / 'images' / 'dap.jpg')
+
+    future = image_renditions.queue('/static/images/dap.jpg')
+    rendition = future.result(timeout=60)
+
+    assert rendition['widths'] == [160, 320, 640, 800]
+    assert rendition['placeholder'].startswith('data:image/jpeg;base64,')
+    renditions = static_dir / 'uploads' / 'renditions'
+    assert (renditions / f"{rendition['digest']}-320w.webp").exists()
+    with Image.open(renditions / f"{rendition['digest']}-160w.jpg") as small:
+        assert small.size == (160, 120)
+
+    # Up to date now, so nothing is queued again
+    assert image_renditions.queue('/static/images/dap.jpg') is None
+    assert '800w' in first_product(client)['srcset']
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Tests for /api/manual-sales/batch, the sync endpoint for sales queued on an offline till
+"""
+
+import uuid
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+from app import db, OfflineSale, OfflineSaleItem, Product, ProductVariant
+
+
+@pytest.fixture
+def seed():
+    dap = Product(name="DAP Fertilizer", category="Fertilizer", description="Phosphate fertilizer")
+    dap.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2800.0, stock_level=1000))
+    can = Product(name="CAN Top Dressing", category="Fertilizer", description="Nitrogen fertilizer")
+    can.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2500.0, stock_level=3))
+    return [dap, can]
+
+
+def variant_ids():
+    return [variant.id for variant in ProductVariant.query.order_by(ProductVariant.id)]
+
+
+def stock_levels():
+    db.session.expire_all()
+    return [variant.stock_level for variant in ProductVariant.query.order_by(ProductVariant.id)]
+
+
+def sale(lines, **extra):
+    return {
+        'client_sale_id': str(uuid.uuid4()),
+        'total_cost': 100.0, 'amount_paid': 100.0, 'change_given': 0.0, 'payment_mode': 'Cash',
+        'items': [{'product_variant_id': variant_id, 'quantity': quantity, 'price': 100.0} for variant_id, quantity in lines],
+        **extra
+    }
+
+
+def sync(client, sales):
+    return client.post('/api/manual-sales/batch', json={'sales': sales})
+
+
+def test_batch_is_recorded_in_one_transaction(client, count_statements):
+    dap, can = variant_ids()
+    sales = [sale([(dap, 2)]) for _ in range(300)] + [sale([(dap, 1), (can, 1)])]
+
+    with count_statements() as statements:
+        response = sync(client, sales)
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['recorded'] == 301
+    assert [result['status'] for result in body['results']] == ['recorded'] * 301
+    assert OfflineSale.query.count() == 301
+    assert OfflineSaleItem.query.count() == 302
+    assert stock_levels() == [1000 - 601, 2]
+    # One stock UPDATE for the whole batch, and the items and sync ids each in one executemany
+    writes = Counter(statement.split('(')[0].strip() for statement in statements
+                     if statement.lstrip().upper().startswith(('INSERT', 'UPDATE')))
+    assert writes['INSERT INTO offline_sale_item'] == writes['INSERT INTO offline_sale_sync'] == 1
+    assert sum(count for statement, count in writes.items() if statement.startswith('UPDATE product_variant')) == 1
+
+
+def test_resent_batch_is_not_recorded_twice(client):
+    dap, _ = variant_ids()
+    sales = [sale([(dap, 1)]) for _ in range(5)]
+    first = sync(client, sales).get_json()['results']
+    again = sync(client, sales).get_json()
+
+    assert again['recorded'] == 0
+    assert [result['status'] for result in again['results']] == ['duplicate'] * 5
+    assert [result['sale_id'] for result in again['results']] == [result['sale_id'] for result in first]
+    assert OfflineSale.query.count() == 5
+    assert stock_levels()[0] == 995
+
+
+def test_short_stock_rejects_only_the_later_sales(client):
+    dap, can = variant_ids()
+    sales = [sale([(can, 2)]), sale([(can, 2)]), sale([(dap, 1)]), sale([(can, 1)])]
+    results = sync(client, sales).get_json()['results']
+
+    assert [result['status'] for result in results] == ['recorded', 'rejected', 'recorded', 'recorded']
+    assert results[1]['errors'][0]['available'] == 1
+    assert stock_levels() == [999, 0]
+    assert OfflineSale.query.count() == 3
+
+
+def test_invalid_and_repeated_sales(client):
+    dap, _ = variant_ids()
+    repeated = sale([(dap, 1)])
+    sales = [repeated, sale([(dap, 0)]), {'total_cost': 1.0}, repeated]
+    results = sync(client, sales).get_json()['results']
+
+    assert [result['status'] for result in results] == ['recorded', 'invalid', 'invalid', 'duplicate']
+    assert 'at least 1' in results[1]['message']
+    assert results[3]['sale_id'] == results[0]['sale_id']
+    assert stock_levels()[0] == 999
+
+
+def test_sale_keeps_the_time_it_was_rung_up(client):
+    dap, _ = variant_ids()
+    results = sync(client, [sale([(dap, 1)], sold_at='2026-03-01T06:30:00.000Z')]).get_json()['results']
+    assert db.session.get(OfflineSale, results[0]['sale_id']).sale_date == datetime(2026, 3, 1, 6, 30)
+
+
+def test_batch_limits(client):
+    dap, _ = variant_ids()
+    assert sync(client, []).status_code == 400
+    assert sync(client, [sale([(dap, 1)]) for _ in range(501)]).status_code == 400
+    assert OfflineSale.query.count() == 0
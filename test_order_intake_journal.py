@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Tests for the write-ahead order intake journal (ORDER_INTAKE_MODE = 'journal')
+"""
+
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+import app as app_module
+from app import app, db, Order, OrderIntake, OrderIntakeJournal, Product, ProductVariant
+
+
+CUSTOMER = {'customer_name': 'Jane Doe', 'customer_email': 'jane@example.com',
+            'customer_phone': '0712345678', 'delivery_address': 'Nchiru'}
+
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'ORDER_INTAKE_MODE', 'journal')
+    monkeypatch.setitem(app.config, 'ORDER_INTAKE_JOURNAL', str(tmp_path / 'order-intake.jsonl'))
+    journal = OrderIntakeJournal()
+    monkeypatch.setattr(app_module, 'order_intake', journal)
+    return journal
+
+
+@pytest.fixture
+def seed():
+    dap = Product(name="DAP Fertilizer", category="Fertilizer", description="Phosphate fertilizer")
+    dap.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2800.0, stock_level=5))
+    return [dap]
+
+
+@pytest.fixture
+def client(journal, client):
+    return client
+
+
+def variant_id():
+    return ProductVariant.query.one().id
+
+
+def stock_level():
+    db.session.expire_all()
+    return ProductVariant.query.one().stock_level
+
+
+def checkout(client, quantity):
+    return client.post('/api/submit-full-order', json={
+        'customer_name': 'Jane Doe',
+        'customer_email': 'jane@example.com',
+        'customer_phone': '0712345678',
+        'delivery_address': 'Nchiru',
+        'items': [{'product_variant_id': variant_id(), 'quantity': quantity, 'selling_price': 1.0}]
+    })
+
+
+def journal_entry(reference, quantity):
+    return {
+        'reference': reference,
+        'received_at': '2026-03-01T08:00:00',
+        'customer': CUSTOMER,
+        'lines': [[variant_id(), quantity]]
+    }
+
+
+def test_checkout_is_acknowledged_then_confirmed(client, journal):
+    response = checkout(client, 2)
+    assert response.status_code == 202
+    body = response.get_json()
+    assert body['status'] == 'accepted'
+    assert body['status_url'] == f"/api/orders/intake/{body['reference']}"
+
+    journal.drain()
+    status = client.get(body['status_url']).get_json()
+    assert status['status'] == 'confirmed'
+    order = db.session.get(Order, status['order_id'])
+    assert order.total_amount == 2 * 2800.0
+    assert order.customer_name == 'Jane Doe'
+    assert stock_level() == 3
+    # Fully applied, so the journal is emptied
+    assert os.path.getsize(app.config['ORDER_INTAKE_JOURNAL']) == 0
+
+
+def test_orders_that_no_longer_fit_are_rejected(client, journal):
+    # Each passes the intake check against the current stock of 5; together they do not fit
+    first = checkout(client, 3).get_json()['reference']
+    second = checkout(client, 3).get_json()['reference']
+    journal.drain()
+
+    assert client.get(f'/api/orders/intake/{first}').get_json()['status'] == 'confirmed'
+    rejected = client.get(f'/api/orders/intake/{second}').get_json()
+    assert rejected['status'] == 'rejected'
+    assert rejected['order_id'] is None
+    assert rejected['errors'][0]['available'] == 2
+    assert Order.query.count() == 1
+    assert stock_level() == 2
+
+
+def test_obvious_shortage_is_refused_at_intake(client, journal):
+    assert checkout(client, 6).status_code == 409
+    path = app.config['ORDER_INTAKE_JOURNAL']
+    assert not os.path.exists(path) or os.path.getsize(path) == 0
+
+
+def test_each_batch_is_one_transaction(client, journal, monkeypatch):
+    ProductVariant.query.one().stock_level = 1000
+    db.session.commit()
+    monkeypatch.setitem(app.config, 'ORDER_INTAKE_BATCH_SIZE', 4)
+    batches = []
+    apply_batch = app_module.apply_order_intake_batch
+    monkeypatch.setattr(app_module, 'apply_order_intake_batch', lambda entries: batches.append(len(entries)) or apply_batch(entries))
+
+    with journal._draining:  # hold the drain thread off until everything is queued
+        references = [checkout(client, 1).get_json()['reference'] for _ in range(10)]
+    journal.drain()
+
+    assert batches == [4, 4, 2]
+    assert {row.reference for row in OrderIntake.query} == set(references)
+    assert Order.query.count() == 10
+
+
+def test_restart_recovers_unapplied_entries(client):
+    path = app.config['ORDER_INTAKE_JOURNAL']
+    with open(path, 'w') as f:
+        for entry in (journal_entry('PAPPLIED', 1), journal_entry('PWAITING', 2)):
+            f.write(json.dumps(entry) + '\n')
+        f.write('{"reference": "PTORN", "rece')  # crashed mid-write, never acknowledged
+    # PAPPLIED made it into the database before the crash
+    db.session.add(OrderIntake(reference='PAPPLIED', status='confirmed', received_at=datetime(2026, 3, 1, 8)))
+    db.session.commit()
+
+    restarted = OrderIntakeJournal()
+    restarted.start()
+    restarted.drain()
+
+    status = client.get('/api/orders/intake/PWAITING').get_json()
+    assert status['status'] == 'confirmed'
+    # Dated when the customer placed it, not when it was applied
+    assert db.session.get(Order, status['order_id']).ordered_at == datetime(2026, 3, 1, 8)
+    assert Order.query.count() == 1
+    assert stock_level() == 3
+    assert OrderIntake.query.count() == 2
+    assert os.path.getsize(path) == 0
+
+
+def test_only_the_owner_drains(client, journal):
+    journal.drain()
+    # Another worker appends to the same file but leaves draining to the owner
+    other = OrderIntakeJournal()
+    reference = other.append(CUSTOMER, [(variant_id(), 1)])
+    assert other.drain() is None
+
+    # A status poll on any worker sees the order queued in the shared file
+    with journal._draining:
+        assert client.get(f'/api/orders/intake/{reference}').get_json()['status'] == 'queued'
+    journal.drain()
+    assert client.get(f'/api/orders/intake/{reference}').get_json()['status'] == 'confirmed'
+    assert os.path.getsize(app.config['ORDER_INTAKE_JOURNAL']) == 0
+
+
+def test_orders_appended_during_a_drain_are_kept(client, journal, monkeypatch):
+    appended = []
+    apply_batch = app_module.apply_order_intake_batch
+
+    def apply_then_append(entries):
+        apply_batch(entries)
+        if not appended:
+            appended.append(OrderIntakeJournal().append(CUSTOMER, [(variant_id(), 1)]))
+    monkeypatch.setattr(app_module, 'apply_order_intake_batch', apply_then_append)
+
+    with journal._draining:
+        first = checkout(client, 1).get_json()['reference']
+    journal.drain()
+    # The entry that arrived mid-drain was not truncated away but applied too
+    assert {row.reference for row in OrderIntake.query} == {first, appended[0]}
+    assert stock_level() == 3
+
+
+def test_a_broken_entry_does_not_block_the_rest(client, journal):
+    path = app.config['ORDER_INTAKE_JOURNAL']
+    broken = dict(journal_entry('PBROKEN', 1), lines=[[variant_id()]])
+    with open(path, 'w') as f:
+        for entry in (journal_entry('PFIRST', 1), broken, journal_entry('PLAST', 2)):
+            f.write(json.dumps(entry) + '\n')
+
+    journal.drain()
+    assert {row.reference: row.status for row in OrderIntake.query} == \
+        {'PFIRST': 'confirmed', 'PBROKEN': 'failed', 'PLAST': 'confirmed'}
+    assert stock_level() == 2
+    failed = client.get('/api/orders/intake/PBROKEN').get_json()
+    assert failed['status'] == 'failed' and 'PBROKEN' in failed['message']
+    assert os.path.getsize(path) == 0
+
+
+def test_unknown_reference(client):
+    response = client.get('/api/orders/intake/PNOPE')
+    assert response.status_code == 404
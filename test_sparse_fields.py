@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Tests for ?fields= sparse fieldsets on the catalog and order APIs
+"""
+
+from datetime import datetime
+
+import pytest
+
+from app import db, Product, ProductVariant, Order, OfflineSale
+
+
+@pytest.fixture
+def seed():
+    dap = Product(name="DAP Fertilizer", category="Fertilizer", description="Phosphate fertilizer")
+    dap.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2800.0, stock_level=12, supplier="Yara"))
+    sevin = Product(name="Sevin Dust", category="Pesticide", description="Insecticide")
+    sevin.variants.append(ProductVariant(quantity_value=1.0, quantity_unit="l", selling_price=800.0, stock_level=30, supplier="Bayer"))
+    return [
+        dap, sevin,
+        Order(customer_name="Jane", customer_email="jane@example.com", customer_phone="0712345678",
+              delivery_address="Nchiru", total_amount=2800.0, payment_status="Paid", ordered_at=datetime(2024, 5, 2)),
+        OfflineSale(amount_paid=1000.0, change_given=200.0, payment_mode="Cash", total_cost=800.0,
+                    sale_date=datetime(2024, 5, 3)),
+    ]
+
+
+@pytest.fixture
+def client(client):
+    db.session.expunge_all()
+    return client
+
+
+def test_products_projection(client, count_statements):
+    with count_statements() as statements:
+        products = client.get('/api/products?fields=id,name,variants.selling_price,variants.display_name').get_json()['products']
+
+    assert products[0] == {
+        'id': products[0]['id'],
+        'name': "DAP Fertilizer",
+        'variants': [{'selling_price': 2800.0, 'display_name': "DAP Fertilizer (50.0kg)"}],
+    }
+    sql = '\n'.join(statements)
+    assert 'product.description' not in sql
+    assert 'product_variant.supplier' not in sql
+    assert 'product_variant.expiry_date' not in sql
+
+
+def test_products_without_variants_skip_variant_query(client, count_statements):
+    with count_statements() as statements:
+        products = client.get('/api/products?fields=name,category').get_json()['products']
+
+    assert products == [{'name': "DAP Fertilizer", 'category': "Fertilizer"}, {'name': "Sevin Dust", 'category': "Pesticide"}]
+    assert not any('FROM product_variant' in sql for sql in statements)
+
+
+def test_variants_projection(client, count_statements):
+    with count_statements() as statements:
+        variants = client.get('/api/product-variants?fields=id,product_name,stock_level').get_json()['variants']
+
+    assert [(v['product_name'], v['stock_level']) for v in variants] == [("DAP Fertilizer", 12), ("Sevin Dust", 30)]
+    assert all(set(v) == {'id', 'product_name', 'stock_level'} for v in variants)
+    assert 'product_variant.supplier' not in statements[0]
+    assert 'product.description' not in statements[0]
+
+
+def test_unknown_field_is_rejected(client):
+    for url in ['/api/products?fields=name,secret', '/api/products?fields=variants.cost',
+                '/api/product-variants?fields=description']:
+        response = client.get(url)
+        assert response.status_code == 400
+        assert 'error' in response.get_json()
+
+
+def test_full_payload_without_fields(client):
+    product = client.get('/api/products').get_json()['products'][0]
+    assert set(product) == {'id', 'name', 'category', 'description', 'image_url', 'srcset', 'srcset_webp', 'placeholder', 'variants'}
+    assert product['variants'][0]['supplier'] == "Yara"
+
+
+def test_all_orders_projection(client, count_statements):
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+
+    with count_statements() as statements:
+        data = client.get('/api/all-orders?fields=customer_name,status_color').get_json()
+
+    assert data['orders'] == [
+        {'customer_name': "Walk-in Customer", 'status_color': 'success'},
+        {'customer_name': "Jane", 'status_color': 'success'},
+    ]
+    assert data['online_count'] == 1 and data['offline_count'] == 1
+    assert not any('customer_email' in sql or 'total_amount' in sql for sql in statements)
+    assert client.get('/api/all-orders?fields=delivery_address').status_code == 400
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for the atomic conditional stock decrement used by checkout and manual sales
+"""
+
+import threading
+
+import pytest
+
+from app import app, db, Order, OfflineSale, Product, ProductVariant
+
+
+@pytest.fixture
+def seed():
+    dap = Product(name="DAP Fertilizer", category="Fertilizer", description="Phosphate fertilizer")
+    dap.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2800.0, stock_level=10))
+    can = Product(name="CAN Top Dressing", category="Fertilizer", description="Nitrogen fertilizer")
+    can.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2500.0, stock_level=3))
+    return [dap, can]
+
+
+def variant_ids():
+    return [variant.id for variant in ProductVariant.query.order_by(ProductVariant.id)]
+
+
+def stock_levels():
+    db.session.expire_all()
+    return [variant.stock_level for variant in ProductVariant.query.order_by(ProductVariant.id)]
+
+
+def checkout(client, lines):
+    return client.post('/api/submit-full-order', json={
+        'customer_name': 'Jane Doe',
+        'customer_email': 'jane@example.com',
+        'customer_phone': '0712345678',
+        'delivery_address': 'Nchiru',
+        'items': [{'product_variant_id': variant_id, 'quantity': quantity, 'selling_price': 100.0}
+                  for variant_id, quantity in lines]
+    })
+
+
+def manual_sale(client, lines):
+    return client.post('/api/manual-sale', json={
+        'total_cost': 100.0, 'amount_paid': 100.0, 'change_given': 0.0, 'payment_mode': 'Cash',
+        'items': [{'product_variant_id': variant_id, 'quantity': quantity, 'price': 100.0}
+                  for variant_id, quantity in lines]
+    })
+
+
+def test_checkout_decrements_all_lines(client):
+    dap, can = variant_ids()
+    response = checkout(client, [(dap, 4), (can, 1), (dap, 2)])
+    assert response.status_code == 200
+    assert stock_levels() == [4, 2]
+
+
+def test_short_line_rejects_the_whole_order(client):
+    dap, can = variant_ids()
+    response = checkout(client, [(dap, 2), (can, 5)])
+    assert response.status_code == 409
+    body = response.get_json()
+    assert body['success'] is False
+    assert body['errors'] == [{
+        'product_variant_id': can, 'requested': 5, 'available': 3,
+        'message': "Only 3 left of CAN Top Dressing (50.0kg), 5 requested"
+    }]
+    assert stock_levels() == [10, 3]
+    assert Order.query.count() == 0
+
+
+def test_manual_sale_rejects_short_and_unknown_lines(client):
+    dap, can = variant_ids()
+    response = manual_sale(client, [(dap, 11), (999, 1)])
+    assert response.status_code == 409
+    assert [error['product_variant_id'] for error in response.get_json()['errors']] == [dap, 999]
+    assert stock_levels() == [10, 3]
+    assert OfflineSale.query.count() == 0
+
+    assert manual_sale(client, [(can, 3)]).status_code == 200
+    assert stock_levels() == [10, 0]
+
+
+def test_non_positive_quantities_are_rejected(client):
+    dap, _ = variant_ids()
+    assert checkout(client, [(dap, -5)]).status_code == 400
+    assert manual_sale(client, [(dap, 0)]).status_code == 400
+    assert stock_levels() == [10, 3]
+
+
+def test_concurrent_sales_never_oversell(client):
+    dap, can = variant_ids()
+    results = []
+    start = threading.Barrier(16)
+
+    def buyer(n):
+        with app.test_client() as buyer_client:
+            start.wait()
+            for _ in range(3):
+                if n % 2:
+                    response = checkout(buyer_client, [(dap, 1), (can, 1)])
+                else:
+                    response = manual_sale(buyer_client, [(dap, 2)])
+                results.append((n % 2, response.status_code))
+
+    threads = [threading.Thread(target=buyer, args=(n,)) for n in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert {status for _, status in results} <= {200, 409}
+    checkouts = sum(1 for kind, status in results if kind == 1 and status == 200)
+    manual_sales = sum(1 for kind, status in results if kind == 0 and status == 200)
+    dap_stock, can_stock = stock_levels()
+    # Every accepted sale took its stock and nothing else did
+    assert dap_stock == 10 - checkouts - 2 * manual_sales >= 0
+    assert can_stock == 3 - checkouts >= 0
+    assert Order.query.count() == checkouts
+    assert OfflineSale.query.count() == manual_sales
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Tests for TTL stock holds placed by carts and honoured by checkout and manual sales
+"""
+
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import app as app_module
+from app import app, db, read_data_version, Order, Product, ProductVariant, StockHold, StockHoldSweeper, STOCK_HOLDS
+
+
+@pytest.fixture
+def sweeper(monkeypatch):
+    sweeper = StockHoldSweeper()
+    # Nothing is held yet; tests that need a sweep run it themselves
+    sweeper.next_expiry = datetime.max
+    monkeypatch.setattr(app_module, 'stock_hold_sweeper', sweeper)
+    # Let the catalog show every hold change right away
+    monkeypatch.setitem(app.config, 'STOCK_HOLD_CATALOG_DELAY', timedelta(0))
+    return sweeper
+
+
+@pytest.fixture
+def seed():
+    dap = Product(name="DAP Fertilizer", category="Fertilizer", description="Phosphate fertilizer")
+    dap.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2800.0, stock_level=5))
+    return [dap]
+
+
+@pytest.fixture
+def client(sweeper, client):
+    return client
+
+
+def variant_id():
+    return ProductVariant.query.one().id
+
+
+def stock_level():
+    db.session.expire_all()
+    return ProductVariant.query.one().stock_level
+
+
+def hold(client, cart_id, quantity):
+    return client.put('/api/cart/holds', json={
+        'cart_id': cart_id,
+        'items': [{'product_variant_id': variant_id(), 'quantity': quantity}] if quantity else []
+    })
+
+
+def available(client):
+    return client.get('/api/products').get_json()['products'][0]['variants'][0]['available']
+
+
+def checkout(client, quantity, cart_id=None):
+    order = {
+        'customer_name': 'Jane Doe',
+        'customer_email': 'jane@example.com',
+        'customer_phone': '0712345678',
+        'delivery_address': 'Nchiru',
+        'items': [{'product_variant_id': variant_id(), 'quantity': quantity}]
+    }
+    if cart_id:
+        order['cart_id'] = cart_id
+    return client.post('/api/submit-full-order', json=order)
+
+
+def test_hold_reduces_available_stock(client):
+    assert available(client) == 5
+    body = hold(client, 'cart-a', 3).get_json()
+    assert body['holds'] == [{'product_variant_id': variant_id(), 'requested': 3, 'held': 3, 'available': 5}]
+    assert available(client) == 2
+    # Physical stock is untouched until the cart checks out
+    assert stock_level() == 5
+
+
+def test_second_cart_only_gets_what_is_left(client):
+    hold(client, 'cart-a', 3)
+    body = hold(client, 'cart-b', 4).get_json()
+    assert body['holds'][0]['held'] == 2
+    assert available(client) == 0
+
+
+def test_updating_a_cart_replaces_its_holds(client):
+    hold(client, 'cart-a', 3)
+    hold(client, 'cart-a', 4)
+    assert StockHold.query.one().quantity == 4
+    hold(client, 'cart-a', 0)
+    assert StockHold.query.count() == 0
+    assert available(client) == 5
+
+
+def test_checkout_sells_the_carts_hold(client):
+    hold(client, 'cart-a', 4)
+    # Someone else cannot buy the held units
+    response = checkout(client, 2)
+    assert response.status_code == 409
+    assert response.get_json()['errors'][0]['available'] == 1
+
+    assert checkout(client, 4, cart_id='cart-a').status_code == 200
+    assert stock_level() == 1
+    assert StockHold.query.count() == 0
+    assert available(client) == 1
+
+
+def test_manual_sale_respects_holds(client):
+    hold(client, 'cart-a', 4)
+    response = client.post('/api/manual-sale', json={
+        'total_cost': 5600.0, 'amount_paid': 5600.0, 'change_given': 0.0, 'payment_mode': 'Cash',
+        'items': [{'product_variant_id': variant_id(), 'quantity': 2, 'price': 2800.0}]
+    })
+    assert response.status_code == 409
+    assert stock_level() == 5
+
+
+def test_expired_holds_are_reclaimed(client, sweeper):
+    hold(client, 'cart-a', 3)
+    hold(client, 'cart-b', 1)
+    assert available(client) == 1
+    StockHold.query.filter_by(cart_id='cart-a').one().expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    sweeper.next_expiry = datetime.utcnow() - timedelta(seconds=1)
+
+    # The sweep releases the stock, and the catalog snapshot follows
+    assert sweeper.sweep() == 1
+    assert available(client) == 4
+    assert [row.cart_id for row in StockHold.query] == ['cart-b']
+    assert checkout(client, 4).status_code == 200
+    assert Order.query.count() == 1
+
+
+def test_sweep_costs_nothing_until_a_hold_is_due(client, sweeper, count_statements):
+    hold(client, 'cart-a', 3)
+    with count_statements() as statements:
+        assert sweeper.sweep() == 0
+    assert statements == []
+    assert sweeper.next_expiry > datetime.utcnow()
+
+
+def test_requests_do_not_sweep(client, sweeper, count_statements):
+    hold(client, 'cart-a', 3)
+    sweeper.next_expiry = datetime.utcnow() - timedelta(seconds=1)
+    with count_statements() as statements:
+        available(client)
+    assert not any(statement.startswith('DELETE') for statement in statements)
+
+
+def test_holds_are_capped_per_line_and_per_cart(client, monkeypatch):
+    monkeypatch.setitem(app.config, 'STOCK_HOLD_MAX_LINE_QUANTITY', 2)
+    assert hold(client, 'cart-a', 4).get_json()['holds'][0]['held'] == 2
+    monkeypatch.setitem(app.config, 'STOCK_HOLD_MAX_CART_QUANTITY', 1)
+    assert hold(client, 'cart-a', 4).get_json()['holds'][0]['held'] == 1
+    assert available(client) == 4
+
+
+def test_renewing_a_hold_keeps_the_catalog_snapshot(client, monkeypatch):
+    hold(client, 'cart-a', 3)
+    assert available(client) == 2
+    version = app_module.catalog_cache.version
+    hold(client, 'cart-a', 3)
+    assert available(client) == 2
+    assert app_module.catalog_cache.version == version
+
+
+def test_hold_changes_reach_the_catalog_within_the_delay(client, monkeypatch):
+    monkeypatch.setitem(app.config, 'STOCK_HOLD_CATALOG_DELAY', timedelta(minutes=1))
+    assert available(client) == 5
+    hold(client, 'cart-a', 1)
+    hold(client, 'cart-a', 2)
+    # The cached snapshot is served until the delay is up; both edits move the shared version once
+    assert available(client) == 5
+    assert read_data_version(STOCK_HOLDS) == 1
+    later = time.time() + 60
+    monkeypatch.setattr(app_module, 'time', SimpleNamespace(time=lambda: later))
+    assert available(client) == 3
+    # The hold response itself is always current
+    assert hold(client, 'cart-b', 9).get_json()['holds'][0]['held'] == 3
+
+
+def test_invalid_requests(client):
+    assert client.put('/api/cart/holds', json={'items': []}).status_code == 400
+    assert client.put('/api/cart/holds', json={'cart_id': 'x' * 65, 'items': []}).status_code == 400
+    assert hold(client, 'cart-a', -1).status_code == 400
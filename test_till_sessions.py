@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Tests for till sessions: running totals kept with every POS sale and the frozen Z-report at close
+"""
+
+import json
+import uuid
+
+import pytest
+
+from app import db, OfflineSale, Product, ProductVariant, TillSession, TillTotal
+
+
+@pytest.fixture
+def seed():
+    dap = Product(name="DAP Fertilizer", category="Fertilizer", description="Phosphate fertilizer")
+    dap.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2800.0, stock_level=100))
+    return [dap]
+
+
+@pytest.fixture
+def client(client):
+    login(client, 'alice')
+    return client
+
+
+def login(client, username):
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+        session['admin_username'] = username
+
+
+def sale_data(payment_mode, total_cost, amount_paid=None, **extra):
+    amount_paid = total_cost if amount_paid is None else amount_paid
+    return {
+        'total_cost': total_cost, 'amount_paid': amount_paid, 'change_given': amount_paid - total_cost,
+        'payment_mode': payment_mode,
+        'items': [{'product_variant_id': ProductVariant.query.one().id, 'quantity': 1, 'price': total_cost}],
+        **extra
+    }
+
+
+def ring_up(client, payment_mode, total_cost, amount_paid=None, **extra):
+    response = client.post('/api/manual-sale', json=sale_data(payment_mode, total_cost, amount_paid, **extra))
+    assert response.status_code == 200
+    return response
+
+
+def test_z_report_totals_by_payment_mode_and_cashier(client):
+    assert client.post('/api/till/open', json={'opening_float': 500}).status_code == 201
+    ring_up(client, 'Cash', 2800.0, 3000.0)
+    ring_up(client, 'M-Pesa', 2800.0)
+    login(client, 'bob')
+    ring_up(client, 'Cash', 1400.0, 1500.0)
+
+    response = client.post('/api/till/close', json={'counted_cash': 4700})
+    assert response.status_code == 200
+    report = response.get_json()['report']
+    assert report['payment_modes']['Cash'] == {
+        'sales': 2, 'total_cost': 4200.0, 'amount_paid': 4500.0, 'change_given': 300.0, 'net': 4200.0
+    }
+    assert report['payment_modes']['M-Pesa']['net'] == 2800.0
+    assert {name: totals['sales'] for name, totals in report['cashiers'].items()} == {'alice': 2, 'bob': 1}
+    assert report['totals']['total_cost'] == 7000.0
+    assert report['expected_cash'] == 4700.0
+    assert report['cash_variance'] == 0.0
+    assert (report['opened_by'], report['closed_by']) == ('alice', 'bob')
+
+
+def test_batch_sync_counts_too(client):
+    sales = [dict(sale_data('Cash', 100.0), client_sale_id=str(uuid.uuid4())) for _ in range(5)]
+    sales[0]['cashier'] = 'carol'
+    assert client.post('/api/manual-sales/batch', json={'sales': sales}).get_json()['recorded'] == 5
+    # A resent batch is not counted again
+    client.post('/api/manual-sales/batch', json={'sales': sales})
+
+    report = client.get('/api/till/current').get_json()['report']
+    assert report['totals']['sales'] == 5
+    assert report['cashiers']['carol']['sales'] == 1
+    assert report['cashiers']['alice']['sales'] == 4
+
+
+def test_rejected_sale_is_not_counted(client):
+    ring_up(client, 'Cash', 100.0)
+    response = client.post('/api/manual-sale', json=dict(sale_data('Cash', 100.0), items=[
+        {'product_variant_id': ProductVariant.query.one().id, 'quantity': 1000, 'price': 100.0}
+    ]))
+    assert response.status_code == 409
+    assert client.get('/api/till/current').get_json()['report']['totals']['sales'] == 1
+
+
+def test_close_reads_only_the_counters(client, count_statements):
+    for _ in range(20):
+        ring_up(client, 'Cash', 100.0)
+    with count_statements() as statements:
+        report = client.post('/api/till/close', json={}).get_json()['report']
+    assert report['totals']['sales'] == 20
+    assert not any('offline_sale' in statement for statement in statements)
+
+
+def test_z_report_is_frozen(client):
+    ring_up(client, 'Card', 100.0)
+    closed = client.post('/api/till/close', json={}).get_json()['report']
+    # The next sale opens a new session instead of touching the closed one
+    ring_up(client, 'Card', 50.0)
+    assert client.get('/api/till/current').get_json()['report']['totals']['total_cost'] == 50.0
+
+    assert client.get(f"/api/till/reports/{closed['id']}").get_json() == json.loads(json.dumps(closed))
+    till_session = db.session.get(TillSession, closed['id'])
+    till_session.opening_float = 1000.0
+    with pytest.raises(ValueError):
+        db.session.commit()
+    db.session.rollback()
+    assert TillTotal.query.filter_by(till_session_id=closed['id']).one().sale_count == 1
+    assert OfflineSale.query.count() == 2
+
+
+def test_tills_are_separate(client):
+    ring_up(client, 'Cash', 100.0, till='front')
+    ring_up(client, 'Cash', 200.0, till='back')
+    assert client.post('/api/till/close', json={'till': 'front'}).get_json()['report']['totals']['total_cost'] == 100.0
+    assert client.get('/api/till/current?till=back').get_json()['report']['totals']['total_cost'] == 200.0
+
+
+def test_open_and_close_errors(client):
+    assert client.post('/api/till/close', json={}).status_code == 409
+    assert client.post('/api/till/open', json={}).status_code == 201
+    assert client.post('/api/till/open', json={}).status_code == 409
+    assert client.post('/api/till/close', json={'counted_cash': 'lots'}).status_code == 400
+    assert client.get('/api/till/reports/999').status_code == 404
+    with client.session_transaction() as session:
+        session.clear()
+    assert client.post('/api/till/close', json={}).status_code == 401
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for the typo-tolerant trigram fallback in /api/products
+"""
+
+import pytest
+
+from app import db, catalog_cache, read_data_version, trigram_index, trigrams, CATALOG_LABELS, Product, ProductVariant
+
+
+@pytest.fixture
+def seed():
+    products = []
+    for name, category in [("DAP Fertilizer", "Fertilizer"), ("NPK 23:23:0", "Fertilizer"),
+                           ("Pesticide Spray", "Pesticide"), ("Maize Seed H614", "Seed")]:
+        product = Product(name=name, category=category, description="Test product")
+        product.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=1000.0, stock_level=10))
+        products.append(product)
+    return products
+
+
+def search(client, term):
+    return client.get('/api/products', query_string={'search': term}).get_json()
+
+
+def test_trigrams_are_padded_per_word():
+    assert trigrams("Dap") == {"  d", " da", "dap", "ap "}
+    assert trigrams("") == set()
+
+
+@pytest.mark.parametrize('term, expected', [
+    ("pestiside", "Pesticide Spray"),
+    ("dap fertiliser", "DAP Fertilizer"),
+    ("maze seed", "Maize Seed H614"),
+])
+def test_misspellings_fall_back_to_closest_names(client, term, expected):
+    data = search(client, term)
+    assert data['fuzzy'] is True
+    assert data['products'][0]['name'] == expected
+    assert data['next_cursor'] is None
+
+
+def test_exact_matches_skip_the_fallback(client):
+    data = search(client, 'npk 23')
+    assert data['fuzzy'] is False
+    assert [p['name'] for p in data['products']] == ["NPK 23:23:0"]
+
+
+def test_unrelated_terms_find_nothing(client):
+    data = search(client, 'wheelbarrow')
+    assert data['products'] == []
+
+
+def test_index_rebuilds_after_catalog_change(client):
+    assert search(client, 'hoe handel')['products'] == []
+    db.session.add(Product(name="Jembe Hoe Handle", category="Other", description="Farm tool"))
+    catalog_cache.bump()
+    db.session.commit()
+    assert search(client, 'hoe handel')['products'][0]['name'] == "Jembe Hoe Handle"
+    assert trigram_index.version == read_data_version(CATALOG_LABELS)
+
+
+def test_sales_do_not_rebuild_the_index(client):
+    search(client, 'pestiside')
+    version = trigram_index.version
+    variant = ProductVariant.query.first()
+    response = client.post('/api/manual-sale', json={
+        'total_cost': 1000.0, 'amount_paid': 1000.0, 'change_given': 0.0, 'payment_mode': 'Cash',
+        'items': [{'product_variant_id': variant.id, 'quantity': 1, 'price': 1000.0}]
+    })
+    assert response.status_code == 200
+    assert search(client, 'pestiside')['products'][0]['name'] == "Pesticide Spray"
+    assert trigram_index.version == version
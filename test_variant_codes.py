@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Tests for barcode/SKU lookups at /api/variants/by-code and the in-memory code map behind them
+"""
+
+from types import SimpleNamespace
+
+import pytest
+from wtforms.validators import ValidationError
+
+from app import (db, bump_data_version, parse_variant_codes, CATALOG_LABELS,
+                 Product, ProductVariant, ProductVariantAdminView, VariantCode)
+
+
+@pytest.fixture
+def seed():
+    dap = Product(name="DAP Fertilizer", category="Fertilizer", description="Phosphate fertilizer")
+    dap.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2800.0, stock_level=12))
+    dap.variants.append(ProductVariant(quantity_value=25.0, quantity_unit="kg", selling_price=1500.0, stock_level=4))
+    dap.variants[0].codes = [VariantCode(code='6161100000011'), VariantCode(code='DAP-50')]
+    dap.variants[1].codes = [VariantCode(code='6161100000028')]
+    return [dap]
+
+
+def scan(client, code):
+    return client.get(f'/api/variants/by-code/{code}')
+
+
+def test_scan_finds_the_variant(client):
+    response = scan(client, '6161100000011')
+    assert response.status_code == 200
+    variant = response.get_json()['variant']
+    assert (variant['product_name'], variant['quantity_value'], variant['selling_price']) == ("DAP Fertilizer", 50.0, 2800.0)
+    assert variant['available'] == 12
+    assert variant['code'] == '6161100000011'
+    # SKUs are matched regardless of case and stray whitespace
+    assert scan(client, ' dap-50 ').get_json()['variant']['id'] == variant['id']
+    assert scan(client, '0000').status_code == 404
+
+
+def test_batch_lookup(client):
+    body = client.post('/api/variants/by-code', json={'codes': ['6161100000028', 'nope', '6161100000011', 'DAP-50']}).get_json()
+    assert sorted(body['variants']) == ['6161100000011', '6161100000028', 'DAP-50']
+    assert body['variants']['6161100000028']['quantity_value'] == 25.0
+    assert body['missing'] == ['NOPE']
+
+    assert client.post('/api/variants/by-code', json={'codes': []}).status_code == 400
+    assert client.post('/api/variants/by-code', json={'codes': ['x'] * 201}).status_code == 400
+
+
+def test_scan_is_one_primary_key_read(client, count_statements):
+    scan(client, 'DAP-50')  # builds the map
+    with count_statements() as statements:
+        client.post('/api/variants/by-code', json={'codes': ['6161100000011', '6161100000028']})
+    # The shared label version, fresh price and stock, then held stock; none joins or matches text
+    assert len(statements) == 3
+    assert not any('JOIN' in statement.upper() or 'LIKE' in statement.upper() for statement in statements)
+
+
+def test_map_follows_committed_changes(client):
+    assert scan(client, 'DAP-50').status_code == 200
+    variant = db.session.get(VariantCode, 'DAP-50').variant
+    variant.codes = [code for code in variant.codes if code.code != 'DAP-50'] + [VariantCode(code='DAP-50KG')]
+    variant.product.name = "DAP Planting Fertilizer"
+    variant.selling_price = 2900.0
+    db.session.commit()
+
+    assert scan(client, 'DAP-50').status_code == 404
+    renamed = scan(client, 'DAP-50KG').get_json()['variant']
+    assert renamed['product_name'] == "DAP Planting Fertilizer"
+    assert renamed['selling_price'] == 2900.0
+    assert scan(client, '6161100000028').get_json()['variant']['product_name'] == "DAP Planting Fertilizer"
+
+    db.session.delete(variant)
+    db.session.commit()
+    assert scan(client, '6161100000011').status_code == 404
+    assert VariantCode.query.count() == 1
+
+
+def test_map_follows_other_processes(client):
+    assert scan(client, 'DAP-50').status_code == 200
+    variant_id = db.session.get(VariantCode, 'DAP-50').product_variant_id
+    # What another worker's commit leaves behind: new rows and a new label version
+    with db.engine.begin() as connection:
+        connection.execute(VariantCode.__table__.delete().where(VariantCode.code == 'DAP-50'))
+        connection.execute(VariantCode.__table__.insert().values(code='DAP-50KG', product_variant_id=variant_id))
+        bump_data_version(connection, CATALOG_LABELS)
+    db.session.expire_all()
+
+    assert scan(client, 'DAP-50').status_code == 404
+    assert scan(client, 'DAP-50KG').get_json()['variant']['id'] == variant_id
+
+
+def test_parse_variant_codes():
+    assert parse_variant_codes(' 123, abc ,,123, ABC-1') == ['123', 'ABC', 'ABC-1']
+    assert parse_variant_codes(None) == []
+
+
+def test_admin_form_sets_codes(client):
+    view = ProductVariantAdminView(ProductVariant, db.session)
+    variant = db.session.get(VariantCode, 'DAP-50').variant
+    form = SimpleNamespace(barcodes=SimpleNamespace(data='dap-50, 6161100000099'))
+    view.on_model_change(form, variant, False)
+    db.session.commit()
+    assert sorted(code.code for code in variant.codes) == ['6161100000099', 'DAP-50']
+    assert scan(client, '6161100000099').get_json()['variant']['id'] == variant.id
+
+    # A code already on another variant is refused
+    form.barcodes.data = '6161100000028'
+    with pytest.raises(ValidationError):
+        view.on_model_change(form, variant, False)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Tests for the /api/variants/suggest typeahead and its in-memory prefix index
+"""
+
+import time
+
+import pytest
+
+from app import db, bump_data_version, read_data_version, variant_suggest_index, CATALOG_LABELS, Product, ProductVariant
+
+
+@pytest.fixture
+def seed():
+    dap = Product(name="DAP Fertilizer", category="Fertilizer", description="Phosphate fertilizer")
+    dap.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2800.0, stock_level=12, supplier="Yara"))
+    dap.variants.append(ProductVariant(quantity_value=25.0, quantity_unit="kg", selling_price=1500.0, stock_level=4, supplier="Yara"))
+    can = Product(name="CAN Top Dressing", category="Fertilizer", description="Nitrogen fertilizer")
+    can.variants.append(ProductVariant(quantity_value=50.0, quantity_unit="kg", selling_price=2500.0, stock_level=9, supplier="Mea Ltd"))
+    sevin = Product(name="Sevin Dust", category="Pesticide", description="Insecticide")
+    sevin.variants.append(ProductVariant(quantity_value=1.0, quantity_unit="l", selling_price=800.0, stock_level=30, supplier="Bayer"))
+    return [dap, can, sevin]
+
+
+def suggest(client, q, **params):
+    params['q'] = q
+    return client.get('/api/variants/suggest', query_string=params).get_json()['suggestions']
+
+
+def test_prefix_matches_name_unit_and_supplier(client):
+    assert [(s['product_name'], s['quantity_value']) for s in suggest(client, 'da')] == [
+        ("DAP Fertilizer", 25.0), ("DAP Fertilizer", 50.0)
+    ]
+    assert [s['product_name'] for s in suggest(client, 'bay')] == ["Sevin Dust"]
+    assert [s['product_name'] for s in suggest(client, 'fert 50')] == ["DAP Fertilizer"]
+    assert [s['product_name'] for s in suggest(client, '50kg')] == ["CAN Top Dressing", "DAP Fertilizer"]
+    assert suggest(client, 'zzz') == []
+    assert suggest(client, '') == []
+
+
+def test_limit_and_fresh_stock(client):
+    assert len(suggest(client, 'kg', limit=2)) == 2
+    variant = ProductVariant.query.filter_by(stock_level=4).one()
+    variant.stock_level = 3
+    db.session.commit()
+    assert [s['stock_level'] for s in suggest(client, 'dap 25')] == [3]
+
+
+def test_index_follows_committed_changes(client):
+    assert suggest(client, 'sev')
+
+    sevin = Product.query.filter_by(name="Sevin Dust").one()
+    sevin.name = "Duduthrin"
+    sevin.variants.append(ProductVariant(quantity_value=500.0, quantity_unit="ml", selling_price=450.0, stock_level=10, supplier="Twiga"))
+    db.session.commit()
+    assert suggest(client, 'sev') == []
+    assert [s['quantity_unit'] for s in suggest(client, 'dudu')] == ["l", "ml"]
+    assert [s['product_name'] for s in suggest(client, 'twi')] == ["Duduthrin"]
+
+    db.session.delete(sevin)
+    db.session.commit()
+    assert suggest(client, 'dudu') == []
+    assert suggest(client, 'twi') == []
+
+
+def test_index_follows_other_processes(client):
+    assert [s['product_name'] for s in suggest(client, 'can')] == ["CAN Top Dressing"]
+    # What another worker's commit leaves behind: a renamed row and a new label version
+    with db.engine.begin() as connection:
+        connection.execute(Product.__table__.update().where(Product.name == "CAN Top Dressing").values(name="Urea"))
+        bump_data_version(connection, CATALOG_LABELS)
+    db.session.expire_all()
+    assert suggest(client, 'can') == []
+    assert [s['product_name'] for s in suggest(client, 'urea')] == ["Urea"]
+
+
+def test_stock_changes_keep_the_label_version(client):
+    version = read_data_version(CATALOG_LABELS)
+    variant = ProductVariant.query.filter_by(stock_level=4).one()
+    variant.stock_level = 3
+    variant.selling_price = 1600.0
+    db.session.commit()
+    assert read_data_version(CATALOG_LABELS) == version
+    variant.supplier = "Mea Ltd"
+    db.session.commit()
+    assert read_data_version(CATALOG_LABELS) == version + 1
+
+
+def test_rolled_back_changes_are_ignored(client):
+    can = Product.query.filter_by(name="CAN Top Dressing").one()
+    can.name = "Urea"
+    db.session.flush()
+    db.session.rollback()
+    assert suggest(client, 'urea') == []
+    assert [s['product_name'] for s in suggest(client, 'can')] == ["CAN Top Dressing"]
+
+
+def test_lookup_is_sub_millisecond(client):
+    for i in range(300):
+        product = Product(name=f"Maize Seed H{i:03d}", category="Seed", description="Hybrid maize")
+        for value in (1.0, 2.0, 10.0):
+            product.variants.append(ProductVariant(quantity_value=value, quantity_unit="kg", selling_price=300.0 * value, stock_level=20, supplier=f"Supplier {i % 7}"))
+        db.session.add(product)
+    db.session.commit()
+    variant_suggest_index.suggest('warm up')
+
+    queries = ['ma', 'maize h1', 'seed 10', 'supp', 'h29', 'kg']
+    start = time.perf_counter()
+    for _ in range(50):
+        for q in queries:
+            variant_suggest_index.suggest(q)
+    per_lookup = (time.perf_counter() - start) / (50 * len(queries))
+    assert per_lookup < 0.001